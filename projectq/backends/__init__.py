@@ -25,6 +25,7 @@ This includes:
   circuit)
 * an interface to the IBM Quantum Experience chip (and simulator).
 * an interface to the AQT trapped ion system (and simulator).
+* an adapter which executes the commands of a back-end on a worker thread
 """
 from ._printer import CommandPrinter
 from ._circuits import CircuitDrawer, CircuitDrawerMatplotlib
@@ -32,3 +33,4 @@ from ._sim import Simulator, ClassicalSimulator
 from ._resource import ResourceCounter
 from ._ibm import IBMBackend
 from ._aqt import AQTBackend
+from ._async import AsyncBackend
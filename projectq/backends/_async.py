@@ -0,0 +1,159 @@
+#   Copyright 2017 ProjectQ-Framework (www.projectq.ch)
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Contains the AsyncBackend, which executes the commands of a back-end on a
+worker thread.
+"""
+
+try:
+    import queue
+except ImportError:  # pragma: no cover
+    import Queue as queue
+import threading
+
+from projectq.cengines import BasicEngine
+from projectq.ops import FlushGate
+
+
+class AsyncBackend(BasicEngine):
+    """
+    Back-end adapter which executes the commands on a dedicated thread.
+
+    Commands received from the compiler engines are queued and handed to the
+    wrapped back-end on a worker thread, such that the construction and
+    compilation of the circuit can continue while the back-end executes
+    previous commands (e.g., while the C++ simulator, which releases the GIL,
+    applies gates to a large state vector).
+
+    The AsyncBackend only waits for the worker thread:
+
+    * when a FlushGate is received (i.e., on eng.flush()),
+    * when a measurement result is requested (see
+      MainEngine.get_measurement_result), and
+    * when an attribute of the wrapped back-end is accessed through the
+      AsyncBackend (e.g., eng.backend.cheat()).
+
+    Exceptions raised by the back-end are re-raised in the main thread the
+    next time the AsyncBackend waits for the worker thread.
+
+    Example:
+        .. code-block:: python
+
+            eng = MainEngine(AsyncBackend(Simulator()))
+            qureg = eng.allocate_qureg(25)
+            ...
+            All(Measure) | qureg  # does not wait
+            print(int(qureg[0]))  # waits for the measurement
+    """
+    def __init__(self, backend):
+        """
+        Initialize the AsyncBackend.
+
+        Args:
+            backend (BasicEngine): Back-end which executes the commands.
+        """
+        self._backend = backend
+        BasicEngine.__init__(self)
+        self._queue = queue.Queue()
+        self._thread = None
+        self._exception = None
+
+    @property
+    def backend(self):
+        """ The wrapped back-end. """
+        return self._backend
+
+    @property
+    def main_engine(self):
+        return self._backend.main_engine
+
+    @main_engine.setter
+    def main_engine(self, engine):
+        self._backend.main_engine = engine
+
+    @property
+    def is_last_engine(self):
+        return self._backend.is_last_engine
+
+    @is_last_engine.setter
+    def is_last_engine(self, value):
+        self._backend.is_last_engine = value
+
+    def __getattr__(self, name):
+        """
+        Access attributes of the wrapped back-end, after waiting for all
+        queued commands to be executed.
+        """
+        if name.startswith('_'):
+            raise AttributeError(name)
+        self.synchronize()
+        return getattr(self._backend, name)
+
+    def is_available(self, cmd):
+        """
+        Return whether the wrapped back-end supports the command.
+        """
+        return self._backend.is_available(cmd)
+
+    def _worker(self):
+        """
+        Execute the queued command lists using the wrapped back-end.
+        """
+        while True:
+            command_list = self._queue.get()
+            try:
+                if self._exception is None:
+                    self._backend.receive(command_list)
+            except Exception as exception:
+                # skip all further commands until the error is re-raised
+                self._exception = exception
+            finally:
+                self._queue.task_done()
+
+    def synchronize(self):
+        """
+        Wait until all queued commands have been executed.
+
+        Raises:
+            The first exception raised by the wrapped back-end (if any).
+        """
+        if self._thread is not None:
+            self._queue.join()
+        if self._exception is not None:
+            exception, self._exception = self._exception, None
+            raise exception
+
+    def synchronize_qubits(self, qubit_ids):
+        """
+        Wait until all queued commands have been executed (see
+        BasicEngine.synchronize_qubits).
+        """
+        self.synchronize()
+
+    def receive(self, command_list):
+        """
+        Queue the commands for execution on the worker thread. If a FlushGate
+        is among them, wait until all commands have been executed.
+
+        Args:
+            command_list (list<Command>): List of commands to execute.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._worker)
+            self._thread.daemon = True
+            self._thread.start()
+        self._queue.put(command_list)
+        if any(isinstance(cmd.gate, FlushGate) for cmd in command_list):
+            self.synchronize()
@@ -0,0 +1,93 @@
+#   Copyright 2017 ProjectQ-Framework (www.projectq.ch)
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Tests for projectq.backends._async.py.
+"""
+
+import threading
+
+import numpy as np
+import pytest
+
+from projectq import MainEngine
+from projectq.backends import Simulator
+from projectq.cengines import DummyEngine
+from projectq.ops import All, CNOT, H, Measure, Rx, X
+
+from projectq.backends import _async
+
+
+def test_async_backend_simulation():
+    def circuit(eng):
+        qureg = eng.allocate_qureg(6)
+        for i in range(50):
+            H | qureg[i % 6]
+            Rx(0.1 * i) | qureg[(i + 1) % 6]
+            CNOT | (qureg[i % 6], qureg[(i + 2) % 6])
+        Measure | qureg[0]
+        result = int(qureg[0])  # does not require a flush
+        eng.flush()
+        state = np.array(eng.backend.cheat()[1])
+        All(Measure) | qureg
+        return result, state
+
+    sync_eng = MainEngine(Simulator(rnd_seed=5), [])
+    async_eng = MainEngine(_async.AsyncBackend(Simulator(rnd_seed=5)), [])
+    result, state = circuit(sync_eng)
+    async_result, async_state = circuit(async_eng)
+    assert result == async_result
+    assert np.allclose(state, async_state)
+
+
+def test_async_backend_runs_on_worker_thread():
+    threads = []
+
+    class ThreadRecorder(DummyEngine):
+        def receive(self, command_list):
+            threads.append(threading.current_thread())
+            DummyEngine.receive(self, command_list)
+
+    backend = ThreadRecorder(save_commands=True)
+    async_backend = _async.AsyncBackend(backend)
+    eng = MainEngine(async_backend, [])
+    assert async_backend.backend is backend
+    assert backend.main_engine is eng
+    assert backend.is_last_engine
+    qubit = eng.allocate_qubit()
+    X | qubit
+    eng.flush()
+    assert len(backend.received_commands) == 3
+    assert async_backend.received_commands is backend.received_commands
+    assert all(thread is not threading.current_thread()
+               for thread in threads)
+    assert async_backend.is_available(backend.received_commands[1])
+    with pytest.raises(AttributeError):
+        async_backend._does_not_exist
+
+
+def test_async_backend_exception():
+    class FailingEngine(DummyEngine):
+        def receive(self, command_list):
+            for cmd in command_list:
+                if cmd.gate == X:
+                    raise RuntimeError("X failed")
+
+    eng = MainEngine(_async.AsyncBackend(FailingEngine()), [], verbose=True)
+    qubit = eng.allocate_qubit()
+    X | qubit  # does not raise yet
+    with pytest.raises(RuntimeError):
+        eng.flush()
+    # the error is only raised once
+    eng.flush()
@@ -178,8 +178,8 @@ class CircuitDrawerMatplotlib(BasicEngine):
             if not isinstance(cmd.gate, FlushGate):
                 self._process(cmd)
 
-            if not self.is_last_engine:
-                self.send([cmd])
+        if not self.is_last_engine:
+            self.send(command_list)
 
     def draw(self, qubit_labels=None, drawing_order=None, **kwargs):
         """
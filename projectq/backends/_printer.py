@@ -119,6 +119,6 @@ class CommandPrinter(BasicEngine):
         for cmd in command_list:
             if not cmd.gate == FlushGate():
                 self._print_cmd(cmd)
-            # (try to) send on
-            if not self.is_last_engine:
-                self.send([cmd])
+        # (try to) send on
+        if not self.is_last_engine:
+            self.send(command_list)
@@ -181,6 +181,6 @@ class ResourceCounter(BasicEngine):
             if not cmd.gate == FlushGate():
                 self._add_cmd(cmd)
 
-            # (try to) send on
-            if not self.is_last_engine:
-                self.send([cmd])
+        # (try to) send on
+        if not self.is_last_engine:
+            self.send(command_list)
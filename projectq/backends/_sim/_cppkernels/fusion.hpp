@@ -22,13 +22,14 @@
 #include <iostream>
 #include "intrin/alignedallocator.hpp"
 
-class Item{
+template <class T>
+class BasicItem{
 public:
     using Index = unsigned;
     using IndexVector = std::vector<Index>;
-    using Complex = std::complex<double>;
+    using Complex = std::complex<T>;
     using Matrix = std::vector<std::vector<Complex, aligned_allocator<Complex, 64>>>;
-    Item(Matrix mat, IndexVector idx) : mat_(mat), idx_(idx) {}
+    BasicItem(Matrix mat, IndexVector idx) : mat_(mat), idx_(idx) {}
     Matrix& get_matrix() { return mat_; }
     IndexVector& get_indices() { return idx_; }
 private:
@@ -36,75 +37,165 @@ private:
     IndexVector idx_;
 };
 
-class Fusion{
+// Keeps track of the qubits a fused gate acts on, without building any
+// matrices. Control qubits which are shared by all fused gates remain
+// controls, all other control qubits become part of the fused gate.
+class FusionShape{
 public:
     using Index = unsigned;
     using IndexSet = std::set<Index>;
     using IndexVector = std::vector<Index>;
-    using Complex = std::complex<double>;
-    using Matrix = std::vector<std::vector<Complex, aligned_allocator<Complex, 64>>>;
-    using ItemVector = std::vector<Item>;
 
-    unsigned num_qubits() {
+    unsigned num_qubits() const {
         return set_.size();
     }
 
+    // number of qubits after inserting a gate (without inserting it)
+    unsigned num_qubits_with(IndexVector const& index_list, IndexVector const& ctrl_list) const {
+        if (empty_)
+            return IndexSet(index_list.begin(), index_list.end()).size();
+        IndexSet set = set_;
+        set.insert(index_list.begin(), index_list.end());
+        for (auto ctrl : ctrl_list)
+            if (ctrl_set_.count(ctrl) == 0)
+                set.insert(ctrl);
+        for (auto ctrl : ctrl_set_)
+            if (std::find(ctrl_list.begin(), ctrl_list.end(), ctrl) == ctrl_list.end())
+                set.insert(ctrl);
+        return set.size();
+    }
+
+    void insert(IndexVector const& index_list, IndexVector const& ctrl_list){
+        set_.insert(index_list.begin(), index_list.end());
+        if (empty_){
+            ctrl_set_.insert(ctrl_list.begin(), ctrl_list.end());
+            empty_ = false;
+            return;
+        }
+        for (auto ctrl : ctrl_list)
+            if (ctrl_set_.count(ctrl) == 0)
+                set_.insert(ctrl);
+        for (auto it = ctrl_set_.begin(); it != ctrl_set_.end();){
+            if (std::find(ctrl_list.begin(), ctrl_list.end(), *it) == ctrl_list.end()){
+                set_.insert(*it);
+                it = ctrl_set_.erase(it);
+            }
+            else
+                ++it;
+        }
+    }
+
+    IndexSet const& qubits() const { return set_; }
+    IndexSet const& controls() const { return ctrl_set_; }
+
+private:
+    IndexSet set_;
+    IndexSet ctrl_set_;
+    bool empty_ = true;
+};
+
+template <class T>
+class BasicFusion{
+public:
+    using Index = unsigned;
+    using IndexSet = std::set<Index>;
+    using IndexVector = std::vector<Index>;
+    using Complex = std::complex<T>;
+    using Row = std::vector<Complex, aligned_allocator<Complex, 64>>;
+    using Matrix = std::vector<Row>;
+    using ItemVector = std::vector<BasicItem<T>>;
+
+    unsigned num_qubits() const {
+        return shape_.num_qubits();
+    }
+
+    unsigned num_qubits_with(IndexVector const& index_list, IndexVector const& ctrl_list) const {
+        return shape_.num_qubits_with(index_list, ctrl_list);
+    }
+
     std::size_t size() const {
         return items_.size();
     }
 
     void insert(Matrix matrix, IndexVector index_list, IndexVector const& ctrl_list = {}){
-        for (auto idx : index_list)
-            set_.emplace(idx);
+        auto old_ctrls = shape_.controls();
+        bool first = items_.empty();
+        shape_.insert(index_list, ctrl_list);
 
-        handle_controls(matrix, index_list, ctrl_list);
-        Item item(matrix, index_list);
-        items_.push_back(item);
+        // controls of the new gate which are not shared by all other gates
+        // are incorporated into its matrix
+        if (!first){
+            IndexVector new_ctrls;
+            for (auto ctrl : ctrl_list)
+                if (old_ctrls.count(ctrl) == 0)
+                    new_ctrls.push_back(ctrl);
+            if (new_ctrls.size() > 0)
+                add_controls(matrix, index_list, new_ctrls);
+        }
+        // global controls which are no longer global (because the current
+        // command didn't have them) are incorporated into the old gates
+        IndexVector removed_ctrls;
+        for (auto ctrl : old_ctrls)
+            if (shape_.controls().count(ctrl) == 0)
+                removed_ctrls.push_back(ctrl);
+        if (removed_ctrls.size() > 0){
+            for (auto &item : items_)
+                add_controls(item.get_matrix(), item.get_indices(), removed_ctrls);
+        }
+        items_.emplace_back(std::move(matrix), std::move(index_list));
     }
 
     void perform_fusion(Matrix& fused_matrix, IndexVector& index_list, IndexVector& ctrl_list){
-        for (auto idx : set_)
+        for (auto idx : shape_.qubits())
             index_list.push_back(idx);
 
         std::size_t N = num_qubits();
-        fused_matrix = Matrix(1UL<<N, std::vector<Complex, aligned_allocator<Complex, 64>>(1UL<<N));
+        fused_matrix = Matrix(1UL<<N, Row(1UL<<N));
         auto &M = fused_matrix;
 
         for (std::size_t i = 0; i < (1UL<<N); ++i)
             M[i][i] = 1.;
 
+        Matrix oldrows;
         for (auto& item : items_){
             auto const& idx = item.get_indices();
-            IndexVector idx2mat(idx.size());
-            for (std::size_t i = 0; i < idx.size(); ++i)
-                idx2mat[i] = ((std::equal_range(index_list.begin(), index_list.end(), idx[i])).first - index_list.begin());
-
-            for (std::size_t k = 0; k < (1UL<<N); ++k){ // loop over big matrix columns
-                // check if column index satisfies control-mask
-                // if not: leave it unchanged
-                std::vector<Complex> oldcol(1UL<<N);
-                for (std::size_t i = 0; i < (1UL<<N); ++i)
-                    oldcol[i] = M[i][k];
-
-                for (std::size_t i = 0; i < (1UL<<N); ++i){
-                    std::size_t local_i = 0;
-                    for (std::size_t l = 0; l < idx.size(); ++l)
-                        local_i |= ((i >> idx2mat[l])&1UL)<<l;
-
-                    Complex res = 0.;
-                    for (std::size_t j = 0; j < (1UL<<idx.size()); ++j){
-                        std::size_t locidx = i;
-                        for (std::size_t l = 0; l < idx.size(); ++l)
-                            if (((j >> l)&1UL) != ((i >> idx2mat[l])&1UL))
-                                locidx ^= (1UL << idx2mat[l]);
-                        res += oldcol[locidx] * item.get_matrix()[local_i][j];
+            auto const& G = item.get_matrix();
+            std::size_t K = 1UL << idx.size();
+
+            // row offsets of the local (gate) indices within the fused matrix
+            std::vector<std::size_t> offset(K, 0);
+            std::size_t mask = 0;
+            for (std::size_t l = 0; l < idx.size(); ++l){
+                std::size_t pos = (std::equal_range(index_list.begin(), index_list.end(), idx[l])).first - index_list.begin();
+                mask |= 1UL << pos;
+                for (std::size_t j = 0; j < K; ++j)
+                    offset[j] |= ((j >> l) & 1UL) << pos;
+            }
+
+            // M <- G * M, one block of K rows at a time: each new row is a
+            // linear combination of the K old rows of the block
+            oldrows.resize(K);
+            for (std::size_t base = 0; base < (1UL<<N); ++base){
+                if ((base & mask) != 0)
+                    continue;
+                for (std::size_t j = 0; j < K; ++j)
+                    oldrows[j] = M[base + offset[j]];
+                for (std::size_t r = 0; r < K; ++r){
+                    auto &row = M[base + offset[r]];
+                    std::fill(row.begin(), row.end(), Complex(0.));
+                    for (std::size_t j = 0; j < K; ++j){
+                        auto const c = G[r][j];
+                        if (c == Complex(0.))
+                            continue;
+                        auto const& old = oldrows[j];
+                        for (std::size_t k = 0; k < row.size(); ++k)
+                            row[k] += c * old[k];
                     }
-                    M[i][k] = res;
                 }
             }
         }
-        ctrl_list.reserve(ctrl_set_.size());
-        for (auto ctrl : ctrl_set_)
+        ctrl_list.reserve(shape_.controls().size());
+        for (auto ctrl : shape_.controls())
             ctrl_list.push_back(ctrl);
     }
 
@@ -114,7 +205,7 @@ private:
         indexList.insert(indexList.end(), new_ctrls.begin(), new_ctrls.end());
 
         std::size_t F = (1UL << new_ctrls.size());
-        Matrix newmatrix(F*matrix.size(), std::vector<Complex, aligned_allocator<Complex,64>>(F*matrix.size(), 0.));
+        Matrix newmatrix(F*matrix.size(), Row(F*matrix.size(), 0.));
 
         std::size_t Offset = newmatrix.size()-matrix.size();
 
@@ -127,41 +218,11 @@ private:
         matrix = std::move(newmatrix);
     }
 
-    void handle_controls(Matrix &matrix, IndexVector &indexList, IndexVector const& ctrlList){
-        auto unhandled_ctrl = ctrl_set_; // will contain all ctrls that are not part of the new command
-        // --> need to be removed from the global mask and the controls incorporated into the old
-        // commands (the ones already in the list).
-
-        for (auto ctrlIdx : ctrlList){
-            if (ctrl_set_.count(ctrlIdx) == 0){ // need to either add it to the list or to the command
-                if (items_.size() > 0){ // add it to the command
-                    add_controls(matrix, indexList, {ctrlIdx});
-                    set_.insert(ctrlIdx);
-                }
-                else // add it to the list
-                    ctrl_set_.emplace(ctrlIdx);
-            }
-            else
-                unhandled_ctrl.erase(ctrlIdx);
-        }
-        // remove global controls which are no longer global (because the current command didn't
-        // have it)
-        if (unhandled_ctrl.size() > 0){
-            IndexVector new_ctrls;
-            new_ctrls.reserve(unhandled_ctrl.size());
-            for (auto idx : unhandled_ctrl){
-                new_ctrls.push_back(idx);
-                ctrl_set_.erase(idx);
-                set_.insert(idx);
-            }
-            for (auto &item : items_)
-                add_controls(item.get_matrix(), item.get_indices(), new_ctrls);
-        }
-    }
-
-    IndexSet set_;
+    FusionShape shape_;
     ItemVector items_;
-    IndexSet ctrl_set_;
 };
 
+using Item = BasicItem<double>;
+using Fusion = BasicFusion<double>;
+
 #endif
@@ -0,0 +1,124 @@
+// Copyright 2017 ProjectQ-Framework (www.projectq.ch)
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+// http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#ifndef HAMILTONIAN_HPP_
+#define HAMILTONIAN_HPP_
+
+#include <algorithm>
+#include <cmath>
+#include <complex>
+#include <map>
+#include <stdexcept>
+#include <vector>
+
+// Precompiled sum of Pauli strings H = sum_t c_t P_t. Each Pauli string acts
+// as P|i> = i^#Y (-1)^|i & sign| |i ^ flip>, where bit l of the masks refers
+// to the l-th qubit the Hamiltonian acts on. Terms with the same flip mask
+// are grouped, such that H can be applied with one pass over the state
+// vector per group.
+class Hamiltonian{
+public:
+    using Term = std::vector<std::pair<unsigned, char>>;
+    using TermsDict = std::vector<std::pair<Term, double>>;
+    using Complex = std::complex<double>;
+
+    struct Group{
+        std::size_t flip;
+        std::vector<std::size_t> signs;
+        std::vector<Complex> coefficients; // including the factor i^#Y
+    };
+
+    Hamiltonian(TermsDict const& td) : trace_(0.), norm_(0.), num_qubits_(0) {
+        std::map<std::size_t, Group> groups;
+        for (auto const& term : td){
+            if (term.first.size() == 0){
+                trace_ += term.second;
+                continue;
+            }
+            std::size_t flip = 0, sign = 0;
+            unsigned num_y = 0;
+            for (auto const& local_op : term.first){
+                if (local_op.first >= 64)
+                    throw(std::invalid_argument("Hamiltonian: Terms may act on at most 64 qubits."));
+                std::size_t bit = 1UL << local_op.first;
+                if (local_op.second != 'Z')
+                    flip |= bit;
+                if (local_op.second != 'X')
+                    sign |= bit;
+                if (local_op.second == 'Y')
+                    num_y++;
+                num_qubits_ = std::max(num_qubits_, local_op.first + 1);
+            }
+            Complex phase[] = {{1., 0.}, {0., 1.}, {-1., 0.}, {0., -1.}};
+            auto &group = groups[flip];
+            group.flip = flip;
+            group.signs.push_back(sign);
+            group.coefficients.push_back(term.second * phase[num_y % 4]);
+            norm_ += std::abs(term.second);
+        }
+        for (auto &group : groups)
+            groups_.push_back(std::move(group.second));
+    }
+
+    // sum of the coefficients of the identity terms
+    double trace() const { return trace_; }
+    // sum of the absolute values of all other coefficients, which is an
+    // upper bound on the spectral radius of H - trace
+    double norm() const { return norm_; }
+    unsigned num_qubits() const { return num_qubits_; }
+    std::vector<Group> const& groups() const { return groups_; }
+
+private:
+    double trace_, norm_;
+    unsigned num_qubits_;
+    std::vector<Group> groups_;
+};
+
+// Coefficients a_k = (2 - delta_k0) (-i)^k J_k(x) of the Chebyshev expansion
+//   exp(-i x y) = sum_k a_k T_k(y),  -1 <= y <= 1,
+// truncated once |a_k| < tolerance (for k > |x|). The Bessel functions J_k
+// are computed using Miller's backward recurrence.
+inline std::vector<std::complex<double>> chebyshev_coefficients(double x, double tolerance){
+    double ax = std::abs(x);
+    if (ax == 0.)
+        return {1.};
+    std::size_t n = static_cast<std::size_t>(ax + 15. * std::cbrt(ax) + 40.);
+    std::vector<double> J(n + 2, 0.);
+    J[n] = 1.e-300;
+    for (std::size_t k = n; k > 0; --k){
+        J[k - 1] = 2. * k / ax * J[k] - J[k + 1];
+        if (std::abs(J[k - 1]) > 1.e250){ // rescale to avoid overflows
+            for (std::size_t l = k - 1; l <= n; ++l)
+                J[l] *= 1.e-250;
+        }
+    }
+    // normalize using J_0 + 2 sum_k J_2k = 1
+    double sum = J[0];
+    for (std::size_t k = 2; k <= n; k += 2)
+        sum += 2. * J[k];
+
+    std::complex<double> const factor(0., x < 0 ? 1. : -1.); // (-i sgn(x))^k
+    std::vector<std::complex<double>> coefficients;
+    std::complex<double> power(1., 0.);
+    for (std::size_t k = 0; k <= n; ++k){
+        double J_k = J[k] / sum;
+        if (k > ax && std::abs(J_k) < tolerance)
+            break;
+        coefficients.push_back((k == 0 ? 1. : 2.) * J_k * power);
+        power *= factor;
+    }
+    return coefficients;
+}
+
+#endif
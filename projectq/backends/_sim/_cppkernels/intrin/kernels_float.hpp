@@ -0,0 +1,106 @@
+// Copyright 2017 ProjectQ-Framework (www.projectq.ch)
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+// http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#ifndef KERNELS_FLOAT_HPP_
+#define KERNELS_FLOAT_HPP_
+
+#include <immintrin.h>
+#include <algorithm>
+#include <complex>
+#include <cstdlib>
+
+// Single precision kernels for gates on Q >= 2 qubits. One AVX register holds
+// 4 complex numbers, i.e., 4 consecutive rows of one column of the gate
+// matrix, which are multiplied by the (broadcast) amplitude of that column.
+// The real and imaginary parts of the amplitudes are accumulated separately
+// and combined using a single addsub per 4 rows:
+//   (a + ib) * (c + id) = (ac - bd) + i(ad + bc)
+namespace intrin_float {
+
+template <unsigned Q, class V>
+inline void kernel_core(V &psi, std::size_t I, std::size_t const* offsets,
+                        __m256 const (*mm)[1UL << Q], __m256 const (*mms)[1UL << Q])
+{
+    constexpr std::size_t K = 1UL << Q;
+    __m256 re[K], im[K];
+    for (std::size_t j = 0; j < K; ++j){
+        auto p = reinterpret_cast<float const*>(&psi[I + offsets[j]]);
+        re[j] = _mm256_set1_ps(p[0]);
+        im[j] = _mm256_set1_ps(p[1]);
+    }
+    for (std::size_t r = 0; r < K / 4; ++r){
+        __m256 a = _mm256_mul_ps(re[0], mm[r][0]);
+        __m256 b = _mm256_mul_ps(im[0], mms[r][0]);
+        for (std::size_t j = 1; j < K; ++j){
+            a = _mm256_add_ps(a, _mm256_mul_ps(re[j], mm[r][j]));
+            b = _mm256_add_ps(b, _mm256_mul_ps(im[j], mms[r][j]));
+        }
+        __m256 res = _mm256_addsub_ps(a, b);
+        __m128 lo = _mm256_castps256_ps128(res);
+        __m128 hi = _mm256_extractf128_ps(res, 1);
+        _mm_storel_pi(reinterpret_cast<__m64*>(&psi[I + offsets[4 * r]]), lo);
+        _mm_storeh_pi(reinterpret_cast<__m64*>(&psi[I + offsets[4 * r + 1]]), lo);
+        _mm_storel_pi(reinterpret_cast<__m64*>(&psi[I + offsets[4 * r + 2]]), hi);
+        _mm_storeh_pi(reinterpret_cast<__m64*>(&psi[I + offsets[4 * r + 3]]), hi);
+    }
+}
+
+// bit indices id[.] are given from low to high, i.e., bit l of the row/column
+// index of the matrix m corresponds to qubit ids[l]
+template <unsigned Q, class V, class M>
+void kernel(V &psi, unsigned const* ids, M const& m, std::size_t ctrlmask)
+{
+    static_assert(Q >= 2, "The single precision kernels act on at least 2 qubits.");
+    constexpr std::size_t K = 1UL << Q;
+
+    // column j of rows 4r, ..., 4r+3 (and with real/imaginary parts swapped)
+    __m256 mm[K / 4][K], mms[K / 4][K];
+    for (std::size_t r = 0; r < K / 4; ++r){
+        for (std::size_t j = 0; j < K; ++j){
+            auto const& m0 = m[4 * r][j];
+            auto const& m1 = m[4 * r + 1][j];
+            auto const& m2 = m[4 * r + 2][j];
+            auto const& m3 = m[4 * r + 3][j];
+            mm[r][j] = _mm256_setr_ps(m0.real(), m0.imag(), m1.real(), m1.imag(),
+                                      m2.real(), m2.imag(), m3.real(), m3.imag());
+            mms[r][j] = _mm256_setr_ps(m0.imag(), m0.real(), m1.imag(), m1.real(),
+                                       m2.imag(), m2.real(), m3.imag(), m3.real());
+        }
+    }
+
+    std::size_t offsets[K];
+    for (std::size_t j = 0; j < K; ++j){
+        offsets[j] = 0;
+        for (unsigned l = 0; l < Q; ++l)
+            offsets[j] |= ((j >> l) & 1UL) << ids[l];
+    }
+    unsigned positions[Q];
+    std::copy(ids, ids + Q, positions);
+    std::sort(positions, positions + Q);
+
+    std::size_t num_bases = psi.size() >> Q;
+    #pragma omp for schedule(static)
+    for (std::size_t c = 0; c < num_bases; ++c){
+        // insert a 0 at each of the (sorted) positions
+        std::size_t I = c;
+        for (auto pos : positions)
+            I = ((I >> pos) << (pos + 1)) | (I & ((1UL << pos) - 1));
+        if ((I & ctrlmask) == ctrlmask)
+            kernel_core<Q>(psi, I, offsets, mm, mms);
+    }
+}
+
+} // namespace intrin_float
+
+#endif
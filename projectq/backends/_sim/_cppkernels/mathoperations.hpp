@@ -0,0 +1,102 @@
+// Copyright 2017 ProjectQ-Framework (www.projectq.ch)
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+// http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+
+#ifndef MATHOPERATIONS_HPP_
+#define MATHOPERATIONS_HPP_
+
+#include <algorithm>
+#include <stdexcept>
+#include <string>
+#include <vector>
+
+// Declarative description of a classical reversible function acting on the
+// values x[0], x[1], ... of the registers a math gate acts on (see
+// BasicMathGate.get_math_operations). A list of such operations can be
+// evaluated without calling back into Python.
+class MathOperation{
+public:
+    using Value = long long;
+
+    MathOperation(std::string const& name, std::vector<Value> const& args)
+    : constant_(0), modulus_(1) {
+        std::size_t num_registers, num_constants;
+        if (name == "add"){ kind_ = Add; num_registers = 2; num_constants = 0; }
+        else if (name == "sub"){ kind_ = Sub; num_registers = 2; num_constants = 0; }
+        else if (name == "add_mod"){ kind_ = AddMod; num_registers = 2; num_constants = 1; }
+        else if (name == "multiply_add"){ kind_ = MultiplyAdd; num_registers = 3; num_constants = 0; }
+        else if (name == "less_than"){ kind_ = LessThan; num_registers = 3; num_constants = 0; }
+        else if (name == "add_constant"){ kind_ = AddConstant; num_registers = 1; num_constants = 1; }
+        else if (name == "add_constant_mod"){ kind_ = AddConstantMod; num_registers = 1; num_constants = 2; }
+        else if (name == "multiply_constant_mod"){ kind_ = MultiplyConstantMod; num_registers = 1; num_constants = 2; }
+        else
+            throw(std::invalid_argument("MathOperation: Unknown operation '" + name + "'."));
+        if (args.size() != num_registers + num_constants)
+            throw(std::invalid_argument("MathOperation: Wrong number of arguments for '" + name + "'."));
+        for (std::size_t i = 0; i < num_registers; ++i){
+            if (args[i] < 0)
+                throw(std::invalid_argument("MathOperation: Invalid register index."));
+            registers_[i] = static_cast<unsigned>(args[i]);
+        }
+        if (num_constants == 1 && kind_ == AddMod)
+            modulus_ = args[num_registers];
+        else if (num_constants >= 1)
+            constant_ = args[num_registers];
+        if (num_constants == 2)
+            modulus_ = args[num_registers + 1];
+        if (modulus_ <= 0)
+            throw(std::invalid_argument("MathOperation: The modulus has to be positive."));
+    }
+
+    // largest register index this operation refers to
+    unsigned max_register() const {
+        unsigned n = registers_[0];
+        if (kind_ == Add || kind_ == Sub || kind_ == AddMod)
+            n = std::max(n, registers_[1]);
+        if (kind_ == MultiplyAdd || kind_ == LessThan)
+            n = std::max(n, std::max(registers_[1], registers_[2]));
+        return n;
+    }
+
+    template <class V>
+    void operator()(V &x) const {
+        auto &t = x[registers_[0]];
+        switch (kind_){
+            case Add: t += x[registers_[1]]; break;
+            case Sub: t -= x[registers_[1]]; break;
+            case AddMod: t = mod(t + x[registers_[1]]); break;
+            case MultiplyAdd: t += x[registers_[1]] * x[registers_[2]]; break;
+            case LessThan: t ^= Value(x[registers_[1]] < x[registers_[2]]); break;
+            case AddConstant: t += constant_; break;
+            case AddConstantMod: t = mod(t + constant_); break;
+            case MultiplyConstantMod: t = mod(t * constant_); break;
+        }
+    }
+
+private:
+    enum Kind{Add, Sub, AddMod, MultiplyAdd, LessThan, AddConstant,
+              AddConstantMod, MultiplyConstantMod};
+
+    // non-negative remainder (as in Python)
+    Value mod(Value v) const {
+        v %= modulus_;
+        return v < 0 ? v + modulus_ : v;
+    }
+
+    Kind kind_;
+    unsigned registers_[3];
+    Value constant_, modulus_;
+};
+
+#endif
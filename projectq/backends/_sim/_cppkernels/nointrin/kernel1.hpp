@@ -15,7 +15,7 @@
 template <class V, class M>
 inline void kernel_core(V &psi, std::size_t I, std::size_t d0, M const& m)
 {
-    std::complex<double> v[2];
+    typename V::value_type v[2];
     v[0] = psi[I];
     v[1] = psi[I + d0];
 
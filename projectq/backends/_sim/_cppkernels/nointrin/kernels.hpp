@@ -20,6 +20,10 @@
 #include <algorithm>
 #include "../intrin/alignedallocator.hpp"
 
+// The generic kernels live in their own namespace, such that they can be
+// used alongside the intrinsics kernels (e.g., for single precision).
+namespace nointrin {
+
 template <class T>
 inline T add(T a, T b){ return a+b; }
 
@@ -38,3 +42,5 @@ inline T mul(T a, T b){ return a*b; }
 #include "kernel3.hpp"
 #include "kernel4.hpp"
 #include "kernel5.hpp"
+
+} // namespace nointrin
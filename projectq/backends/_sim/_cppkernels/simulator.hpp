@@ -18,25 +18,89 @@
 #include <vector>
 #include <complex>
 
-#if defined(NOINTRIN) || !defined(INTRIN)
 #include "nointrin/kernels.hpp"
-#else
+#if !defined(NOINTRIN) && defined(INTRIN)
 #include "intrin/kernels.hpp"
+#include "intrin/kernels_float.hpp"
 #endif
 
 #include "intrin/alignedallocator.hpp"
 #include "fusion.hpp"
+#include "hamiltonian.hpp"
+#include "mathoperations.hpp"
 #include <map>
 #include <cassert>
 #include <algorithm>
 #include <tuple>
 #include <random>
 #include <functional>
+#include <limits>
+#include <stdexcept>
+#include <utility>
+#include <sstream>
+#include <string>
+#include <bitset>
+
+// Dispatches to the gate kernels for the floating point type T: there are
+// intrinsics kernels for double and single precision, all other types (and
+// builds without intrinsics) use the generic kernels.
+template <class T>
+struct Kernels{
+    template <class... Args>
+    static void apply(Args&&... args){
+        nointrin::kernel(std::forward<Args>(args)...);
+    }
+};
+
+#if !defined(NOINTRIN) && defined(INTRIN)
+template <>
+struct Kernels<double>{
+    template <class... Args>
+    static void apply(Args&&... args){
+        ::kernel(std::forward<Args>(args)...);
+    }
+};
+
+template <>
+struct Kernels<float>{
+    // single-qubit gates are bound by memory bandwidth
+    template <class V, class M>
+    static void apply(V &psi, unsigned id0, M const& m, std::size_t ctrlmask){
+        nointrin::kernel(psi, id0, m, ctrlmask);
+    }
+
+    // ids are given from high to low (as for the double precision kernels)
+    template <class V, class M>
+    static void apply(V &psi, unsigned id1, unsigned id0, M const& m, std::size_t ctrlmask){
+        unsigned ids[] = {id0, id1};
+        intrin_float::kernel<2>(psi, ids, m, ctrlmask);
+    }
+
+    template <class V, class M>
+    static void apply(V &psi, unsigned id2, unsigned id1, unsigned id0, M const& m, std::size_t ctrlmask){
+        unsigned ids[] = {id0, id1, id2};
+        intrin_float::kernel<3>(psi, ids, m, ctrlmask);
+    }
+
+    template <class V, class M>
+    static void apply(V &psi, unsigned id3, unsigned id2, unsigned id1, unsigned id0, M const& m, std::size_t ctrlmask){
+        unsigned ids[] = {id0, id1, id2, id3};
+        intrin_float::kernel<4>(psi, ids, m, ctrlmask);
+    }
+
+    template <class V, class M>
+    static void apply(V &psi, unsigned id4, unsigned id3, unsigned id2, unsigned id1, unsigned id0, M const& m, std::size_t ctrlmask){
+        unsigned ids[] = {id0, id1, id2, id3, id4};
+        intrin_float::kernel<5>(psi, ids, m, ctrlmask);
+    }
+};
+#endif
 
 
-class Simulator{
+template <class T>
+class BasicSimulator{
 public:
-    using calc_type = double;
+    using calc_type = T;
     using complex_type = std::complex<calc_type>;
     using StateVector = std::vector<complex_type, aligned_allocator<complex_type,512>>;
     using Map = std::map<unsigned, unsigned>;
@@ -44,9 +108,14 @@ public:
     using Term = std::vector<std::pair<unsigned, char>>;
     using TermsDict = std::vector<std::pair<Term, calc_type>>;
     using ComplexTermsDict = std::vector<std::pair<Term, complex_type>>;
+    using Fusion = BasicFusion<calc_type>;
+    using Matrix = typename Fusion::Matrix;
+    using IndexVector = typename Fusion::IndexVector;
+    using MathValue = MathOperation::Value;
 
-    Simulator(unsigned seed = 1) : N_(0), vec_(1,0.), fusion_qubits_min_(4),
-                                   fusion_qubits_max_(5), rnd_eng_(seed) {
+    BasicSimulator(unsigned seed = 1) : N_(0), vec_(1,0.), fusion_qubits_min_(4),
+                                        fusion_qubits_max_(5), fusion_lookahead_(0),
+                                        rnd_eng_(seed) {
         vec_[0]=1.; // all-zero initial state
         std::uniform_real_distribution<double> dist(0., 1.);
         rng_ = std::bind(dist, std::ref(rnd_eng_));
@@ -149,8 +218,8 @@ public:
         for (unsigned i = 0; i < ids.size(); ++i)
             positions[i] = map_[ids[i]];
 
-        calc_type P = 0.;
-        calc_type rnd = rng_();
+        double P = 0.;
+        double rnd = rng_();
 
         // pick entry at random with probability |entry|^2
         std::size_t pick = 0;
@@ -191,6 +260,39 @@ public:
         return ret;
     }
 
+    std::vector<std::size_t> sample_qubits(std::vector<unsigned> const& ids, std::size_t shots){
+        run();
+        if (!check_ids(ids))
+            throw(std::runtime_error("sample(): Unknown qubit id(s) provided. Try calling eng.flush() before invoking this function."));
+
+        std::vector<unsigned> positions(ids.size());
+        for (unsigned i = 0; i < ids.size(); ++i)
+            positions[i] = map_[ids[i]];
+
+        // sorted uniforms allow picking all samples in a single pass over
+        // the cumulative distribution
+        std::vector<double> rnds(shots);
+        for (std::size_t k = 0; k < shots; ++k)
+            rnds[k] = rng_();
+        std::sort(rnds.begin(), rnds.end());
+
+        std::vector<std::size_t> res(shots);
+        double P = 0.;
+        std::size_t pick = 0;
+        for (std::size_t k = 0; k < shots; ++k){
+            while (P < rnds[k] && pick < vec_.size())
+                P += std::norm(vec_[pick++]);
+            std::size_t i = (pick > 0) ? pick - 1 : 0;
+            std::size_t outcome = 0;
+            for (unsigned j = 0; j < positions.size(); ++j)
+                outcome |= ((i >> positions[j]) & 1UL) << j;
+            res[k] = outcome;
+        }
+        // undo the ordering introduced by sorting the random numbers
+        std::shuffle(res.begin(), res.end(), rnd_eng_);
+        return res;
+    }
+
     void deallocate_qubit(unsigned id){
         run();
         assert(map_.count(id) == 1);
@@ -201,29 +303,135 @@ public:
         collapse_vector(id, value, true);
     }
 
+    void set_fusion_policy(unsigned min_qubits, unsigned max_qubits, unsigned lookahead){
+        if (max_qubits < 1 || max_qubits > 5)
+            throw(std::invalid_argument("set_fusion_policy(): max_qubits must be between 1 and 5."));
+        if (min_qubits > max_qubits)
+            throw(std::invalid_argument("set_fusion_policy(): min_qubits must not exceed max_qubits."));
+        run();
+        fusion_qubits_min_ = min_qubits;
+        fusion_qubits_max_ = max_qubits;
+        fusion_lookahead_ = lookahead;
+    }
+
     template <class M>
     void apply_controlled_gate(M const& m, const std::vector<unsigned>& ids,
                                const std::vector<unsigned>& ctrl){
-        auto fused_gates = fused_gates_;
-        fused_gates.insert(m, ids, ctrl);
+        apply_diagonal_fusion();
+        if (fusion_lookahead_ > 0){
+            pending_gates_.push_back(PendingGate{m, ids, ctrl});
+            // plan fusion blocks once the lookahead window is full and keep
+            // (at least) half a window of gates to plan the next blocks
+            if (pending_gates_.size() >= fusion_lookahead_){
+                std::size_t start = 0;
+                for (auto end : plan_fusion_blocks()){
+                    if (pending_gates_.size() - start <= fusion_lookahead_ / 2)
+                        break;
+                    start = apply_fusion_block(start, end);
+                }
+                pending_gates_.erase(pending_gates_.begin(),
+                                     pending_gates_.begin() + start);
+            }
+            return;
+        }
+
+        auto num_qubits = fused_gates_.num_qubits_with(ids, ctrl);
 
-        if (fused_gates.num_qubits() >= fusion_qubits_min_
-                && fused_gates.num_qubits() <= fusion_qubits_max_){
-            fused_gates_ = fused_gates;
+        if (num_qubits >= fusion_qubits_min_ && num_qubits <= fusion_qubits_max_){
+            fused_gates_.insert(m, ids, ctrl);
             run();
         }
-        else if (fused_gates.num_qubits() > fusion_qubits_max_
-                 || (fused_gates.num_qubits() - ids.size()) > fused_gates_.num_qubits()){
+        else if (num_qubits > fusion_qubits_max_
+                 || (num_qubits - ids.size()) > fused_gates_.num_qubits()){
             run();
             fused_gates_.insert(m, ids, ctrl);
         }
         else
-            fused_gates_ = fused_gates;
+            fused_gates_.insert(m, ids, ctrl);
+    }
+
+    // Apply a (controlled) diagonal gate, given by its diagonal. Consecutive
+    // diagonal gates are fused into one table of phases, which is applied in
+    // a single pass over the state vector (see apply_diagonal_fusion).
+    void apply_diagonal_gate(std::vector<complex_type> const& diag,
+                             std::vector<unsigned> const& ids,
+                             std::vector<unsigned> const& ctrl){
+        // queued (non-diagonal) gates have to be applied first
+        if (fused_gates_.size() > 0 || pending_gates_.size() > 0)
+            run();
+
+        std::vector<unsigned> new_ids;
+        for (auto id : ids)
+            if (std::find(diag_ids_.begin(), diag_ids_.end(), id) == diag_ids_.end())
+                new_ids.push_back(id);
+        for (auto id : ctrl)
+            if (std::find(diag_ids_.begin(), diag_ids_.end(), id) == diag_ids_.end()
+                    && std::find(new_ids.begin(), new_ids.end(), id) == new_ids.end())
+                new_ids.push_back(id);
+        if (diag_ids_.size() + new_ids.size() > diag_qubits_max_){
+            if (diag_ids_.size() > 0){
+                apply_diagonal_fusion();
+                apply_diagonal_gate(diag, ids, ctrl);
+            }
+            else{ // too many control qubits to fuse the gate into a table
+                std::vector<unsigned> positions;
+                std::size_t ctrlmask = get_control_mask(ctrl);
+                for (auto id : ctrl)
+                    positions.push_back(map_[id]);
+                for (auto id : ids)
+                    positions.push_back(map_[id]);
+                std::vector<std::size_t> offsets;
+                std::vector<complex_type> phases;
+                for (std::size_t k = 0; k < diag.size(); ++k){
+                    if (diag[k] == complex_type(1.))
+                        continue;
+                    std::size_t offset = ctrlmask;
+                    for (std::size_t l = 0; l < ids.size(); ++l)
+                        offset |= ((k >> l) & 1UL) << map_[ids[l]];
+                    offsets.push_back(offset);
+                    phases.push_back(diag[k]);
+                }
+                apply_phases(positions, offsets, phases);
+            }
+            return;
+        }
+        if (diag_table_.empty())
+            diag_table_.push_back(1.);
+
+        // new qubits are appended, i.e., they correspond to the high bits of
+        // the index into the table of phases
+        std::size_t old_mask = diag_table_.size() - 1;
+        diag_ids_.insert(diag_ids_.end(), new_ids.begin(), new_ids.end());
+        std::vector<std::size_t> local_ids(ids.size());
+        for (std::size_t l = 0; l < ids.size(); ++l)
+            local_ids[l] = std::find(diag_ids_.begin(), diag_ids_.end(), ids[l]) - diag_ids_.begin();
+        std::size_t local_ctrlmask = 0;
+        for (auto id : ctrl)
+            local_ctrlmask |= 1UL << (std::find(diag_ids_.begin(), diag_ids_.end(), id) - diag_ids_.begin());
+
+        std::vector<complex_type> table(1UL << diag_ids_.size());
+        for (std::size_t j = 0; j < table.size(); ++j){
+            table[j] = diag_table_[j & old_mask];
+            if ((j & local_ctrlmask) == local_ctrlmask){
+                std::size_t k = 0;
+                for (std::size_t l = 0; l < local_ids.size(); ++l)
+                    k |= ((j >> local_ids[l]) & 1UL) << l;
+                table[j] *= diag[k];
+            }
+        }
+        std::swap(diag_table_, table);
     }
 
+    // Applies the classical reversible function f, which maps the register
+    // values (std::vector<MathValue>) in-place, to all basis states which
+    // satisfy the control condition. f is not necessarily a bijection on
+    // the whole register range (e.g., (x + a) % N for x >= N), so several
+    // basis states may be mapped to the same one. Therefore, only the new
+    // indices are computed in parallel (if f is thread-safe) and the
+    // amplitudes are accumulated serially, one batch at a time.
     template <class F, class QuReg>
     void emulate_math(F const& f, QuReg quregs, const std::vector<unsigned>& ctrl,
-                      bool parallelize = false){
+                      bool parallelize = false, std::size_t batch_size = 1UL << 20){
         run();
         auto ctrlmask = get_control_mask(ctrl);
 
@@ -239,85 +447,179 @@ public:
         for (std::size_t i = 0; i < vec_.size(); i++)
           newvec[i] = 0;
 
-//#pragma omp parallel reduction(+:newvec[:newvec.size()]) if(parallelize) // requires OpenMP 4.5
-        {
-          std::vector<int> res(quregs.size());
-          //#pragma omp for schedule(static)
-          for (std::size_t i = 0; i < vec_.size(); ++i){
-              if ((ctrlmask&i) == ctrlmask){
-                  for (unsigned qr_i = 0; qr_i < quregs.size(); ++qr_i){
-                      res[qr_i] = 0;
-                      for (unsigned qb_i = 0; qb_i < quregs[qr_i].size(); ++qb_i)
-                          res[qr_i] |= ((i >> quregs[qr_i][qb_i])&1) << qb_i;
-                  }
-                  f(res);
+        std::vector<std::size_t> targets(std::min(batch_size, vec_.size()));
+        for (std::size_t start = 0; start < vec_.size(); start += batch_size){
+            std::size_t end = std::min(start + batch_size, vec_.size());
+            #pragma omp parallel if(parallelize)
+            {
+              std::vector<MathValue> res(quregs.size());
+              #pragma omp for schedule(static)
+              for (std::size_t i = start; i < end; ++i){
                   auto new_i = i;
-                  for (unsigned qr_i = 0; qr_i < quregs.size(); ++qr_i){
-                      for (unsigned qb_i = 0; qb_i < quregs[qr_i].size(); ++qb_i){
-                          if (!(((new_i >> quregs[qr_i][qb_i])&1) == ((res[qr_i] >> qb_i)&1)))
-                              new_i ^= (1UL << quregs[qr_i][qb_i]);
-                      }
+                  if ((ctrlmask&i) == ctrlmask){
+                      for (unsigned qr_i = 0; qr_i < quregs.size(); ++qr_i)
+                          res[qr_i] = get_register_value(i, quregs[qr_i]);
+                      f(res);
+                      for (unsigned qr_i = 0; qr_i < quregs.size(); ++qr_i)
+                          new_i = set_register_value(new_i, quregs[qr_i], res[qr_i]);
                   }
-                  newvec[new_i] += vec_[i];
+                  targets[i - start] = new_i;
               }
-              else
-                  newvec[i] += vec_[i];
-          }
+            }
+            for (std::size_t i = start; i < end; ++i)
+                newvec[targets[i - start]] += vec_[i];
+        }
+        std::swap(vec_, newvec);
+        std::swap(tmpBuff1_, newvec);
+    }
+
+    // Same as emulate_math, but f maps the register values of a batch of
+    // basis states at once, i.e., values[r][k] (std::vector<std::vector<
+    // MathValue>>) is the value of register r for the k-th basis state of the
+    // batch. Only f is called serially.
+    template <class F, class QuReg>
+    void emulate_math_vectorized(F const& f, QuReg quregs, const std::vector<unsigned>& ctrl,
+                                 std::size_t batch_size = 1UL << 20){
+        run();
+        auto ctrlmask = get_control_mask(ctrl);
+
+        for (unsigned i = 0; i < quregs.size(); ++i)
+            for (unsigned j = 0; j < quregs[i].size(); ++j)
+                quregs[i][j] = map_[quregs[i][j]];
+
+        StateVector newvec; // avoid costly memory reallocations
+        if( tmpBuff1_.capacity() >= vec_.size() )
+          std::swap(newvec, tmpBuff1_);
+        newvec.resize(vec_.size());
+#pragma omp parallel for schedule(static)
+        for (std::size_t i = 0; i < vec_.size(); i++)
+          newvec[i] = 0;
+
+        std::vector<std::size_t> indices;
+        indices.reserve(std::min(batch_size, vec_.size()));
+        std::vector<std::vector<MathValue>> values(quregs.size());
+        for (std::size_t start = 0; start < vec_.size(); start += batch_size){
+            std::size_t end = std::min(start + batch_size, vec_.size());
+            indices.clear();
+            for (std::size_t i = start; i < end; ++i){
+                if ((ctrlmask&i) == ctrlmask)
+                    indices.push_back(i);
+                else
+                    newvec[i] += vec_[i];
+            }
+            std::size_t num_indices = indices.size();
+            for (auto &v : values)
+                v.resize(num_indices);
+            #pragma omp parallel for schedule(static)
+            for (std::size_t k = 0; k < num_indices; ++k)
+                for (unsigned qr_i = 0; qr_i < quregs.size(); ++qr_i)
+                    values[qr_i][k] = get_register_value(indices[k], quregs[qr_i]);
+            f(values);
+            // f may map several basis states to the same one (see
+            // emulate_math): accumulate the amplitudes serially
+            for (std::size_t k = 0; k < num_indices; ++k){
+                auto new_i = indices[k];
+                for (unsigned qr_i = 0; qr_i < quregs.size(); ++qr_i)
+                    new_i = set_register_value(new_i, quregs[qr_i], values[qr_i][k]);
+                newvec[new_i] += vec_[indices[k]];
+            }
         }
         std::swap(vec_, newvec);
         std::swap(tmpBuff1_, newvec);
     }
 
+    // evaluates a declarative description of a math gate natively (see
+    // MathOperation)
+    template<class QuReg>
+    void emulate_math_operations(std::vector<MathOperation> const& operations, const QuReg& quregs, const std::vector<unsigned>& ctrl)
+    {
+      for (auto const& op : operations)
+          if (op.max_register() >= quregs.size())
+              throw(std::invalid_argument("emulate_math_operations: Register index out of range."));
+      emulate_math([&operations](std::vector<MathValue> &res){for(auto const& op: operations) op(res);}, quregs, ctrl, true);
+    }
+
     // faster version without calling python 
     template<class QuReg>
     inline void emulate_math_addConstant(int a, const QuReg& quregs, const std::vector<unsigned>& ctrl)
     {
-      emulate_math([a](std::vector<int> &res){for(auto& x: res) x = x + a;}, quregs, ctrl, true);
+      emulate_math([a](std::vector<MathValue> &res){for(auto& x: res) x = x + a;}, quregs, ctrl, true);
     }
 
     // faster version without calling python 
     template<class QuReg>
     inline void emulate_math_addConstantModN(int a, int N, const QuReg& quregs, const std::vector<unsigned>& ctrl)
     {
-      emulate_math([a,N](std::vector<int> &res){for(auto& x: res) x = (x + a) % N;}, quregs, ctrl, true);
+      emulate_math([a,N](std::vector<MathValue> &res){for(auto& x: res) x = (x + a) % N;}, quregs, ctrl, true);
     }
 
     // faster version without calling python 
     template<class QuReg>
     inline void emulate_math_multiplyByConstantModN(int a, int N, const QuReg& quregs, const std::vector<unsigned>& ctrl)
     {
-      emulate_math([a,N](std::vector<int> &res){for(auto& x: res) x = (x * a) % N;}, quregs, ctrl, true);
+      emulate_math([a,N](std::vector<MathValue> &res){for(auto& x: res) x = (x * a) % N;}, quregs, ctrl, true);
     }
 
+    // Terms which flip the same bits (i.e., which have the same X/Y mask) are
+    // evaluated together in a single pass over the state vector, without
+    // copying it: with P|i> = i^#Y (-1)^|i & sign_mask| |i ^ flip_mask>,
+    //   <psi|P|psi> = i^#Y sum_i (-1)^|i & sign_mask| conj(psi[i ^ flip_mask]) psi[i]
+    // The summands for i and i ^ flip_mask are complex conjugates of each
+    // other (up to the sign), hence only half of the indices are visited.
     calc_type get_expectation_value(TermsDict const& td, std::vector<unsigned> const& ids){
         run();
-        calc_type expectation = 0.;
-
-        StateVector current_state; // avoid costly memory reallocations
-        if( tmpBuff1_.capacity() >= vec_.size() )
-          std::swap(tmpBuff1_, current_state);
-        current_state.resize(vec_.size());
-#pragma omp parallel for schedule(static)
-        for (std::size_t i = 0; i < vec_.size(); ++i)
-          current_state[i] = vec_[i];
-
+        std::map<std::size_t, std::vector<std::pair<PauliMasks, calc_type>>> groups;
         for (auto const& term : td){
-            auto const& coefficient = term.second;
-            apply_term(term.first, ids, {});
-            calc_type delta = 0.;
-            #pragma omp parallel for reduction(+:delta) schedule(static)
-            for (std::size_t i = 0; i < vec_.size(); ++i){
-                auto const a1 = std::real(current_state[i]);
-                auto const b1 = -std::imag(current_state[i]);
-                auto const a2 = std::real(vec_[i]);
-                auto const b2 = std::imag(vec_[i]);
-                delta += a1 * a2 - b1 * b2;
-                // reset vec_
-                vec_[i] = current_state[i];
+            auto masks = get_pauli_masks(term.first, ids);
+            groups[masks.flip].emplace_back(masks, term.second);
+        }
+
+        double expectation = 0.;
+        for (auto const& group : groups){
+            auto const flip = group.first;
+            auto const& terms = group.second;
+            std::size_t K = terms.size();
+            // the expectation value is real, i.e., only the real (for an
+            // even number of Y) or the imaginary part (odd) of the sum matters
+            std::vector<std::size_t> sign_masks(K);
+            std::vector<char> imag(K);
+            for (std::size_t k = 0; k < K; ++k){
+                sign_masks[k] = terms[k].first.sign;
+                imag[k] = terms[k].first.num_y & 1;
+            }
+            // highest flipped bit (the pairs i, i ^ flip differ in this bit)
+            unsigned pos = 0;
+            while ((flip >> pos) > 1)
+                ++pos;
+            std::size_t num_indices = flip ? vec_.size() / 2 : vec_.size();
+            std::vector<double> sums(K, 0.);
+            #pragma omp parallel
+            {
+                std::vector<double> local_sums(K, 0.);
+                #pragma omp for schedule(static)
+                for (std::size_t c = 0; c < num_indices; ++c){
+                    std::size_t i = flip ? ((c >> pos) << (pos + 1)) | (c & ((1UL << pos) - 1)) : c;
+                    auto const& a = vec_[i ^ flip];
+                    auto const& b = vec_[i];
+                    double re = double(a.real()) * b.real() + double(a.imag()) * b.imag();
+                    double im = double(a.real()) * b.imag() - double(a.imag()) * b.real();
+                    for (std::size_t k = 0; k < K; ++k){
+                        double v = imag[k] ? im : re;
+                        local_sums[k] += (std::bitset<64>(i & sign_masks[k]).count() & 1) ? -v : v;
+                    }
+                }
+                #pragma omp critical
+                for (std::size_t k = 0; k < K; ++k)
+                    sums[k] += local_sums[k];
+            }
+            for (std::size_t k = 0; k < K; ++k){
+                // multiply by i^#Y and take the real part
+                double sign = ((terms[k].first.num_y + 1) & 2) ? -1. : 1.;
+                if (flip)
+                    sign *= 2.;
+                expectation += terms[k].second * sign * sums[k];
             }
-            expectation += coefficient * delta;
         }
-        std::swap(current_state, tmpBuff1_);
         return expectation;
     }
 
@@ -399,13 +701,13 @@ public:
             }
         }
         unsigned s = std::abs(time) * op_nrm + 1.;
-        complex_type correction = std::exp(-time * I * tr / (double)s);
+        complex_type correction = std::exp(-time * I * tr / calc_type(s));
         auto output_state = vec_;
         auto ctrlmask = get_control_mask(ctrl);
         for (unsigned i = 0; i < s; ++i){
             calc_type nrm_change = 1.;
             for (unsigned k = 0; nrm_change > 1.e-12; ++k){
-                auto coeff = (-time * I) / double(s * (k + 1));
+                auto coeff = (-time * I) / calc_type(s * (k + 1));
                 auto current_state = vec_;
                 auto update = StateVector(vec_.size(), 0.);
                 for (auto const& tup : td){
@@ -437,10 +739,75 @@ public:
         }
     }
 
-    void set_wavefunction(StateVector const& wavefunction, std::vector<unsigned> const& ordering){
+    // Evolve the state under the (precompiled) Hamiltonian h, using the
+    // Chebyshev expansion of exp(-i h time) in the rescaled Hamiltonian
+    // (h - trace) / norm, truncated at the given tolerance. Requires two
+    // additional state vectors.
+    void emulate_time_evolution_chebyshev(Hamiltonian const& h, calc_type const& time,
+                                          std::vector<unsigned> const& ids,
+                                          std::vector<unsigned> const& ctrl,
+                                          double tolerance){
+        run();
+        if (h.num_qubits() > ids.size())
+            throw(std::runtime_error("emulate_time_evolution(): The Hamiltonian acts on more qubits than provided."));
+        std::vector<unsigned> positions(ids.size());
+        for (std::size_t l = 0; l < ids.size(); ++l)
+            positions[l] = map_[ids[l]];
+        auto to_positions = [&](std::size_t local_mask){
+            std::size_t mask = 0;
+            for (std::size_t l = 0; local_mask >> l; ++l)
+                mask |= ((local_mask >> l) & 1UL) << positions[l];
+            return mask;
+        };
+        // Hamiltonian in terms of bit positions, rescaled by 2 / norm (the
+        // factor 2 of the Chebyshev recurrence is included)
+        std::vector<Hamiltonian::Group> groups = h.groups();
+        for (auto &group : groups){
+            group.flip = to_positions(group.flip);
+            for (auto &sign : group.signs)
+                sign = to_positions(sign);
+            for (auto &c : group.coefficients)
+                c *= 2. / h.norm();
+        }
+        auto coefficients = chebyshev_coefficients(h.norm() * time, tolerance);
+        auto ctrlmask = get_control_mask(ctrl);
+        complex_type phase = std::exp(complex_type(0., -time * h.trace()));
+
+        // T_0 = psi (restricted to the control subspace), T_1 = H T_0 / norm
+        StateVector t_prev(vec_.size()), t_cur(vec_.size(), 0.);
+        #pragma omp parallel for schedule(static)
+        for (std::size_t i = 0; i < vec_.size(); ++i){
+            if ((i & ctrlmask) == ctrlmask){
+                t_prev[i] = vec_[i];
+                vec_[i] *= complex_type(coefficients[0]);
+            }
+            else
+                t_prev[i] = 0.;
+        }
+        if (coefficients.size() > 1){
+            apply_hamiltonian(groups, t_prev, t_cur, .5, 0.);
+            add_scaled(t_cur, coefficients[1]);
+        }
+        // T_k+1 = 2 H T_k / norm - T_k-1, computed in-place in t_prev
+        for (std::size_t k = 2; k < coefficients.size(); ++k){
+            apply_hamiltonian(groups, t_cur, t_prev, 1., -1.);
+            add_scaled(t_prev, coefficients[k]);
+            std::swap(t_prev, t_cur);
+        }
+        if (phase != complex_type(1.)){
+            #pragma omp parallel for schedule(static)
+            for (std::size_t i = 0; i < vec_.size(); ++i)
+                if ((i & ctrlmask) == ctrlmask)
+                    vec_[i] *= phase;
+        }
+    }
+
+    void set_wavefunction(complex_type const* wavefunction, std::size_t size,
+                          std::vector<unsigned> const& ordering){
         run();
         // make sure there are 2^n amplitudes for n qubits
-        assert(wavefunction.size() == (1UL << ordering.size()));
+        if (size != (1UL << ordering.size()))
+            throw(std::runtime_error("set_wavefunction(): The wavefunction must consist of 2^n amplitudes for n qubits."));
         // check that all qubits have been allocated previously
         if (map_.size() != ordering.size() || !check_ids(ordering))
             throw(std::runtime_error("set_wavefunction(): Invalid mapping provided. Please make sure all qubits have been allocated previously (call eng.flush())."));
@@ -449,7 +816,7 @@ public:
         for (unsigned i = 0; i < ordering.size(); ++i)
             map_[ordering[i]] = i;
         #pragma omp parallel for schedule(static)
-        for (std::size_t i = 0; i < wavefunction.size(); ++i)
+        for (std::size_t i = 0; i < size; ++i)
             vec_[i] = wavefunction[i];
     }
 
@@ -484,13 +851,218 @@ public:
     }
 
     void run(){
+        apply_diagonal_fusion();
+
+        if (pending_gates_.size() > 0){
+            std::size_t start = 0;
+            for (auto end : plan_fusion_blocks())
+                start = apply_fusion_block(start, end);
+            pending_gates_.clear();
+        }
+
         if (fused_gates_.size() < 1)
             return;
 
-        Fusion::Matrix m;
-        Fusion::IndexVector ids, ctrls;
+        apply_fused_gates(fused_gates_);
+        fused_gates_ = Fusion();
+    }
+
+    std::string get_rng_state() const {
+        std::ostringstream state;
+        state << rnd_eng_;
+        return state.str();
+    }
+
+    void set_rng_state(std::string const& state){
+        std::istringstream stream(state);
+        RndEngine rnd_eng;
+        stream >> rnd_eng;
+        if (stream.fail())
+            throw(std::runtime_error("set_rng_state(): Invalid state of the random number generator."));
+        rnd_eng_ = rnd_eng;
+    }
+
+    std::tuple<Map, StateVector&> cheat(){
+        run();
+        return make_tuple(map_, std::ref(vec_));
+    }
+
+    ~BasicSimulator(){
+    }
+
+private:
+    struct PendingGate{
+        Matrix matrix;
+        IndexVector ids, ctrls;
+    };
 
-        fused_gates_.perform_fusion(m, ids, ctrls);
+    // Pauli string as bit masks: P|i> = i^num_y (-1)^|i & sign| |i ^ flip>
+    struct PauliMasks{
+        std::size_t flip, sign;
+        unsigned num_y;
+    };
+
+    PauliMasks get_pauli_masks(Term const& term, std::vector<unsigned> const& ids){
+        PauliMasks masks{0, 0, 0};
+        for (auto const& local_op : term){
+            std::size_t bit = 1UL << map_[ids[local_op.first]];
+            if (local_op.second != 'Z')
+                masks.flip |= bit;
+            if (local_op.second != 'X')
+                masks.sign |= bit;
+            if (local_op.second == 'Y')
+                masks.num_y++;
+        }
+        return masks;
+    }
+
+    // out = beta * out + alpha * H in, for a Hamiltonian given by groups of
+    // Pauli strings (in terms of bit positions).
+    void apply_hamiltonian(std::vector<Hamiltonian::Group> const& groups,
+                           StateVector const& in, StateVector &out,
+                           calc_type alpha, calc_type beta){
+        bool first = true;
+        for (auto const& group : groups){
+            auto const flip = group.flip;
+            auto const& signs = group.signs;
+            std::vector<complex_type> coefficients(group.coefficients.begin(),
+                                                   group.coefficients.end());
+            for (auto &c : coefficients)
+                c *= alpha;
+            calc_type b = first ? beta : 1.;
+            #pragma omp parallel for schedule(static)
+            for (std::size_t j = 0; j < in.size(); ++j){
+                std::size_t i = j ^ flip;
+                complex_type c = 0.;
+                for (std::size_t t = 0; t < signs.size(); ++t){
+                    if (std::bitset<64>(i & signs[t]).count() & 1)
+                        c -= coefficients[t];
+                    else
+                        c += coefficients[t];
+                }
+                out[j] = b * out[j] + multiply(c, in[i]);
+            }
+            first = false;
+        }
+        if (first){ // no (non-identity) terms
+            #pragma omp parallel for schedule(static)
+            for (std::size_t j = 0; j < out.size(); ++j)
+                out[j] *= beta;
+        }
+    }
+
+    // vec_ += c * v
+    void add_scaled(StateVector const& v, std::complex<double> const& c){
+        complex_type coefficient(c);
+        #pragma omp parallel for schedule(static)
+        for (std::size_t i = 0; i < vec_.size(); ++i)
+            vec_[i] += multiply(coefficient, v[i]);
+    }
+
+    // Estimated cost of applying a fused k-qubit gate, in units of one pass
+    // over the state vector: kernels on up to 2 qubits are bound by memory
+    // bandwidth, larger kernels by the number of arithmetic operations.
+    static double fusion_cost(unsigned k){
+        return std::max(1., double(1UL << k) / 4.);
+    }
+
+    // Split the pending gates into consecutive fusion blocks such that the
+    // total estimated cost is minimal (dynamic programming over the block
+    // boundaries). Returns the (exclusive) end of each block.
+    std::vector<std::size_t> plan_fusion_blocks() const {
+        std::size_t n = pending_gates_.size();
+        std::vector<double> cost(n + 1, 0.);
+        std::vector<std::size_t> next(n + 1, n);
+        for (std::size_t start = n; start-- > 0;){
+            FusionShape shape;
+            cost[start] = std::numeric_limits<double>::max();
+            for (std::size_t end = start + 1; end <= n; ++end){
+                auto const& gate = pending_gates_[end - 1];
+                if (end > start + 1 && shape.num_qubits_with(gate.ids, gate.ctrls) > fusion_qubits_max_)
+                    break;
+                shape.insert(gate.ids, gate.ctrls);
+                double c = fusion_cost(shape.num_qubits()) + cost[end];
+                // prefer larger blocks if the estimated cost is the same
+                if (c <= cost[start]){
+                    cost[start] = c;
+                    next[start] = end;
+                }
+            }
+        }
+        std::vector<std::size_t> ends;
+        for (std::size_t start = 0; start < n; start = next[start])
+            ends.push_back(next[start]);
+        return ends;
+    }
+
+    // complex multiplication without the checks for infinities and NaNs
+    static complex_type multiply(complex_type const& a, complex_type const& b){
+        return complex_type(a.real() * b.real() - a.imag() * b.imag(),
+                            a.real() * b.imag() + a.imag() * b.real());
+    }
+
+    // Multiply each amplitude by the entry of the table of fused diagonal
+    // gates which corresponds to its index.
+    void apply_diagonal_fusion(){
+        if (diag_table_.empty())
+            return;
+
+        std::vector<unsigned> positions(diag_ids_.size());
+        for (std::size_t l = 0; l < diag_ids_.size(); ++l)
+            positions[l] = map_[diag_ids_[l]];
+        std::vector<std::size_t> offsets;
+        std::vector<complex_type> phases;
+        for (std::size_t j = 0; j < diag_table_.size(); ++j){
+            if (diag_table_[j] == complex_type(1.))
+                continue;
+            std::size_t offset = 0;
+            for (std::size_t l = 0; l < positions.size(); ++l)
+                offset |= ((j >> l) & 1UL) << positions[l];
+            offsets.push_back(offset);
+            phases.push_back(diag_table_[j]);
+        }
+        apply_phases(positions, offsets, phases);
+
+        diag_ids_.clear();
+        diag_table_.clear();
+    }
+
+    // Multiply the amplitudes at base + offsets[t] by phases[t], for all
+    // base indices which are 0 at the bit-positions `positions`.
+    void apply_phases(std::vector<unsigned> positions,
+                      std::vector<std::size_t> const& offsets,
+                      std::vector<complex_type> const& phases){
+        if (offsets.empty())
+            return;
+        std::sort(positions.begin(), positions.end());
+        std::size_t num_bases = vec_.size() >> positions.size();
+
+        #pragma omp parallel for schedule(static)
+        for (std::size_t c = 0; c < num_bases; ++c){
+            // insert a 0 at each of the (sorted) positions
+            std::size_t base = c;
+            for (auto pos : positions)
+                base = ((base >> pos) << (pos + 1)) | (base & ((1UL << pos) - 1));
+            for (std::size_t t = 0; t < offsets.size(); ++t)
+                vec_[base + offsets[t]] = multiply(vec_[base + offsets[t]], phases[t]);
+        }
+    }
+
+    // Fuse and apply the pending gates [start, end), returns end.
+    std::size_t apply_fusion_block(std::size_t start, std::size_t end){
+        Fusion fused_gates;
+        for (std::size_t i = start; i < end; ++i)
+            fused_gates.insert(std::move(pending_gates_[i].matrix),
+                               pending_gates_[i].ids, pending_gates_[i].ctrls);
+        apply_fused_gates(fused_gates);
+        return end;
+    }
+
+    void apply_fused_gates(Fusion& fused_gates){
+        Matrix m;
+        IndexVector ids, ctrls;
+
+        fused_gates.perform_fusion(m, ids, ctrls);
 
         for (auto& id : ids)
             id = map_[id];
@@ -500,53 +1072,60 @@ public:
         switch (ids.size()){
             case 1:
                 #pragma omp parallel
-                kernel(vec_, ids[0], m, ctrlmask);
+                Kernels<calc_type>::apply(vec_, ids[0], m, ctrlmask);
                 break;
             case 2:
                 #pragma omp parallel
-                kernel(vec_, ids[1], ids[0], m, ctrlmask);
+                Kernels<calc_type>::apply(vec_, ids[1], ids[0], m, ctrlmask);
                 break;
             case 3:
                 #pragma omp parallel
-                kernel(vec_, ids[2], ids[1], ids[0], m, ctrlmask);
+                Kernels<calc_type>::apply(vec_, ids[2], ids[1], ids[0], m, ctrlmask);
                 break;
             case 4:
                 #pragma omp parallel
-                kernel(vec_, ids[3], ids[2], ids[1], ids[0], m, ctrlmask);
+                Kernels<calc_type>::apply(vec_, ids[3], ids[2], ids[1], ids[0], m, ctrlmask);
                 break;
             case 5:
                 #pragma omp parallel
-                kernel(vec_, ids[4], ids[3], ids[2], ids[1], ids[0], m, ctrlmask);
+                Kernels<calc_type>::apply(vec_, ids[4], ids[3], ids[2], ids[1], ids[0], m, ctrlmask);
                 break;
             default:
                 throw std::invalid_argument("Gates with more than 5 qubits are not supported!");
         }
-
-        fused_gates_ = Fusion();
     }
 
-    std::tuple<Map, StateVector&> cheat(){
-        run();
-        return make_tuple(map_, std::ref(vec_));
-    }
-
-    ~Simulator(){
-    }
-
-private:
     void apply_term(Term const& term, std::vector<unsigned> const& ids,
                     std::vector<unsigned> const& ctrl){
         complex_type I(0., 1.);
-        Fusion::Matrix X = {{0., 1.}, {1., 0.}};
-        Fusion::Matrix Y = {{0., -I}, {I, 0.}};
-        Fusion::Matrix Z = {{1., 0.}, {0., -1.}};
-        std::vector<Fusion::Matrix> gates = {X, Y, Z};
+        Matrix X = {{0., 1.}, {1., 0.}};
+        Matrix Y = {{0., -I}, {I, 0.}};
+        Matrix Z = {{1., 0.}, {0., -1.}};
+        std::vector<Matrix> gates = {X, Y, Z};
         for (auto const& local_op : term){
             unsigned id = ids[local_op.first];
             apply_controlled_gate(gates[local_op.second - 'X'], {id}, ctrl);
         }
         run();
     }
+    // value of the register (given by the positions of its qubits, from low
+    // to high bit) in the basis state i
+    template <class QR>
+    static MathValue get_register_value(std::size_t i, QR const& qureg){
+        MathValue value = 0;
+        for (unsigned qb_i = 0; qb_i < qureg.size(); ++qb_i)
+            value |= MathValue((i >> qureg[qb_i]) & 1) << qb_i;
+        return value;
+    }
+
+    // basis state i with the register set to (the lower bits of) value
+    template <class QR>
+    static std::size_t set_register_value(std::size_t i, QR const& qureg, MathValue value){
+        for (unsigned qb_i = 0; qb_i < qureg.size(); ++qb_i)
+            i = (i & ~(1UL << qureg[qb_i])) | (std::size_t((value >> qb_i) & 1) << qureg[qb_i]);
+        return i;
+    }
+
     std::size_t get_control_mask(std::vector<unsigned> const& ctrls){
         std::size_t ctrlmask = 0;
         for (auto c : ctrls)
@@ -565,7 +1144,12 @@ private:
     StateVector vec_;
     Map map_;
     Fusion fused_gates_;
-    unsigned fusion_qubits_min_, fusion_qubits_max_;
+    std::vector<PendingGate> pending_gates_;
+    // fused diagonal gates: qubit ids and table of phases (empty if none)
+    std::vector<unsigned> diag_ids_;
+    std::vector<complex_type> diag_table_;
+    static constexpr unsigned diag_qubits_max_ = 12;
+    unsigned fusion_qubits_min_, fusion_qubits_max_, fusion_lookahead_;
     RndEngine rnd_eng_;
     std::function<double()> rng_;
 
@@ -573,7 +1157,11 @@ private:
     static StateVector tmpBuff1_, tmpBuff2_;
 };
 
-Simulator::StateVector Simulator::tmpBuff1_;
-Simulator::StateVector Simulator::tmpBuff2_;
+template <class T>
+typename BasicSimulator<T>::StateVector BasicSimulator<T>::tmpBuff1_;
+template <class T>
+typename BasicSimulator<T>::StateVector BasicSimulator<T>::tmpBuff2_;
+
+using Simulator = BasicSimulator<double>;
 
 #endif
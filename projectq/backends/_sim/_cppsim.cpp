@@ -25,43 +25,155 @@
 
 namespace py = pybind11;
 
-using c_type = std::complex<double>;
-using ArrayType = std::vector<c_type, aligned_allocator<c_type,64>>;
-using MatrixType = std::vector<ArrayType>;
 using QuRegs = std::vector<std::vector<unsigned>>;
 
-template <class QR>
-void emulate_math_wrapper(Simulator &sim, py::function const& pyfunc, QR const& qr, std::vector<unsigned> const& ctrls){
-    auto f = [&](std::vector<int>& x) {
+template <class S, class QR>
+void emulate_math_wrapper(S &sim, py::function const& pyfunc, QR const& qr, std::vector<unsigned> const& ctrls){
+    using Values = std::vector<MathOperation::Value>;
+    auto f = [&](Values& x) {
         pybind11::gil_scoped_acquire acquire;
-        x = std::move(pyfunc(x).cast<std::vector<int>>());
+        x = std::move(pyfunc(x).cast<Values>());
     };
     pybind11::gil_scoped_release release;
     sim.emulate_math(f, qr, ctrls);
 }
+
+// Calls pyfunc once per batch of basis states, with one numpy array of int64
+// values per register.
+template <class S, class QR>
+void emulate_math_vectorized_wrapper(S &sim, py::function const& pyfunc, QR const& qr, std::vector<unsigned> const& ctrls){
+    using Value = MathOperation::Value;
+    auto f = [&](std::vector<std::vector<Value>>& values) {
+        pybind11::gil_scoped_acquire acquire;
+        py::list args;
+        for (auto const& v : values)
+            args.append(py::array_t<Value>(v.size(), v.data()));
+        auto res = pyfunc(args);
+        if (py::len(res) != values.size())
+            throw(std::invalid_argument("emulate_math_vectorized: Wrong number of outputs."));
+        std::size_t r = 0;
+        for (auto const& output : res){
+            auto array = py::array_t<Value, py::array::c_style | py::array::forcecast>::ensure(output);
+            if (!array || std::size_t(array.size()) != values[r].size())
+                throw(std::invalid_argument("emulate_math_vectorized: Outputs have to be arrays of the same length as the inputs."));
+            std::copy(array.data(), array.data() + array.size(), values[r].begin());
+            ++r;
+        }
+    };
+    pybind11::gil_scoped_release release;
+    sim.emulate_math_vectorized(f, qr, ctrls);
+}
+
+template <class S, class QR>
+void emulate_math_operations_wrapper(S &sim, std::vector<py::tuple> const& ops, QR const& qr, std::vector<unsigned> const& ctrls){
+    // operations are given as tuples (name, args...)
+    std::vector<MathOperation> operations;
+    for (auto const& op : ops){
+        if (py::len(op) == 0)
+            throw(std::invalid_argument("emulate_math_operations: Empty operation."));
+        std::vector<MathOperation::Value> args;
+        for (std::size_t i = 1; i < py::len(op); ++i)
+            args.push_back(op[i].cast<MathOperation::Value>());
+        operations.emplace_back(op[0].cast<std::string>(), args);
+    }
+    pybind11::gil_scoped_release release;
+    sim.emulate_math_operations(operations, qr, ctrls);
+}
+
+// Gate matrices and diagonals are passed as (C-contiguous) numpy arrays, which
+// avoids converting them to nested Python lists first; lists are still
+// accepted and converted by numpy.
+template <class S>
+void apply_controlled_gate_wrapper(S &sim, py::array_t<typename S::complex_type, py::array::c_style | py::array::forcecast> const& m,
+                                   std::vector<unsigned> const& ids, std::vector<unsigned> const& ctrl){
+    using c_type = typename S::complex_type;
+    using MatrixType = std::vector<std::vector<c_type, aligned_allocator<c_type,64>>>;
+    if (m.ndim() != 2 || m.shape(0) != m.shape(1))
+        throw(std::invalid_argument("apply_controlled_gate: The gate matrix has to be square."));
+    std::size_t n = m.shape(0);
+    MatrixType matrix(n);
+    auto data = m.data();
+    for (std::size_t i = 0; i < n; ++i)
+        matrix[i].assign(data + i * n, data + (i + 1) * n);
+    pybind11::gil_scoped_release release;
+    sim.apply_controlled_gate(matrix, ids, ctrl);
+}
+
+template <class S>
+void apply_diagonal_gate_wrapper(S &sim, py::array_t<typename S::complex_type, py::array::c_style | py::array::forcecast> const& diag,
+                                 std::vector<unsigned> const& ids, std::vector<unsigned> const& ctrl){
+    std::vector<typename S::complex_type> diagonal(diag.data(), diag.data() + diag.size());
+    pybind11::gil_scoped_release release;
+    sim.apply_diagonal_gate(diagonal, ids, ctrl);
+}
+
+// Returns the qubit map and the state vector as a numpy array. Unless copy is
+// false, the state vector is copied. Otherwise, the array refers to the state
+// vector of the simulator and keeps the simulator alive, but it is only valid
+// until the simulator reallocates its state vector (e.g., when allocating or
+// deallocating qubits).
+template <class S>
+py::tuple cheat_wrapper(py::object self, bool writable, bool copy){
+    auto res = self.cast<S&>().cheat();
+    auto &vec = std::get<1>(res);
+    if (copy)
+        return py::make_tuple(std::get<0>(res), py::array_t<typename S::complex_type>(vec.size(), vec.data()));
+    py::array_t<typename S::complex_type> array(vec.size(), vec.data(), self);
+    if (!writable)
+        array.attr("setflags")(py::arg("write") = false);
+    return py::make_tuple(std::get<0>(res), array);
+}
+
+template <class S>
+void bind_simulator(py::module &m, char const* name){
+    using c_type = typename S::complex_type;
+    // the GIL is released while the simulator works on the state vector,
+    // such that other Python threads can run in the meantime (e.g., the
+    // compiler engines if the simulator runs on a worker thread)
+    auto release_gil = py::call_guard<py::gil_scoped_release>();
+
+    py::class_<S>(m, name)
+        .def(py::init<unsigned>())
+        .def("allocate_qubit", &S::allocate_qubit, release_gil)
+        .def("deallocate_qubit", &S::deallocate_qubit, release_gil)
+        .def("get_classical_value", &S::get_classical_value)
+        .def("is_classical", &S::is_classical)
+        .def("measure_qubits", &S::measure_qubits_return, release_gil)
+        .def("sample_qubits", &S::sample_qubits, release_gil)
+        .def("apply_controlled_gate", &apply_controlled_gate_wrapper<S>)
+        .def("apply_diagonal_gate", &apply_diagonal_gate_wrapper<S>)
+        .def("emulate_math", &emulate_math_wrapper<S, QuRegs>)
+        .def("emulate_math_vectorized", &emulate_math_vectorized_wrapper<S, QuRegs>)
+        .def("emulate_math_operations", &emulate_math_operations_wrapper<S, QuRegs>)
+        .def("emulate_math_addConstant", &S::template emulate_math_addConstant<QuRegs>, release_gil)
+        .def("emulate_math_addConstantModN", &S::template emulate_math_addConstantModN<QuRegs>, release_gil)
+        .def("emulate_math_multiplyByConstantModN", &S::template emulate_math_multiplyByConstantModN<QuRegs>, release_gil)
+        .def("get_expectation_value", &S::get_expectation_value, release_gil)
+        .def("apply_qubit_operator", &S::apply_qubit_operator, release_gil)
+        .def("emulate_time_evolution", &S::emulate_time_evolution, release_gil)
+        .def("compile_hamiltonian", [](S &, Hamiltonian::TermsDict const& td){ return Hamiltonian(td); })
+        .def("emulate_time_evolution_chebyshev", &S::emulate_time_evolution_chebyshev, release_gil)
+        .def("get_probability", &S::get_probability, release_gil)
+        .def("get_amplitude", &S::get_amplitude, release_gil)
+        .def("set_wavefunction", [](S &sim, py::array_t<c_type, py::array::c_style | py::array::forcecast> const& wavefunction,
+                                    std::vector<unsigned> const& ordering){
+            sim.set_wavefunction(wavefunction.data(), wavefunction.size(), ordering);
+        })
+        .def("collapse_wavefunction", &S::collapse_wavefunction, release_gil)
+        .def("set_fusion_policy", &S::set_fusion_policy)
+        .def("get_rng_state", &S::get_rng_state)
+        .def("set_rng_state", &S::set_rng_state)
+        .def("run", &S::run, release_gil)
+        .def("cheat", &cheat_wrapper<S>, py::arg("writable") = false, py::arg("copy") = true)
+        ;
+}
+
 PYBIND11_PLUGIN(_cppsim) {
     py::module m("_cppsim", "_cppsim");
-    py::class_<Simulator>(m, "Simulator")
-        .def(py::init<unsigned>())
-        .def("allocate_qubit", &Simulator::allocate_qubit)
-        .def("deallocate_qubit", &Simulator::deallocate_qubit)
-        .def("get_classical_value", &Simulator::get_classical_value)
-        .def("is_classical", &Simulator::is_classical)
-        .def("measure_qubits", &Simulator::measure_qubits_return)
-        .def("apply_controlled_gate", &Simulator::apply_controlled_gate<MatrixType>)
-        .def("emulate_math", &emulate_math_wrapper<QuRegs>)
-        .def("emulate_math_addConstant", &Simulator::emulate_math_addConstant<QuRegs>)
-        .def("emulate_math_addConstantModN", &Simulator::emulate_math_addConstantModN<QuRegs>)
-        .def("emulate_math_multiplyByConstantModN", &Simulator::emulate_math_multiplyByConstantModN<QuRegs>)
-        .def("get_expectation_value", &Simulator::get_expectation_value)
-        .def("apply_qubit_operator", &Simulator::apply_qubit_operator)
-        .def("emulate_time_evolution", &Simulator::emulate_time_evolution)
-        .def("get_probability", &Simulator::get_probability)
-        .def("get_amplitude", &Simulator::get_amplitude)
-        .def("set_wavefunction", &Simulator::set_wavefunction)
-        .def("collapse_wavefunction", &Simulator::collapse_wavefunction)
-        .def("run", &Simulator::run)
-        .def("cheat", &Simulator::cheat)
+    py::class_<Hamiltonian>(m, "Hamiltonian")
+        .def(py::init<Hamiltonian::TermsDict const&>())
         ;
+    bind_simulator<Simulator>(m, "Simulator");
+    bind_simulator<BasicSimulator<float>>(m, "SinglePrecisionSimulator");
     return m.ptr();
 }
@@ -18,10 +18,121 @@ Contains a (slow) Python simulator.
 Please compile the c++ simulator for large-scale simulations.
 """
 
+import json
 import random
 import numpy as _np
 
 
+def _get_pauli_masks(term, positions):
+    """
+    Return the bit masks of a Pauli string P, such that
+    P|i> = 1j**num_y * (-1)**popcount(i & sign_mask) |i ^ flip_mask>.
+
+    Args:
+        term: One term of QubitOperator.terms
+        positions (list[int]): Bit-position of each of the qubits the term
+            acts on (term index to bit-position mapping)
+
+    Returns:
+        Tuple (flip_mask, sign_mask, num_y).
+    """
+    flip_mask = sign_mask = num_y = 0
+    for local_op in term:
+        bit = 1 << positions[local_op[0]]
+        if local_op[1] != 'Z':
+            flip_mask |= bit
+        if local_op[1] != 'X':
+            sign_mask |= bit
+        if local_op[1] == 'Y':
+            num_y += 1
+    return flip_mask, sign_mask, num_y
+
+
+def _apply_math_operations(operations, values):
+    """
+    Evaluate a declarative description of a math gate (see
+    BasicMathGate.get_math_operations) for many basis states at once.
+
+    Args:
+        operations (list<tuple>): Operations to apply, in order.
+        values (list<numpy.ndarray>): Register values (int64), one array per
+            register.
+
+    Returns:
+        List of arrays with the new register values.
+
+    Raises:
+        ValueError: If an operation is unknown or malformed.
+    """
+    num_args = {'add': 2, 'sub': 2, 'add_mod': 3, 'multiply_add': 3,
+                'less_than': 3, 'add_constant': 2, 'add_constant_mod': 3,
+                'multiply_constant_mod': 3}
+    num_registers = {'add': 2, 'sub': 2, 'add_mod': 2, 'multiply_add': 3,
+                     'less_than': 3}
+    x = [_np.array(v, dtype=_np.int64) for v in values]
+    for op in operations:
+        name, args = op[0], op[1:]
+        if name not in num_args:
+            raise ValueError("Unknown math operation '{}'.".format(name))
+        if len(args) != num_args[name]:
+            raise ValueError("Wrong number of arguments for '{}'."
+                             .format(name))
+        registers = args[:num_registers.get(name, 1)]
+        if any(r < 0 or r >= len(x) for r in registers):
+            raise ValueError("Register index out of range.")
+        if name in ('add_mod', 'add_constant_mod',
+                    'multiply_constant_mod') and args[-1] <= 0:
+            raise ValueError("The modulus has to be positive.")
+        t = args[0]
+        if name == 'add':
+            x[t] = x[t] + x[args[1]]
+        elif name == 'sub':
+            x[t] = x[t] - x[args[1]]
+        elif name == 'add_mod':
+            x[t] = (x[t] + x[args[1]]) % args[2]
+        elif name == 'multiply_add':
+            x[t] = x[t] + x[args[1]] * x[args[2]]
+        elif name == 'less_than':
+            x[t] = x[t] ^ (x[args[1]] < x[args[2]])
+        elif name == 'add_constant':
+            x[t] = x[t] + args[1]
+        elif name == 'add_constant_mod':
+            x[t] = (x[t] + args[1]) % args[2]
+        else:
+            x[t] = (x[t] * args[1]) % args[2]
+    return x
+
+
+def _get_chebyshev_coefficients(x, tolerance):
+    """
+    Return the coefficients a_k = (2 - delta_k0) (-1j)**k J_k(x) of the
+    Chebyshev expansion exp(-1j x y) = sum_k a_k T_k(y) for -1 <= y <= 1,
+    truncated once abs(a_k) < tolerance (for k > abs(x)).
+
+    The Bessel functions J_k are computed using Miller's backward recurrence.
+    """
+    ax = abs(x)
+    if ax == 0.:
+        return [1.]
+    n = int(ax + 15. * ax ** (1. / 3.) + 40.)
+    J = [0.] * (n + 2)
+    J[n] = 1.e-300
+    for k in range(n, 0, -1):
+        J[k - 1] = 2. * k / ax * J[k] - J[k + 1]
+        if abs(J[k - 1]) > 1.e250:  # rescale to avoid overflows
+            J = [v * 1.e-250 for v in J]
+    # normalize using J_0 + 2 sum_k J_2k = 1
+    nrm = J[0] + 2. * sum(J[2:n + 1:2])
+    factor = 1j if x < 0 else -1j
+    coefficients = []
+    for k in range(n + 1):
+        J_k = J[k] / nrm
+        if k > ax and abs(J_k) < tolerance:
+            break
+        coefficients.append((1. if k == 0 else 2.) * J_k * factor ** k)
+    return coefficients
+
+
 class Simulator(object):
     """
     Python implementation of a quantum computer simulator.
@@ -36,17 +147,23 @@ class Simulator(object):
 
         Args:
             rnd_seed (int): Seed to initialize the random number generator.
+            precision (str): Keyword argument, either 'double' (default) for
+                a complex128 state vector or 'single' for complex64.
             args: Dummy argument to allow an interface identical to the c++
                 simulator.
             kwargs: Same as args.
         """
         random.seed(rnd_seed)
-        self._state = _np.ones(1, dtype=_np.complex128)
+        if kwargs.get('precision', 'double') == 'single':
+            self._dtype = _np.complex64
+        else:
+            self._dtype = _np.complex128
+        self._state = _np.ones(1, dtype=self._dtype)
         self._map = dict()
         self._num_qubits = 0
         print("(Note: This is the (slow) Python simulator.)")
 
-    def cheat(self):
+    def cheat(self, writable=False, copy=True):
         """
         Return the qubit index to bit location map and the corresponding state
         vector.
@@ -54,12 +171,22 @@ class Simulator(object):
         This function can be used to measure expectation values more
         efficiently (emulation).
 
+        Args:
+            writable (bool): If True, the state vector returned for
+                copy=False can be modified in-place.
+            copy (bool): If False, the state vector is returned as a view of
+                the state of the simulator (i.e., no copy is made).
+
         Returns:
             A tuple where the first entry is a dictionary mapping qubit indices
             to bit-locations and the second entry is the corresponding state
-            vector
+            vector.
         """
-        return (self._map, self._state)
+        if copy:
+            return (dict(self._map), self._state.copy())
+        state = self._state.view()
+        state.flags.writeable = writable
+        return (self._map, state)
 
     def measure_qubits(self, ids):
         """
@@ -73,34 +200,48 @@ class Simulator(object):
             List of measurement results (containing either True or False).
         """
         P = random.random()
-        val = 0.
-        i_picked = 0
-        while val < P and i_picked < len(self._state):
-            val += _np.abs(self._state[i_picked]) ** 2
-            i_picked += 1
-
-        i_picked -= 1
+        cumulative = _np.cumsum(_np.abs(self._state) ** 2, dtype=_np.float64)
+        i_picked = min(int(_np.searchsorted(cumulative, P)),
+                       len(self._state) - 1)
 
         pos = [self._map[ID] for ID in ids]
-        res = [False] * len(pos)
+        res = [((i_picked >> p) & 1) == 1 for p in pos]
 
-        mask = 0
-        val = 0
-        for i in range(len(pos)):
-            res[i] = (((i_picked >> pos[i]) & 1) == 1)
-            mask |= (1 << pos[i])
-            val |= ((res[i] & 1) << pos[i])
-
-        nrm = 0.
-        for i in range(len(self._state)):
-            if (mask & i) != val:
-                self._state[i] = 0.
-            else:
-                nrm += _np.abs(self._state[i]) ** 2
-
-        self._state *= 1. / _np.sqrt(nrm)
+        self._collapse(pos, res)
         return res
 
+    def sample_qubits(self, ids, shots):
+        """
+        Sample measurement outcomes of the qubits with IDs ids without
+        collapsing the wavefunction.
+
+        The cumulative probability distribution is computed once and reused
+        for all samples.
+
+        Args:
+            ids (list<int>): List of qubit IDs to sample.
+            shots (int): Number of samples to draw.
+
+        Returns:
+            List of outcomes, where bit i of each outcome corresponds to the
+            qubit ids[i].
+
+        Raises:
+            RuntimeError if an unknown qubit id was provided.
+        """
+        if not all([ID in self._map for ID in ids]):
+            raise RuntimeError("sample(): Unknown qubit id(s) provided. Try "
+                               "calling eng.flush() before invoking this "
+                               "function.")
+        cumulative = _np.cumsum(_np.abs(self._state) ** 2, dtype=_np.float64)
+        rnds = _np.array([random.random() for _ in range(shots)])
+        picks = _np.minimum(_np.searchsorted(cumulative, rnds),
+                            len(self._state) - 1)
+        outcomes = _np.zeros(shots, dtype=_np.int64)
+        for i, ID in enumerate(ids):
+            outcomes |= ((picks >> self._map[ID]) & 1) << i
+        return outcomes.tolist()
+
     def allocate_qubit(self, ID):
         """
         Allocate a qubit.
@@ -110,7 +251,9 @@ class Simulator(object):
         """
         self._map[ID] = self._num_qubits
         self._num_qubits += 1
-        self._state.resize(1 << self._num_qubits)
+        newstate = _np.zeros(1 << self._num_qubits, dtype=self._dtype)
+        newstate[:len(self._state)] = self._state
+        self._state = newstate
 
     def get_classical_value(self, ID, tol=1.e-10):
         """
@@ -127,19 +270,14 @@ class Simulator(object):
                 been measured / uncomputed.
         """
         pos = self._map[ID]
-        up = down = False
-
-        for i in range(0, len(self._state), (1 << (pos + 1))):
-            for j in range(0, (1 << pos)):
-                if _np.abs(self._state[i + j]) > tol:
-                    up = True
-                if _np.abs(self._state[i + j + (1 << pos)]) > tol:
-                    down = True
-                if up and down:
-                    raise RuntimeError("Qubit has not been measured / "
-                                       "uncomputed. Cannot access its "
-                                       "classical value and/or deallocate a "
-                                       "qubit in superposition!")
+        state = self._state.reshape(-1, 2, 1 << pos)
+        up = bool(_np.any(_np.abs(state[:, 0, :]) > tol))
+        down = bool(_np.any(_np.abs(state[:, 1, :]) > tol))
+        if up and down:
+            raise RuntimeError("Qubit has not been measured / "
+                               "uncomputed. Cannot access its "
+                               "classical value and/or deallocate a "
+                               "qubit in superposition!")
         return down
 
     def deallocate_qubit(self, ID):
@@ -157,13 +295,8 @@ class Simulator(object):
 
         cv = self.get_classical_value(ID)
 
-        newstate = _np.zeros((1 << (self._num_qubits - 1)),
-                             dtype=_np.complex128)
-        k = 0
-        for i in range((1 << pos) * int(cv), len(self._state),
-                       (1 << (pos + 1))):
-            newstate[k:k + (1 << pos)] = self._state[i:i + (1 << pos)]
-            k += (1 << pos)
+        state = self._state.reshape(-1, 2, 1 << pos)
+        newstate = _np.ascontiguousarray(state[:, int(cv), :]).reshape(-1)
 
         newmap = dict()
         for key, value in self._map.items():
@@ -188,6 +321,74 @@ class Simulator(object):
             mask |= (1 << ctrlpos)
         return mask
 
+    def _get_index(self, positions, values):
+        """
+        Get an index into the state tensor (the state vector reshaped to
+        (2,) * num_qubits) which selects all amplitudes whose bits at
+        `positions` are equal to `values`.
+
+        Slices (instead of integers) are used so that the selected view keeps
+        one axis per qubit, with the axis of the qubit at bit-position p being
+        num_qubits - 1 - p.
+
+        Args:
+            positions (list[int]): Bit-positions of the qubits.
+            values (list[bool|int]): Value of each of the bits.
+
+        Returns:
+            A tuple of slices which can be used to index the state tensor.
+        """
+        index = [slice(None)] * self._num_qubits
+        for pos, value in zip(positions, values):
+            index[self._num_qubits - 1 - pos] = slice(int(value),
+                                                      int(value) + 1)
+        return tuple(index)
+
+    def _get_control_index(self, mask):
+        """
+        Get an index into the state tensor which selects all amplitudes for
+        which the control qubits in `mask` are 1 (see _get_index).
+
+        Args:
+            mask (int): Bit-mask where set bits indicate control qubits.
+        """
+        positions = [p for p in range(self._num_qubits) if (mask >> p) & 1]
+        return self._get_index(positions, [1] * len(positions))
+
+    def _get_state_tensor(self, state=None):
+        """
+        Return a view of the state vector as a tensor with one axis of
+        dimension 2 per qubit.
+
+        Args:
+            state (ndarray): State vector to reshape (defaults to the
+                current state vector of the simulator).
+        """
+        if state is None:
+            state = self._state
+        return state.reshape((2,) * self._num_qubits)
+
+    def _collapse(self, positions, values):
+        """
+        Project the state onto the subspace where the bits at `positions`
+        are equal to `values` and re-normalize.
+
+        Args:
+            positions (list[int]): Bit-positions of the qubits.
+            values (list[bool|int]): Value of each of the bits.
+
+        Returns:
+            The probability of the outcome prior to the collapse.
+        """
+        index = self._get_index(positions, values)
+        selected = self._get_state_tensor()[index]
+        nrm = _np.vdot(selected, selected).real
+        if nrm > 0.:
+            newstate = _np.zeros_like(self._state)
+            self._get_state_tensor(newstate)[index] = selected / _np.sqrt(nrm)
+            self._state = newstate
+        return nrm
+
     def emulate_math(self, f, qubit_ids, ctrlqubit_ids):
         """
         Emulate a math function (e.g., BasicMathGate).
@@ -229,6 +430,62 @@ class Simulator(object):
 
         self._state = newstate
 
+    def emulate_math_vectorized(self, f, qubit_ids, ctrlqubit_ids):
+        """
+        Emulate a math function which acts on whole arrays of register values
+        (e.g., BasicMathGate.get_vectorized_math_function).
+
+        Args:
+            f (function): Function which takes a list of numpy arrays (one
+                per register, each entry corresponding to one basis state)
+                and returns the list of output arrays.
+            qubit_ids (list<list<int>>): List of lists of qubit IDs to which
+                the gate is being applied.
+            ctrlqubit_ids (list<int>): List of control qubit ids.
+        """
+        mask = self._get_control_mask(ctrlqubit_ids)
+        qb_locs = [[self._map[qubit_id] for qubit_id in qureg]
+                   for qureg in qubit_ids]
+
+        indices = _np.arange(len(self._state), dtype=_np.int64)
+        indices = indices[(indices & mask) == mask]
+        values = []
+        for locs in qb_locs:
+            values.append(_np.zeros_like(indices))
+            for qb_i, loc in enumerate(locs):
+                values[-1] |= ((indices >> loc) & 1) << qb_i
+
+        res = f(values)
+        if len(res) != len(values):
+            raise ValueError("The math function returned a wrong number of "
+                             "outputs.")
+        new_indices = indices.copy()
+        for locs, value in zip(qb_locs, res):
+            value = _np.asarray(value, dtype=_np.int64)
+            for qb_i, loc in enumerate(locs):
+                new_indices &= ~(1 << loc)
+                new_indices |= ((value >> qb_i) & 1) << loc
+
+        newstate = self._state.copy()
+        newstate[indices] = 0.
+        newstate[new_indices] = self._state[indices]
+        self._state = newstate
+
+    def emulate_math_operations(self, operations, qubit_ids, ctrlqubit_ids):
+        """
+        Emulate a math gate given by a declarative description (see
+        BasicMathGate.get_math_operations).
+
+        Args:
+            operations (list<tuple>): Operations describing the gate.
+            qubit_ids (list<list<int>>): List of lists of qubit IDs to which
+                the gate is being applied.
+            ctrlqubit_ids (list<int>): List of control qubit ids.
+        """
+        self.emulate_math_vectorized(
+            lambda values: _apply_math_operations(operations, values),
+            qubit_ids, ctrlqubit_ids)
+
     def get_expectation_value(self, terms_dict, ids):
         """
         Return the expectation value of a qubit operator w.r.t. qubit ids.
@@ -239,16 +496,38 @@ class Simulator(object):
 
         Returns:
             Expectation value
+
+        Note:
+            Terms which flip the same qubits (i.e., which have the same X/Y
+            mask) are evaluated together, without copying the state vector.
         """
-        expectation = 0.
-        current_state = _np.copy(self._state)
+        positions = [self._map[ID] for ID in ids]
+        groups = dict()
         for (term, coefficient) in terms_dict:
-            self._apply_term(term, ids)
-            delta = coefficient * _np.vdot(current_state, self._state).real
-            expectation += delta
-            self._state = _np.copy(current_state)
+            flip_mask, sign_mask, num_y = _get_pauli_masks(term, positions)
+            groups.setdefault(flip_mask, []).append((sign_mask, num_y,
+                                                     coefficient))
+        indices = _np.arange(len(self._state))
+        expectation = 0.
+        for flip_mask, terms in groups.items():
+            products = _np.conj(self._state[indices ^ flip_mask]) * self._state
+            for sign_mask, num_y, coefficient in terms:
+                parity = self._get_parity(indices & sign_mask)
+                total = (_np.sum(products) -
+                         2 * _np.sum(products[parity])) * 1j ** num_y
+                expectation += coefficient * total.real
         return expectation
 
+    def _get_parity(self, values):
+        """
+        Return a boolean array which is True where the number of set bits of
+        the (state vector index) values is odd.
+        """
+        parity = _np.zeros(len(values), dtype=bool)
+        for pos in range(self._num_qubits):
+            parity ^= ((values >> pos) & 1).astype(bool)
+        return parity
+
     def apply_qubit_operator(self, terms_dict, ids):
         """
         Apply a (possibly non-unitary) qubit operator to qubits.
@@ -256,14 +535,27 @@ class Simulator(object):
         Args:
             terms_dict (dict): Operator dictionary (see QubitOperator.terms)
             ids (list[int]): List of qubit ids upon which the operator acts.
+
+        Note:
+            Terms which flip the same qubits (i.e., which have the same X/Y
+            mask) are applied together: Their phases are summed per basis
+            state and the state vector is permuted once per group (see
+            _get_pauli_masks), without copying the state vector per term.
         """
-        new_state = _np.zeros_like(self._state)
-        current_state = _np.copy(self._state)
+        positions = [self._map[ID] for ID in ids]
+        groups = dict()
         for (term, coefficient) in terms_dict:
-            self._apply_term(term, ids)
-            self._state *= coefficient
-            new_state += self._state
-            self._state = _np.copy(current_state)
+            flip_mask, sign_mask, num_y = _get_pauli_masks(term, positions)
+            groups.setdefault(flip_mask, []).append(
+                (sign_mask, coefficient * 1j ** num_y))
+        indices = _np.arange(len(self._state))
+        new_state = _np.zeros_like(self._state)
+        for flip_mask, terms in groups.items():
+            phases = _np.zeros(len(self._state), dtype=complex)
+            for sign_mask, coefficient in terms:
+                parity = self._get_parity(indices & sign_mask)
+                phases += _np.where(parity, -coefficient, coefficient)
+            new_state[indices ^ flip_mask] += phases * self._state
         self._state = new_state
 
     def get_probability(self, bit_string, ids):
@@ -286,17 +578,9 @@ class Simulator(object):
                 raise RuntimeError("get_probability(): Unknown qubit id. "
                                    "Please make sure you have called "
                                    "eng.flush().")
-        mask = 0
-        bit_str = 0
-        for i in range(len(ids)):
-            mask |= (1 << self._map[ids[i]])
-            bit_str |= (bit_string[i] << self._map[ids[i]])
-        probability = 0.
-        for i in range(len(self._state)):
-            if (i & mask) == bit_str:
-                e = self._state[i]
-                probability += e.real**2 + e.imag**2
-        return probability
+        index = self._get_index([self._map[ID] for ID in ids], bit_string)
+        selected = self._get_state_tensor()[index]
+        return _np.vdot(selected, selected).real
 
     def get_amplitude(self, bit_string, ids):
         """
@@ -351,8 +635,9 @@ class Simulator(object):
         s = int(op_nrm + 1.)
         correction = _np.exp(-1j * time * tr / float(s))
         output_state = _np.copy(self._state)
-        mask = self._get_control_mask(ctrlids)
-        for i in range(s):
+        ctrl_index = self._get_control_index(self._get_control_mask(ctrlids))
+        output_tensor = self._get_state_tensor(output_state)
+        for _ in range(s):
             j = 0
             nrm_change = 1.
             while nrm_change > 1.e-12:
@@ -366,24 +651,110 @@ class Simulator(object):
                     self._state = _np.copy(current_state)
                 update *= coeff
                 self._state = update
-                for i in range(len(update)):
-                    if (i & mask) == mask:
-                        output_state[i] += update[i]
+                output_tensor[ctrl_index] += \
+                    self._get_state_tensor(update)[ctrl_index]
                 nrm_change = _np.linalg.norm(update)
                 j += 1
-            for i in range(len(update)):
-                if (i & mask) == mask:
-                    output_state[i] *= correction
+            output_tensor[ctrl_index] *= correction
             self._state = _np.copy(output_state)
 
+    def compile_hamiltonian(self, terms_dict):
+        """
+        Precompile a Hamiltonian for emulate_time_evolution_chebyshev.
+
+        Terms which flip the same qubits (see _get_pauli_masks) are grouped,
+        with the masks referring to the index of the qubit in the term (i.e.,
+        independent of the current ordering of the qubits).
+
+        Args:
+            terms_dict (dict): Operator dictionary (see QubitOperator.terms)
+                defining the Hamiltonian.
+
+        Returns:
+            Tuple (trace, norm, num_qubits, groups), where trace is the sum
+            of the coefficients of the identity terms, norm the sum of the
+            absolute values of all other coefficients and each group is a
+            tuple (flip_mask, sign_masks, coefficients).
+        """
+        trace = norm = 0.
+        num_qubits = 0
+        groups = dict()
+        for (term, coefficient) in terms_dict:
+            if len(term) == 0:
+                trace += coefficient
+                continue
+            flip_mask, sign_mask, num_y = _get_pauli_masks(term, range(64))
+            signs, coefficients = groups.setdefault(flip_mask, ([], []))
+            signs.append(sign_mask)
+            coefficients.append(coefficient * 1j ** num_y)
+            norm += abs(coefficient)
+            num_qubits = max([num_qubits] + [idx + 1 for idx, _ in term])
+        return (trace, norm, num_qubits,
+                [(flip_mask, signs, coefficients) for
+                 flip_mask, (signs, coefficients) in groups.items()])
+
+    def emulate_time_evolution_chebyshev(self, hamiltonian, time, ids,
+                                         ctrlids, tolerance):
+        """
+        Applies exp(-i*time*H) to the wave function, using the Chebyshev
+        expansion of the exponential in the rescaled Hamiltonian
+        (H - trace) / norm, truncated at the given tolerance.
+
+        Args:
+            hamiltonian (tuple): Hamiltonian H, as returned by
+                compile_hamiltonian.
+            time (scalar): Time to evolve for
+            ids (list): A list of qubit IDs to which to apply the evolution.
+            ctrlids (list): A list of control qubit IDs.
+            tolerance (float): Truncation threshold of the expansion.
+        """
+        trace, norm, num_qubits, groups = hamiltonian
+        if num_qubits > len(ids):
+            raise RuntimeError("emulate_time_evolution(): The Hamiltonian "
+                               "acts on more qubits than provided.")
+        positions = [self._map[ID] for ID in ids]
+
+        def to_positions(mask):
+            return sum(((mask >> l) & 1) << positions[l]
+                       for l in range(len(positions)))
+
+        indices = _np.arange(len(self._state))
+        terms = [(to_positions(flip_mask), [to_positions(m) for m in signs],
+                  coefficients) for flip_mask, signs, coefficients in groups]
+
+        def apply_hamiltonian(state):
+            result = _np.zeros_like(state)
+            for flip_mask, signs, coefficients in terms:
+                phases = _np.zeros(len(state), dtype=complex)
+                for sign_mask, coefficient in zip(signs, coefficients):
+                    parity = self._get_parity(indices & sign_mask)
+                    phases += _np.where(parity, -coefficient, coefficient)
+                result[indices ^ flip_mask] += phases * state
+            return result / norm
+
+        coefficients = _get_chebyshev_coefficients(norm * time, tolerance)
+        ctrlmask = self._get_control_mask(ctrlids)
+        selected = (indices & ctrlmask) == ctrlmask
+        t_prev = _np.where(selected, self._state, 0.)
+        output = _np.where(selected, coefficients[0] * self._state,
+                           self._state)
+        if len(coefficients) > 1:
+            t_cur = apply_hamiltonian(t_prev)
+            output += coefficients[1] * t_cur
+        for coefficient in coefficients[2:]:
+            t_prev, t_cur = t_cur, 2. * apply_hamiltonian(t_cur) - t_prev
+            output += coefficient * t_cur
+        output[selected] *= _np.exp(-1j * time * trace)
+        self._state = output.astype(self._dtype)
+
     def apply_controlled_gate(self, m, ids, ctrlids):
         """
         Applies the k-qubit gate matrix m to the qubits with indices ids,
         using ctrlids as control qubits.
 
         Args:
-            m (list[list]): 2^k x 2^k complex matrix describing the k-qubit
-                gate.
+            m (list[list]|numpy.ndarray): 2^k x 2^k complex matrix describing
+                the k-qubit gate.
             ids (list): A list containing the qubit IDs to which to apply the
                 gate.
             ctrlids (list): A list of control qubit IDs (i.e., the gate is
@@ -397,6 +768,33 @@ class Simulator(object):
             pos = [self._map[ID] for ID in ids]
             self._multi_qubit_gate(m, pos, mask)
 
+    def apply_diagonal_gate(self, diag, ids, ctrlids):
+        """
+        Applies the k-qubit diagonal gate with diagonal diag to the qubits
+        with indices ids, using ctrlids as control qubits.
+
+        Args:
+            diag (list[complex]|numpy.ndarray): The 2^k diagonal entries of
+                the gate matrix.
+            ids (list): A list containing the qubit IDs to which to apply the
+                gate.
+            ctrlids (list): A list of control qubit IDs (i.e., the gate is
+                only applied where these qubits are 1).
+        """
+        k = len(ids)
+        state = self._get_state_tensor()[self._get_control_index(
+            self._get_control_mask(ctrlids))]
+        # the most significant bit of the diagonal index corresponds to
+        # ids[-1]; reorder the axes of the diagonal to match the state tensor
+        # and broadcast along all other axes
+        axes = [self._num_qubits - 1 - self._map[ID] for ID in reversed(ids)]
+        phases = _np.asarray(diag, dtype=self._dtype).reshape((2,) * k)
+        phases = _np.transpose(phases, _np.argsort(axes))
+        shape = [1] * self._num_qubits
+        for axis in axes:
+            shape[axis] = 2
+        state *= phases.reshape(shape)
+
     def _single_qubit_gate(self, m, pos, mask):
         """
         Applies the single qubit gate matrix m to the qubit at position `pos`
@@ -408,53 +806,38 @@ class Simulator(object):
             pos (int): Bit-position of the qubit.
             mask (int): Bit-mask where set bits indicate control qubits.
         """
-        def kernel(u, d, m):
-            return u * m[0][0] + d * m[0][1], u * m[1][0] + d * m[1][1]
-
-        for i in range(0, len(self._state), (1 << (pos + 1))):
-            for j in range(1 << pos):
-                if ((i + j) & mask) == mask:
-                    id1 = i + j
-                    id2 = id1 + (1 << pos)
-                    self._state[id1], self._state[id2] = kernel(
-                        self._state[id1],
-                        self._state[id2],
-                        m)
+        if mask == 0:
+            state = self._state.reshape(-1, 2, 1 << pos)
+        else:
+            state = self._get_state_tensor()[self._get_control_index(mask)]
+            state = _np.moveaxis(state, self._num_qubits - 1 - pos, 0)
+            state = state[_np.newaxis]
+        up = _np.copy(state[:, 0])
+        down = state[:, 1]
+        state[:, 0] = m[0][0] * up + m[0][1] * down
+        state[:, 1] = m[1][0] * up + m[1][1] * down
 
     def _multi_qubit_gate(self, m, pos, mask):
         """
         Applies the k-qubit gate matrix m to the qubits at `pos`
         using `mask` to identify control qubits.
 
+        The gate is applied by contracting the (reshaped) gate matrix with
+        the corresponding axes of the state tensor.
+
         Args:
             m (list[list]): 2^k x 2^k complex matrix describing the k-qubit
                 gate.
             pos (list[int]): List of bit-positions of the qubits.
             mask (int): Bit-mask where set bits indicate control qubits.
         """
-        # follows the description in https://arxiv.org/abs/1704.01127
-        inactive = [p for p in range(len(self._map)) if p not in pos]
-
-        matrix = _np.matrix(m)
-        subvec = _np.zeros(1 << len(pos), dtype=complex)
-        subvec_idx = [0] * len(subvec)
-        for c in range(1 << len(inactive)):
-            # determine base index (state of inactive qubits)
-            base = 0
-            for i in range(len(inactive)):
-                base |= ((c >> i) & 1) << inactive[i]
-            # check the control mask
-            if mask != (base & mask):
-                continue
-            # now gather all elements involved in mat-vec mul
-            for x in range(len(subvec_idx)):
-                offset = 0
-                for i in range(len(pos)):
-                    offset |= ((x >> i) & 1) << pos[i]
-                subvec_idx[x] = base | offset
-                subvec[x] = self._state[subvec_idx[x]]
-            # perform mat-vec mul
-            self._state[subvec_idx] = matrix.dot(subvec)
+        k = len(pos)
+        state = self._get_state_tensor()[self._get_control_index(mask)]
+        # the most significant bit of the matrix index corresponds to pos[-1]
+        axes = [self._num_qubits - 1 - p for p in reversed(pos)]
+        matrix = _np.asarray(m, dtype=self._dtype).reshape((2,) * (2 * k))
+        res = _np.tensordot(matrix, state, axes=(list(range(k, 2 * k)), axes))
+        state[...] = _np.moveaxis(res, list(range(k)), axes)
 
     def set_wavefunction(self, wavefunction, ordering):
         """
@@ -475,7 +858,7 @@ class Simulator(object):
                                " Please make sure all qubits have been "
                                "allocated previously (call eng.flush()).")
 
-        self._state = _np.array(wavefunction, dtype=_np.complex128)
+        self._state = _np.array(wavefunction, dtype=self._dtype)
         self._map = {ordering[i]: i for i in range(len(ordering))}
 
     def collapse_wavefunction(self, ids, values):
@@ -496,25 +879,13 @@ class Simulator(object):
             raise RuntimeError("collapse_wavefunction(): Unknown qubit id(s)"
                                " provided. Try calling eng.flush() before "
                                "invoking this function.")
-        mask = 0
-        val = 0
-        for i in range(len(ids)):
-            pos = self._map[ids[i]]
-            mask |= (1 << pos)
-            val |= (int(values[i]) << pos)
-        nrm = 0.
-        for i in range(len(self._state)):
-            if (mask & i) == val:
-                nrm += _np.abs(self._state[i]) ** 2
-        if nrm < 1.e-12:
+        pos = [self._map[ID] for ID in ids]
+        index = self._get_index(pos, values)
+        selected = self._get_state_tensor()[index]
+        if _np.vdot(selected, selected).real < 1.e-12:
             raise RuntimeError("collapse_wavefunction(): Invalid collapse! "
                                "Probability is ~0.")
-        inv_nrm = 1. / _np.sqrt(nrm)
-        for i in range(len(self._state)):
-            if (mask & i) != val:
-                self._state[i] = 0.
-            else:
-                self._state[i] *= inv_nrm
+        self._collapse(pos, values)
 
     def run(self):
         """
@@ -522,6 +893,29 @@ class Simulator(object):
         """
         pass
 
+    def get_rng_state(self):
+        """
+        Return the state of the random number generator as a string.
+        """
+        return json.dumps(random.getstate())
+
+    def set_rng_state(self, state):
+        """
+        Restore the state of the random number generator.
+
+        Args:
+            state (str): State as returned by get_rng_state.
+        """
+        version, internal_state, gauss_next = json.loads(state)
+        random.setstate((version, tuple(internal_state), gauss_next))
+
+    def set_fusion_policy(self, min_qubits, max_qubits, lookahead):
+        """
+        Dummy function to implement the same interface as the c++ simulator
+        (the Python simulator does not fuse gates).
+        """
+        pass
+
     def _apply_term(self, term, ids, ctrlids=[]):
         """
         Applies a QubitOperator term to the state vector.
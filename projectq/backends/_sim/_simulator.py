@@ -18,8 +18,11 @@ built first. If the c++ simulator is not exported to python, a (slow) python
 implementation is used as an alternative.
 """
 
+import json
 import math
 import random
+import struct
+import numpy as np
 from projectq.cengines import BasicEngine
 from projectq.meta import get_control_count, LogicalQubitIDTag
 from projectq.ops import (NOT,
@@ -33,9 +36,17 @@ from projectq.ops import (NOT,
                           TimeEvolution)
 from projectq.types import WeakQubitRef
 
+# Layout of the files written by Simulator.save_state: magic number, length of
+# the (JSON) header, header, padding, raw amplitudes (aligned to 64 bytes)
+_STATE_FILE_MAGIC = b'PQSTATE1'
+_STATE_FILE_ALIGNMENT = 64
+# Number of amplitudes which load_state converts at once
+_STATE_FILE_CHUNK_SIZE = 1 << 16
+
 FALLBACK_TO_PYSIM = False
 try:
-    from ._cppsim import Simulator as SimulatorBackend
+    from ._cppsim import (Simulator as SimulatorBackend,
+                          SinglePrecisionSimulator as SinglePrecisionBackend)
 except ImportError:
     from ._pysim import Simulator as SimulatorBackend
     FALLBACK_TO_PYSIM = True
@@ -54,17 +65,45 @@ class Simulator(BasicEngine):
         export OMP_NUM_THREADS=4 # use 4 threads
         export OMP_PROC_BIND=spread # bind threads to processors by spreading
     """
-    def __init__(self, gate_fusion=False, rnd_seed=None):
+    def __init__(self, gate_fusion=False, rnd_seed=None, precision='double',
+                 time_evolution='taylor'):
         """
         Construct the C++/Python-simulator object and initialize it with a
         random seed.
 
         Args:
-            gate_fusion (bool): If True, gates are cached and only executed
-                once a certain gate-size has been reached (only has an effect
-                for the c++ simulator).
+            gate_fusion (bool|dict): If True, gates are cached and only
+                executed once a certain gate-size has been reached (only has
+                an effect for the c++ simulator). A dictionary enables gate
+                fusion with a custom policy, with the (optional) keys
+
+                * 'min_qubits' (int): Fused gates are executed as soon as
+                  they act on at least this many qubits (default: 4 or
+                  max_qubits if smaller).
+                * 'max_qubits' (int): Maximal number of qubits of a fused gate
+                  (at most 5, default: 5).
+                * 'lookahead' (int): If larger than 0, the simulator queues
+                  this many gates and chooses the fusion blocks with the
+                  lowest estimated cost (in terms of passes over the state
+                  vector) for the entire window, instead of fusing greedily.
+                  'min_qubits' is ignored in this case (default: 0).
             rnd_seed (int): Random seed (uses random.randint(0, 4294967295) by
                 default).
+            precision (str): Floating point precision of the state vector,
+                either 'double' (complex128, default) or 'single'
+                (complex64). Single precision halves the memory footprint
+                (i.e., allows to simulate one more qubit) and speeds up
+                memory-bound gates, at the cost of an accuracy of about
+                1e-7.
+            time_evolution (str|dict): Method to emulate TimeEvolution gates,
+                either 'taylor' (truncated Taylor series, default) or
+                'chebyshev' (Chebyshev expansion, which needs far fewer
+                applications of the Hamiltonian for long times). A dictionary
+                with the keys 'method' and 'tolerance' (truncation threshold
+                of the Chebyshev expansion, default: 1e-12) allows to set the
+                tolerance. The Chebyshev method compiles each Hamiltonian
+                once and reuses it for all TimeEvolution gates with the same
+                Hamiltonian.
 
         Example of gate_fusion: Instead of applying a Hadamard gate to 5
         qubits, the simulator calculates the kronecker product of the 1-qubit
@@ -73,6 +112,12 @@ class Simulator(BasicEngine):
         through the state vector multiple times. Depending on the system (and,
         especially, number of threads), this may or may not be beneficial.
 
+        Example of a gate fusion policy for deep circuits:
+
+        .. code-block:: python
+
+            Simulator(gate_fusion={'max_qubits': 4, 'lookahead': 32})
+
         Note:
             If the C++ Simulator extension was not built or cannot be found,
             the Simulator defaults to a Python implementation of the kernels.
@@ -85,9 +130,45 @@ class Simulator(BasicEngine):
         """
         if rnd_seed is None:
             rnd_seed = random.randint(0, 4294967295)
+        if precision not in ('single', 'double'):
+            raise ValueError("Unknown precision '{}', expected 'single' or "
+                             "'double'.".format(precision))
         BasicEngine.__init__(self)
-        self._simulator = SimulatorBackend(rnd_seed)
-        self._gate_fusion = gate_fusion
+        if precision == 'double':
+            self._simulator = SimulatorBackend(rnd_seed)
+        elif FALLBACK_TO_PYSIM:
+            self._simulator = SimulatorBackend(rnd_seed, precision=precision)
+        else:
+            self._simulator = SinglePrecisionBackend(rnd_seed)
+        if isinstance(gate_fusion, dict):
+            policy = {'min_qubits': 4, 'max_qubits': 5, 'lookahead': 0}
+            unknown = set(gate_fusion) - set(policy)
+            if unknown:
+                raise ValueError("Unknown gate fusion option(s): {}"
+                                 .format(", ".join(sorted(unknown))))
+            policy.update(gate_fusion)
+            if 'min_qubits' not in gate_fusion:
+                policy['min_qubits'] = min(4, policy['max_qubits'])
+            self._simulator.set_fusion_policy(policy['min_qubits'],
+                                              policy['max_qubits'],
+                                              policy['lookahead'])
+        self._gate_fusion = bool(gate_fusion)
+
+        if not isinstance(time_evolution, dict):
+            time_evolution = {'method': time_evolution}
+        evolution = {'method': 'taylor', 'tolerance': 1.e-12}
+        unknown = set(time_evolution) - set(evolution)
+        if unknown:
+            raise ValueError("Unknown time evolution option(s): {}"
+                             .format(", ".join(sorted(unknown))))
+        evolution.update(time_evolution)
+        if evolution['method'] not in ('taylor', 'chebyshev'):
+            raise ValueError("Unknown time evolution method '{}', expected "
+                             "'taylor' or 'chebyshev'."
+                             .format(evolution['method']))
+        self._time_evolution = evolution
+        # recently compiled Hamiltonians, as tuples (terms, compiled)
+        self._hamiltonians = []
 
     def is_available(self, cmd):
         """
@@ -243,6 +324,48 @@ class Simulator(BasicEngine):
         return self._simulator.get_probability(bit_string,
                                                [qb.id for qb in qureg])
 
+    def sample(self, qureg, shots, counts=True):
+        """
+        Draw `shots` measurement samples of the quantum register `qureg`
+        without collapsing the wavefunction.
+
+        The probability distribution is only computed once for all samples,
+        which is much faster than re-running the circuit for every shot.
+
+        Args:
+            qureg (Qureg|list[Qubit]): Quantum register to sample.
+            shots (int): Number of samples to draw.
+            counts (bool): If True, return a dictionary of counts. Otherwise,
+                return the individual samples as a numpy array.
+
+        Returns:
+            If `counts` is True, a dictionary mapping bit-strings (where the
+            i-th character corresponds to qureg[i], as in get_probability) to
+            the number of times they have been sampled. Otherwise, a boolean
+            numpy array of shape (shots, len(qureg)) where entry [k, i] is
+            the outcome of qureg[i] in the k-th sample.
+
+        Note:
+            Make sure all previous commands (especially allocations) have
+            passed through the compilation chain (call main_engine.flush() to
+            make sure).
+
+        Note:
+            If there is a mapper present in the compiler, this function
+            automatically converts from logical qubits to mapped qubits for
+            the qureg argument.
+        """
+        qureg = self._convert_logical_to_mapped_qureg(qureg)
+        outcomes = np.array(self._simulator.sample_qubits(
+            [qb.id for qb in qureg], shots), dtype=np.int64)
+        if not counts:
+            return ((outcomes[:, np.newaxis] >> np.arange(len(qureg))) &
+                    1).astype(bool)
+        values, occurrences = np.unique(outcomes, return_counts=True)
+        return {"".join(str((int(value) >> i) & 1)
+                        for i in range(len(qureg))): int(occurrence)
+                for value, occurrence in zip(values, occurrences)}
+
     def get_amplitude(self, bit_string, qureg):
         """
         Return the probability amplitude of the supplied `bit_string`.
@@ -280,8 +403,11 @@ class Simulator(BasicEngine):
         the wavefunction).
 
         Args:
-            wavefunction (list[complex]): Array of complex amplitudes
-                describing the wavefunction (must be normalized).
+            wavefunction (list[complex]|numpy.ndarray): Array of complex
+                amplitudes describing the wavefunction (must be normalized).
+                A contiguous numpy array of the simulator's precision
+                (complex128 by default) is copied into the simulator
+                directly, without any conversion.
             qureg (Qureg|list[Qubit]): Quantum register determining the
                 ordering. Must contain all allocated qubits.
 
@@ -326,28 +452,150 @@ class Simulator(BasicEngine):
                                                      [bool(int(v)) for v in
                                                       values])
 
-    def cheat(self):
+    def cheat(self, writable=False, copy=True):
         """
         Access the ordering of the qubits and the state vector directly.
 
         This is a cheat function which enables, e.g., more efficient
         evaluation of expectation values and debugging.
 
+        Args:
+            writable (bool): If True, the state vector returned for
+                copy=False can be modified in-place (default: False, i.e.,
+                read-only).
+            copy (bool): If False, the state vector refers to the memory of
+                the simulator instead of being copied (default: True).
+
         Returns:
             A tuple where the first entry is a dictionary mapping qubit
             indices to bit-locations and the second entry is the corresponding
-            state vector.
+            state vector as a numpy array.
 
         Note:
             Make sure all previous commands have passed through the
             compilation chain (call main_engine.flush() to make sure).
 
+        Note:
+            The state vector returned for copy=False is only valid until the
+            simulator receives the next command, which may reallocate the
+            state vector. Accessing it afterwards can crash the interpreter.
+
         Note:
             If there is a mapper present in the compiler, this function
             DOES NOT automatically convert from logical qubits to mapped
             qubits.
         """
-        return self._simulator.cheat()
+        return self._simulator.cheat(writable, copy)
+
+    def save_state(self, path):
+        """
+        Save the state of the simulator to a file.
+
+        The file contains the mapping of the qubits, the state of the random
+        number generator and the raw amplitudes, which are written directly
+        from the memory of the simulator (without copying the state vector).
+
+        Args:
+            path (str): Path of the file to write.
+
+        Note:
+            Make sure all previous commands have passed through the
+            compilation chain (call main_engine.flush() to make sure).
+        """
+        mapping, state = self._simulator.cheat(copy=False)
+        header = json.dumps({'dtype': state.dtype.str,
+                             'num_amplitudes': len(state),
+                             'mapping': {str(k): v
+                                         for k, v in mapping.items()},
+                             'rng_state': self._simulator.get_rng_state()})
+        header = header.encode('utf-8')
+        offset = len(_STATE_FILE_MAGIC) + 8 + len(header)
+        padding = -offset % _STATE_FILE_ALIGNMENT
+        with open(path, 'wb') as f:
+            f.write(_STATE_FILE_MAGIC)
+            f.write(struct.pack('<Q', len(header)))
+            f.write(header)
+            f.write(b'\0' * padding)
+            state.tofile(f)
+
+    def load_state(self, path):
+        """
+        Restore the state of the simulator from a file written by save_state.
+
+        The amplitudes are memory-mapped and copied (and converted to the
+        precision of the simulator) into the state vector chunk by chunk,
+        i.e., the state vector is never held in memory twice.
+
+        Note:
+            The qubits of the saved state (i.e., qubits with the same IDs)
+            have to be allocated and the engine has to be flushed before
+            calling load_state (as for set_wavefunction).
+
+        Args:
+            path (str): Path of the file to read.
+
+        Raises:
+            RuntimeError: If the file is not a state file, if the simulator
+                does not hold exactly the qubits of the saved state, or if the
+                qubits are ordered differently and the precision of the saved
+                state differs.
+        """
+        with open(path, 'rb') as f:
+            if f.read(len(_STATE_FILE_MAGIC)) != _STATE_FILE_MAGIC:
+                raise RuntimeError("load_state(): {} is not a simulator "
+                                   "state file.".format(path))
+            header_length = struct.unpack('<Q', f.read(8))[0]
+            header = json.loads(f.read(header_length).decode('utf-8'))
+        offset = len(_STATE_FILE_MAGIC) + 8 + header_length
+        offset += -offset % _STATE_FILE_ALIGNMENT
+        state = np.memmap(path, dtype=np.dtype(header['dtype']), mode='r',
+                          offset=offset, shape=(header['num_amplitudes'],))
+        mapping = {int(k): v for k, v in header['mapping'].items()}
+        ordering = sorted(mapping, key=lambda qb_id: mapping[qb_id])
+
+        if set(self._simulator.cheat(copy=False)[0]) != set(mapping):
+            raise RuntimeError("load_state(): The simulator does not hold "
+                               "the qubits of the saved state (IDs {}). "
+                               "Allocate them and call eng.flush() before "
+                               "restoring the state.".format(sorted(mapping)))
+
+        current_mapping, current_state = self._simulator.cheat(
+            writable=True, copy=False)
+        if current_mapping == mapping:
+            for start in range(0, len(state), _STATE_FILE_CHUNK_SIZE):
+                stop = start + _STATE_FILE_CHUNK_SIZE
+                current_state[start:stop] = state[start:stop]
+        elif state.dtype == current_state.dtype:
+            del current_state
+            self._simulator.set_wavefunction(state, ordering)
+        else:
+            raise RuntimeError("load_state(): The saved state cannot be "
+                               "converted to the precision of the simulator "
+                               "since the qubits are ordered differently.")
+        self._simulator.set_rng_state(header['rng_state'])
+
+    def _get_compiled_hamiltonian(self, hamiltonian):
+        """
+        Return the compiled version of a Hamiltonian (see
+        compile_hamiltonian of the C++/Python simulator).
+
+        The most recently used Hamiltonians are cached. They are compared by
+        their terms, since each TimeEvolution gate holds its own copy of the
+        Hamiltonian.
+
+        Args:
+            hamiltonian (QubitOperator): Hamiltonian to compile.
+        """
+        for i, (terms, compiled) in enumerate(self._hamiltonians):
+            if terms == hamiltonian.terms:
+                self._hamiltonians.insert(0, self._hamiltonians.pop(i))
+                return compiled
+        op = [(list(term), coeff) for (term, coeff)
+              in hamiltonian.terms.items()]
+        compiled = self._simulator.compile_hamiltonian(op)
+        self._hamiltonians.insert(0, (dict(hamiltonian.terms), compiled))
+        del self._hamiltonians[8:]
+        return compiled
 
     def _handle(self, cmd):
         """
@@ -386,41 +634,40 @@ class Simulator(BasicEngine):
             ID = cmd.qubits[0][0].id
             self._simulator.deallocate_qubit(ID)
         elif isinstance(cmd.gate, BasicMathGate):
-            # improve performance by using C++ code for some commomn gates
-            from projectq.libs.math import (AddConstant,
-                                            AddConstantModN,
-                                            MultiplyByConstantModN)
             qubitids = []
             for qr in cmd.qubits:
                 qubitids.append([])
                 for qb in qr:
                     qubitids[-1].append(qb.id)
-            if FALLBACK_TO_PYSIM:
-                math_fun = cmd.gate.get_math_function(cmd.qubits)
-                self._simulator.emulate_math(math_fun, qubitids,
-                                             [qb.id for qb in cmd.control_qubits])
+            ctrlids = [qb.id for qb in cmd.control_qubits]
+            # prefer native and vectorized evaluation over calling the math
+            # function once per basis state
+            operations = cmd.gate.get_math_operations(cmd.qubits)
+            math_fun = cmd.gate.get_vectorized_math_function(cmd.qubits)
+            if operations is not None:
+                self._simulator.emulate_math_operations(operations, qubitids,
+                                                        ctrlids)
+            elif math_fun is not None:
+                self._simulator.emulate_math_vectorized(math_fun, qubitids,
+                                                        ctrlids)
             else:
-                # individual code for different standard gates to make it faster!
-                if isinstance(cmd.gate, AddConstant):
-                    self._simulator.emulate_math_addConstant(cmd.gate.a, qubitids,
-                                                             [qb.id for qb in cmd.control_qubits])
-                elif isinstance(cmd.gate, AddConstantModN):
-                    self._simulator.emulate_math_addConstantModN(cmd.gate.a, cmd.gate.N, qubitids,
-                                                                 [qb.id for qb in cmd.control_qubits])
-                elif isinstance(cmd.gate, MultiplyByConstantModN):
-                    self._simulator.emulate_math_multiplyByConstantModN(cmd.gate.a, cmd.gate.N, qubitids,
-                                                                        [qb.id for qb in cmd.control_qubits])
-                else:
-                    math_fun = cmd.gate.get_math_function(cmd.qubits)
-                    self._simulator.emulate_math(math_fun, qubitids,
-                                                 [qb.id for qb in cmd.control_qubits])
+                math_fun = cmd.gate.get_math_function(cmd.qubits)
+                self._simulator.emulate_math(math_fun, qubitids, ctrlids)
         elif isinstance(cmd.gate, TimeEvolution):
-            op = [(list(term), coeff) for (term, coeff)
-                  in cmd.gate.hamiltonian.terms.items()]
             t = cmd.gate.time
             qubitids = [qb.id for qb in cmd.qubits[0]]
             ctrlids = [qb.id for qb in cmd.control_qubits]
-            self._simulator.emulate_time_evolution(op, t, qubitids, ctrlids)
+            if self._time_evolution['method'] == 'chebyshev':
+                hamiltonian = self._get_compiled_hamiltonian(
+                    cmd.gate.hamiltonian)
+                self._simulator.emulate_time_evolution_chebyshev(
+                    hamiltonian, t, qubitids, ctrlids,
+                    self._time_evolution['tolerance'])
+            else:
+                op = [(list(term), coeff) for (term, coeff)
+                      in cmd.gate.hamiltonian.terms.items()]
+                self._simulator.emulate_time_evolution(op, t, qubitids,
+                                                       ctrlids)
         elif len(cmd.gate.matrix) <= 2 ** 5:
             matrix = cmd.gate.matrix
             ids = [qb.id for qr in cmd.qubits for qb in qr]
@@ -430,10 +677,21 @@ class Simulator(BasicEngine):
                                     str(cmd.gate),
                                     int(math.log(len(cmd.gate.matrix), 2)),
                                     len(ids)))
-            self._simulator.apply_controlled_gate(matrix.tolist(),
-                                                  ids,
-                                                  [qb.id for qb in
-                                                   cmd.control_qubits])
+            # gate matrices are (cached) C-contiguous complex arrays which
+            # are passed to the simulator without conversion
+            matrix = np.ascontiguousarray(matrix, dtype=complex)
+            diagonal = np.diagonal(matrix)
+            if np.count_nonzero(matrix) == np.count_nonzero(diagonal):
+                # diagonal gates only multiply amplitudes by phases
+                self._simulator.apply_diagonal_gate(diagonal,
+                                                    ids,
+                                                    [qb.id for qb in
+                                                     cmd.control_qubits])
+            else:
+                self._simulator.apply_controlled_gate(matrix,
+                                                      ids,
+                                                      [qb.id for qb in
+                                                       cmd.control_qubits])
             if not self._gate_fusion:
                 self._simulator.run()
         else:
@@ -456,5 +714,5 @@ class Simulator(BasicEngine):
                 self._handle(cmd)
             else:
                 self._simulator.run()  # flush gate --> run all saved gates
-            if not self.is_last_engine:
-                self.send([cmd])
+        if not self.is_last_engine:
+            self.send(command_list)
@@ -17,6 +17,7 @@ Tests for projectq.backends._sim._simulator.py, using both the Python
 and the C++ simulator as backends.
 """
 
+import cmath
 import copy
 import math
 import numpy
@@ -31,7 +32,8 @@ from projectq.cengines import (BasicEngine, BasicMapperEngine, DummyEngine,
                                LocalOptimizer, NotYetMeasuredError)
 from projectq.ops import (All, Allocate, BasicGate, BasicMathGate, CNOT,
                           Command, H, MatrixGate, Measure, QubitOperator,
-                          Rx, Ry, Rz, S, TimeEvolution, Toffoli, X, Y, Z)
+                          R, Rx, Ry, Rz, Rzz, S, T, TimeEvolution, Toffoli,
+                          X, Y, Z)
 from projectq.meta import Control, Dagger, LogicalQubitIDTag
 from projectq.types import WeakQubitRef
 
@@ -235,6 +237,81 @@ def test_simulator_emulation(sim):
     All(Measure) | (qubit1 + qubit2 + qubit3)
 
 
+class OperationsGate(BasicMathGate):
+    def __init__(self, operations, math_fun):
+        BasicMathGate.__init__(self, math_fun)
+        self.operations = operations
+
+    def get_math_operations(self, qubits):
+        return self.operations
+
+
+@pytest.mark.parametrize("operations, math_fun", [
+    ([('add', 0, 1)], lambda a, b, c: (a + b, b, c)),
+    ([('sub', 2, 0)], lambda a, b, c: (a, b, c - a)),
+    ([('add_mod', 1, 2, 8)], lambda a, b, c: (a, (b + c) % 8, c)),
+    ([('multiply_add', 2, 0, 1)], lambda a, b, c: (a, b, c + a * b)),
+    ([('less_than', 0, 1, 2)], lambda a, b, c: (a ^ (b < c), b, c)),
+    ([('add_constant', 1, -3)], lambda a, b, c: (a, b - 3, c)),
+    ([('add_constant_mod', 0, 5, 8)], lambda a, b, c: ((a + 5) % 8, b, c)),
+    ([('multiply_constant_mod', 2, 3, 8)], lambda a, b, c: (a, b, 3 * c % 8)),
+    # not bijective on the register values >= N (several basis states are
+    # mapped to the same one)
+    ([('add_constant_mod', 0, 5, 6)], lambda a, b, c: ((a + 5) % 6, b, c)),
+    ([('multiply_constant_mod', 2, 3, 6)], lambda a, b, c: (a, b, 3 * c % 6)),
+    ([('add', 0, 1), ('multiply_add', 1, 0, 2)],
+     lambda a, b, c: (a + b, b + (a + b) * c, c))])
+def test_simulator_emulate_math_operations(sim, operations, math_fun):
+    reference = Simulator()
+    reference._simulator = type(sim._simulator)(1)
+    wavefunctions = []
+    for backend, gate in [(sim, OperationsGate(operations, None)),
+                          (reference, BasicMathGate(math_fun))]:
+        eng = MainEngine(backend, [])
+        qureg = eng.allocate_qureg(9)
+        ctrl = eng.allocate_qubit()
+        random.seed(3)
+        for qb in qureg + ctrl:
+            Ry(random.random() * 3) | qb
+        with Control(eng, ctrl):
+            gate | (qureg[:3], qureg[3:6], qureg[6:])
+        eng.flush()
+        wavefunctions.append(numpy.array(backend.cheat()[1]))
+        All(Measure) | qureg + ctrl
+    assert numpy.allclose(wavefunctions[0], wavefunctions[1])
+
+
+def test_simulator_emulate_math_operations_invalid(sim):
+    eng = MainEngine(sim, [])
+    qureg = eng.allocate_qureg(2)
+    for operations in ([('divide', 0, 1)], [('add', 0)], [('add', 0, 2)],
+                       [('add_mod', 0, 1, 0)]):
+        with pytest.raises(ValueError):
+            OperationsGate(operations, None) | (qureg[:1], qureg[1:])
+            eng.flush()
+
+
+def test_simulator_emulate_math_vectorized(sim):
+    calls = []
+
+    def math_fun(a, b):
+        calls.append(len(a))
+        return (a, (a * b + 1) % 8)
+
+    eng = MainEngine(sim, [])
+    qureg = eng.allocate_qureg(5)
+    ctrl = eng.allocate_qubit()
+    X | ctrl
+    X | qureg[0]  # a = 1
+    X | qureg[2]  # b = 1
+    with Control(eng, ctrl):
+        BasicMathGate(math_fun, vectorized=True) | (qureg[:2], qureg[2:])
+    eng.flush()
+    assert calls == [32]
+    assert 1. == pytest.approx(abs(sim.cheat()[1][0b101001]))
+    All(Measure) | qureg + ctrl
+
+
 def test_simulator_kqubit_gate(sim):
     m1 = Rx(0.3).matrix
     m2 = Rx(0.8).matrix
@@ -273,6 +350,37 @@ def test_simulator_kqubit_gate(sim):
         LargerGate() | (qureg + qubit)
 
 
+def test_simulator_diagonal_gates(sim):
+    eng = MainEngine(sim, [])
+    qureg = eng.allocate_qureg(3)
+    for qb in qureg:
+        Ry(random.random()) | qb
+    eng.flush()
+    mapping, wavefunction = copy.deepcopy(sim.cheat())
+    wavefunction = numpy.array(wavefunction)
+    Rz(0.3) | qureg[0]
+    with Control(eng, qureg[1]):
+        R(0.5) | qureg[2]
+    Rzz(0.7) | (qureg[0], qureg[2])
+    T | qureg[1]
+    with Control(eng, qureg[0]):
+        Z | qureg[2]
+    H | qureg[1]
+    H | qureg[1]
+    S | qureg[2]
+    eng.flush()
+    for i in range(8):
+        b = [(i >> mapping[qb.id]) & 1 for qb in qureg]
+        phase = (cmath.exp(.5j * 0.3 * (2 * b[0] - 1)) *
+                 cmath.exp(.5j * 0.7 * (2 * (b[0] ^ b[2]) - 1)) *
+                 cmath.exp(1j * 0.5 * b[1] * b[2]) *
+                 cmath.exp(.25j * math.pi * b[1]) *
+                 (-1) ** (b[0] * b[2]) * 1j ** b[2])
+        wavefunction[i] *= phase
+    assert numpy.allclose(sim.cheat()[1], wavefunction)
+    All(Measure) | qureg
+
+
 def test_simulator_kqubit_exception(sim):
     m1 = Rx(0.3).matrix
     m2 = Rx(0.8).matrix
@@ -325,6 +433,32 @@ def test_simulator_probability(sim, mapper):
     All(Measure) | qubits
 
 
+def test_simulator_sample(sim, mapper):
+    engine_list = [LocalOptimizer()]
+    if mapper is not None:
+        engine_list.append(mapper)
+    eng = MainEngine(sim, engine_list=engine_list)
+    qubits = eng.allocate_qureg(3)
+    X | qubits[1]
+    H | qubits[2]
+    eng.flush()
+    counts = eng.backend.sample(qubits, 1000)
+    assert set(counts) <= {'010', '011'}
+    assert sum(counts.values()) == 1000
+    assert 400 < counts['011'] < 600
+    samples = eng.backend.sample(qubits[1:], 100, counts=False)
+    assert samples.shape == (100, 2)
+    assert samples.dtype == bool
+    assert samples[:, 0].all()
+    # sampling does not collapse the wavefunction
+    assert eng.backend.get_probability('1', [qubits[2]]) == pytest.approx(.5)
+    extra_qubit = eng.allocate_qubit()
+    with pytest.raises(RuntimeError):
+        eng.backend.sample(extra_qubit, 10)
+    del extra_qubit
+    All(Measure) | qubits
+
+
 def test_simulator_amplitude(sim, mapper):
     engine_list = [LocalOptimizer()]
     if mapper is not None:
@@ -409,6 +543,33 @@ def test_simulator_expectation(sim, mapper):
     assert .4 == pytest.approx(expectation)
 
 
+def test_simulator_expectation_grouped_terms(sim):
+    eng = MainEngine(sim, [])
+    qureg = eng.allocate_qureg(4)
+    rnd = random.Random(5)
+    for qb in qureg:
+        Ry(rnd.random()) | qb
+        Rz(rnd.random()) | qb
+    CNOT | (qureg[0], qureg[2])
+    CNOT | (qureg[3], qureg[1])
+    eng.flush()
+    # many terms which share the same X/Y mask
+    op = QubitOperator((), .3)
+    for _ in range(40):
+        term = tuple((i, rnd.choice('XYZ')) for i in range(4)
+                     if rnd.random() < .6)
+        op += QubitOperator(term, rnd.uniform(-1., 1.))
+    mapping, state = copy.deepcopy(sim.cheat())
+    expected = 0.
+    for term, coefficient in op.terms.items():
+        sim.apply_qubit_operator(QubitOperator(term), qureg)
+        expected += coefficient * numpy.vdot(state, sim.cheat()[1]).real
+        sim.set_wavefunction(state, [qureg[i] for i in sorted(
+            range(4), key=lambda i: mapping[qureg[i].id])])
+    assert sim.get_expectation_value(op, qureg) == pytest.approx(expected)
+    All(Measure) | qureg
+
+
 def test_simulator_expectation_exception(sim):
     eng = MainEngine(sim, [])
     qureg = eng.allocate_qureg(3)
@@ -462,6 +623,37 @@ def test_simulator_applyqubitoperator(sim, mapper):
     assert sim.get_amplitude('000', qureg) == pytest.approx(0.)
 
 
+def test_simulator_applyqubitoperator_grouped_terms(sim):
+    eng = MainEngine(sim, [])
+    qureg = eng.allocate_qureg(3)
+    random.seed(1)
+    for qb in qureg:
+        Ry(random.random() * 3) | qb
+        Rz(random.random() * 3) | qb
+    eng.flush()
+    # the first two terms flip the same qubits
+    op = (0.5 * QubitOperator('X0 Y1') + 0.3j * QubitOperator('Y0 X1') +
+          0.2 * QubitOperator('Z2') - 0.1 * QubitOperator('Y2 Z0') +
+          0.4 * QubitOperator(''))
+    mapping, state = copy.deepcopy(sim.cheat())
+    paulis = {'X': numpy.array([[0, 1], [1, 0]]),
+              'Y': numpy.array([[0, -1j], [1j, 0]]),
+              'Z': numpy.array([[1, 0], [0, -1]])}
+    expected = numpy.zeros(len(state), dtype=complex)
+    for term, coefficient in op.terms.items():
+        local_ops = dict((mapping[qureg[index].id], pauli)
+                         for index, pauli in term)
+        matrix = numpy.ones((1, 1))
+        for position in reversed(range(3)):
+            matrix = numpy.kron(matrix, paulis.get(local_ops.get(position),
+                                                   numpy.eye(2)))
+        expected += coefficient * matrix.dot(state)
+    sim.apply_qubit_operator(op, qureg)
+    assert numpy.allclose(sim.cheat()[1], expected)
+    sim.set_wavefunction(state, sorted(qureg, key=lambda qb: mapping[qb.id]))
+    All(Measure) | qureg
+
+
 def test_simulator_time_evolution(sim):
     N = 8  # number of qubits
     time_to_evolve = 1.1  # time to evolve for
@@ -521,6 +713,163 @@ def test_simulator_time_evolution(sim):
                           init_wavefunction)
 
 
+@pytest.mark.parametrize("time_to_evolve", [0.3, -2., 15.])
+def test_simulator_time_evolution_chebyshev(sim, time_to_evolve):
+    chebyshev_sim = Simulator(time_evolution='chebyshev')
+    chebyshev_sim._simulator = type(sim._simulator)(1)
+    Qop = QubitOperator
+    op = 0.3 * Qop("X0 Y1 Z2 Y3 X4")
+    op += 1.1 * Qop(())
+    op += -1.4 * Qop("Y0 Z1 X3 Y5")
+    op += -1.1 * Qop("Y1 X2 X3 Y4")
+    op += 0.7 * Qop("Z0 Z5")
+    wavefunctions = []
+    for backend in (sim, chebyshev_sim):
+        eng = MainEngine(backend, [])
+        qureg = eng.allocate_qureg(6)
+        ctrl_qubit = eng.allocate_qubit()
+        random.seed(42)
+        for qb in qureg:
+            Rx(random.random()) | qb
+            Ry(random.random()) | qb
+        H | ctrl_qubit
+        with Control(eng, ctrl_qubit):
+            TimeEvolution(time_to_evolve, op) | qureg
+        TimeEvolution(time_to_evolve, op) | qureg
+        eng.flush()
+        wavefunctions.append(numpy.array(backend.cheat()[1]))
+        All(Measure) | qureg + ctrl_qubit
+    assert numpy.allclose(wavefunctions[0], wavefunctions[1])
+    # both gates share a single compiled Hamiltonian
+    assert len(chebyshev_sim._hamiltonians) == 1
+
+
+def test_simulator_time_evolution_options():
+    sim = Simulator(time_evolution={'method': 'chebyshev',
+                                    'tolerance': 1e-8})
+    assert sim._time_evolution == {'method': 'chebyshev', 'tolerance': 1e-8}
+    with pytest.raises(ValueError):
+        Simulator(time_evolution='lanczos')
+    with pytest.raises(ValueError):
+        Simulator(time_evolution={'method': 'chebyshev', 'order': 3})
+
+
+def test_simulator_cheat_view(sim):
+    eng = MainEngine(sim, [])
+    qureg = eng.allocate_qureg(2)
+    H | qureg[0]
+    eng.flush()
+    mapping, state = sim.cheat(copy=False)
+    assert isinstance(state, numpy.ndarray)
+    assert not state.flags.writeable
+    with pytest.raises(ValueError):
+        state[0] = 0.
+    # the state vector is not copied
+    assert numpy.shares_memory(state, sim.cheat(copy=False)[1])
+
+    state = sim.cheat(writable=True, copy=False)[1]
+    state[:] = 0.
+    state[1 << mapping[qureg[1].id]] = 1j
+    assert sim.get_amplitude('01', qureg) == pytest.approx(1j)
+
+    wavefunction = numpy.array([0, 0, 0, 1], dtype=numpy.complex128)
+    sim.set_wavefunction(wavefunction, qureg)
+    assert sim.get_probability('11', qureg) == pytest.approx(1.)
+    with pytest.raises((AssertionError, RuntimeError)):
+        sim.set_wavefunction(wavefunction[:2], qureg)
+    # by default, the state vector is copied (and remains valid)
+    mapping, state = sim.cheat()
+    assert not numpy.shares_memory(state, sim.cheat(copy=False)[1])
+    qureg2 = eng.allocate_qureg(4)
+    eng.flush()
+    assert state[3] == pytest.approx(1.)
+    All(Measure) | qureg + qureg2
+
+
+def test_simulator_save_load_state(sim, tmpdir):
+    path = str(tmpdir.join("state.bin"))
+    eng = MainEngine(sim, [])
+    qureg = eng.allocate_qureg(3)
+    H | qureg[0]
+    Ry(0.4) | qureg[1]
+    CNOT | (qureg[1], qureg[2])
+    eng.flush()
+    mapping, state = copy.deepcopy(sim.cheat())
+    sim.save_state(path)
+    samples = sim.sample(qureg, 20)
+
+    X | qureg[1]
+    Rz(0.3) | qureg[2]
+    eng.flush()
+    sim.load_state(path)
+    assert sim.cheat()[0] == mapping
+    assert numpy.array_equal(sim.cheat()[1], state)
+    assert sim.sample(qureg, 20) == samples
+
+    sim2 = Simulator()
+    sim2._simulator = type(sim._simulator)(1)
+    eng2 = MainEngine(sim2, [])
+    qureg2 = eng2.allocate_qureg(2)
+    eng2.flush()
+    with pytest.raises(RuntimeError):
+        eng2.backend.load_state(path)
+    # restore into a new simulator which holds the same qubits
+    qureg2 += eng2.allocate_qubit()
+    eng2.flush()
+    eng2.backend.load_state(path)
+    assert numpy.array_equal(eng2.backend.cheat()[1], state)
+    with open(path, 'wb') as f:
+        f.write(b'no state')
+    with pytest.raises(RuntimeError):
+        sim.load_state(path)
+    All(Measure) | qureg
+    All(Measure) | qureg2
+
+
+def test_simulator_load_state_new_simulator(sim, tmpdir):
+    path = str(tmpdir.join("state.bin"))
+    eng = MainEngine(sim, [])
+    qureg = eng.allocate_qureg(3)
+    X | qureg[0]
+    Ry(0.4) | qureg[2]
+    eng.flush()
+    amplitudes = [sim.get_amplitude(bits, qureg)
+                  for bits in ('100', '101')]
+    sim.save_state(path)
+    All(Measure) | qureg
+
+    def make_simulator(precision):
+        new_sim = Simulator(precision=precision)
+        if type(sim._simulator).__module__.endswith('_pysim'):
+            from projectq.backends._sim._pysim import Simulator as PySim
+            new_sim._simulator = PySim(1, precision=precision)
+        return new_sim
+
+    # the state is converted to the precision of the simulator
+    for precision in ('double', 'single'):
+        new_sim = make_simulator(precision)
+        eng2 = MainEngine(new_sim, [LocalOptimizer()])
+        qureg2 = eng2.allocate_qureg(3)
+        # the allocations have not been flushed yet
+        with pytest.raises(RuntimeError):
+            new_sim.load_state(path)
+        eng2.flush()
+        new_sim.load_state(path)
+        assert ([new_sim.get_amplitude(bits, qureg2)
+                 for bits in ('100', '101')] ==
+                [pytest.approx(amplitude, abs=1e-6)
+                 for amplitude in amplitudes])
+        All(Measure) | qureg2
+        eng2.flush()
+
+    # the qubits are ordered differently and cannot be converted
+    new_sim = make_simulator('single')
+    for qb_id in (2, 1, 0):
+        new_sim._simulator.allocate_qubit(qb_id)
+    with pytest.raises(RuntimeError):
+        new_sim.load_state(path)
+
+
 def test_simulator_set_wavefunction(sim, mapper):
     engine_list = [LocalOptimizer()]
     if mapper is not None:
@@ -685,7 +1034,7 @@ def test_simulator_convert_logical_to_mapped_qubits(sim):
             qubit1 + qubit0)
 
 
-def test_simulator_constant_math_emulation():
+def test_simulator_constant_math_emulation(monkeypatch):
     if "cpp_simulator" not in get_available_simulators():
         pytest.skip("No C++ simulator")
         return
@@ -726,7 +1075,7 @@ def test_simulator_constant_math_emulation():
     cppsim._simulator = CppSim(1)
     run_simulation(cppsim)
 
-    _sim.FALLBACK_TO_PYSIM = True
+    monkeypatch.setattr(_sim, "FALLBACK_TO_PYSIM", True)
     pysim = Simulator()
     pysim._simulator = PySim(1)
     # run_simulation(pysim)
@@ -735,3 +1084,104 @@ def test_simulator_constant_math_emulation():
         ref = result[0]
         for res in result[1:]:
             assert ref == res
+
+
+@pytest.mark.parametrize("policy", [True, {'max_qubits': 3},
+                                    {'lookahead': 1},
+                                    {'max_qubits': 4, 'lookahead': 16}])
+def test_simulator_gate_fusion_policy(policy):
+    if "cpp_simulator" not in get_available_simulators():
+        pytest.skip("No C++ simulator")
+        return
+
+    def run_circuit(sim):
+        eng = MainEngine(sim, [])
+        qureg = eng.allocate_qureg(6)
+        rnd = random.Random(42)
+        for _ in range(60):
+            qubits = rnd.sample(list(qureg), 3)
+            choice = rnd.randint(0, 3)
+            if choice == 0:
+                Rx(rnd.random()) | qubits[0]
+            elif choice == 1:
+                CNOT | (qubits[0], qubits[1])
+            elif choice == 2:
+                with Control(eng, qubits[1:]):
+                    Ry(rnd.random()) | qubits[0]
+            else:
+                H | qubits[0]
+        eng.flush()
+        mapping, wavefunction = sim.cheat()
+        return [wavefunction[sum(((i >> k) & 1) << mapping[qureg[k].id]
+                                 for k in range(6))] for i in range(64)]
+
+    from projectq.backends._sim._pysim import Simulator as PySim
+    py_sim = Simulator()
+    py_sim._simulator = PySim(1)
+    expected = run_circuit(py_sim)
+    result = run_circuit(Simulator(gate_fusion=policy))
+    assert numpy.allclose(result, expected)
+
+
+def test_simulator_gate_fusion_policy_exception():
+    with pytest.raises(ValueError):
+        Simulator(gate_fusion={'lookahed': 10})
+    if "cpp_simulator" not in get_available_simulators():
+        return
+    with pytest.raises(ValueError):
+        Simulator(gate_fusion={'max_qubits': 6})
+    with pytest.raises(ValueError):
+        Simulator(gate_fusion={'min_qubits': 3, 'max_qubits': 2})
+
+
+@pytest.mark.parametrize("backend", get_available_simulators())
+def test_simulator_single_precision(backend):
+    def run_circuit(sim):
+        eng = MainEngine(sim, [])
+        qureg = eng.allocate_qureg(5)
+        rnd = random.Random(7)
+        for _ in range(40):
+            qubits = rnd.sample(list(qureg), 2)
+            choice = rnd.randint(0, 2)
+            if choice == 0:
+                Rx(rnd.random()) | qubits[0]
+            elif choice == 1:
+                CNOT | (qubits[0], qubits[1])
+            else:
+                Rz(rnd.random()) | qubits[0]
+        eng.flush()
+        mapping, wavefunction = copy.deepcopy(sim.cheat())
+        probability = sim.get_probability('01', qureg[:2])
+        All(Measure) | qureg
+        return ([wavefunction[sum(((i >> k) & 1) << mapping[qureg[k].id]
+                                  for k in range(5))] for i in range(32)],
+                probability)
+
+    def make_simulator(precision):
+        sim = Simulator(gate_fusion=True, precision=precision)
+        if backend == "py_simulator":
+            from projectq.backends._sim._pysim import Simulator as PySim
+            sim._simulator = PySim(1, precision=precision)
+        return sim
+
+    sim = make_simulator('single')
+    expected, expected_probability = run_circuit(make_simulator('double'))
+    result, probability = run_circuit(sim)
+    assert numpy.allclose(result, expected, atol=1e-6)
+    assert probability == pytest.approx(expected_probability, abs=1e-6)
+    if backend == "py_simulator":
+        assert sim.cheat()[1].dtype == numpy.complex64
+
+    # the state vector can be set using single precision amplitudes
+    eng = MainEngine(sim, [])
+    qureg = eng.allocate_qureg(2)
+    eng.flush()
+    wavefunction = numpy.array([.6, 0, 0, .8j], dtype=numpy.complex64)
+    sim.set_wavefunction(wavefunction, qureg)
+    assert numpy.allclose(sim.cheat()[1], wavefunction)
+    All(Measure) | qureg
+
+
+def test_simulator_precision_exception():
+    with pytest.raises(ValueError):
+        Simulator(precision='half')
@@ -16,19 +16,24 @@ from ._basics import (BasicEngine,
                       LastEngineException,
                       ForwarderEngine)
 from ._cmdmodifier import CommandModifier
-from ._basicmapper import BasicMapperEngine
+from ._basicmapper import BasicMapperEngine, return_swap_depth
+from ._placementmapper import PlacementMapper
 from ._ibm5qubitmapper import IBM5QubitMapper
 from ._swapandcnotflipper import SwapAndCNOTFlipper
-from ._linearmapper import LinearMapper, return_swap_depth
+from ._linearmapper import LinearMapper
+from ._graphmapper import GraphMapper
 from ._manualmapper import ManualMapper
 from ._main import (MainEngine,
                     NotYetMeasuredError,
                     UnsupportedEngineError)
 from ._optimize import LocalOptimizer
+from ._profiler import CompilerProfiler
 from ._replacer import (AutoReplacer,
+                        CostChooser,
                         InstructionFilter,
                         DecompositionRuleSet,
                         DecompositionRule)
+from ._compilationcache import CompilationCache
 from ._tagremover import TagRemover
 from ._testengine import CompareEngine, DummyEngine
 from ._twodmapper import GridMapper
@@ -26,6 +26,29 @@ from projectq.meta import drop_engine_after, insert_engine, LogicalQubitIDTag
 from projectq.ops import MeasureGate
 
 
+def return_swap_depth(swaps):
+    """
+    Returns the circuit depth to execute these swaps.
+
+    Args:
+        swaps(list of tuples): Each tuple contains two integers representing
+                               the two IDs of the qubits involved in the
+                               Swap operation
+    Returns:
+        Circuit depth to execute these swaps.
+    """
+    depth_of_qubits = dict()
+    for qb0_id, qb1_id in swaps:
+        if qb0_id not in depth_of_qubits:
+            depth_of_qubits[qb0_id] = 0
+        if qb1_id not in depth_of_qubits:
+            depth_of_qubits[qb1_id] = 0
+        max_depth = max(depth_of_qubits[qb0_id], depth_of_qubits[qb1_id])
+        depth_of_qubits[qb0_id] = max_depth + 1
+        depth_of_qubits[qb1_id] = max_depth + 1
+    return max(list(depth_of_qubits.values()) + [0])
+
+
 class BasicMapperEngine(BasicEngine):
     """
     Parent class for all Mappers.
@@ -57,20 +80,22 @@ class BasicMapperEngine(BasicEngine):
         Args:
             cmd: Command object with logical qubit ids.
         """
-        new_cmd = deepcopy(cmd)
+        new_cmd = cmd.copy()
+        # use the mapping itself, the property returns a (deep) copy
+        mapping = self._current_mapping
         qubits = new_cmd.qubits
         for qureg in qubits:
             for qubit in qureg:
                 if qubit.id != -1:
-                    qubit.id = self.current_mapping[qubit.id]
+                    qubit.id = mapping[qubit.id]
         control_qubits = new_cmd.control_qubits
         for qubit in control_qubits:
-            qubit.id = self.current_mapping[qubit.id]
+            qubit.id = mapping[qubit.id]
         if isinstance(new_cmd.gate, MeasureGate):
             assert len(new_cmd.qubits) == 1 and len(new_cmd.qubits[0]) == 1
 
             # Add LogicalQubitIDTag to MeasureGate
-            def add_logical_id(command, old_tags=deepcopy(cmd.tags)):
+            def add_logical_id(command, old_tags=list(cmd.tags)):
                 command.tags = (old_tags +
                                 [LogicalQubitIDTag(cmd.qubits[0][0].id)])
                 return command
@@ -82,6 +107,31 @@ class BasicMapperEngine(BasicEngine):
         else:
             self.send([new_cmd])
     
+    def synchronize_qubits(self, qubit_ids):
+        """
+        Forward the request to synchronize the given (logical) qubits using
+        their mapped ids (see BasicEngine.synchronize_qubits).
+
+        Mappers which store commands in self._stored_commands first route
+        them (by calling self._run()) until none of them acts on the given
+        qubits. Commands on the other qubits are only sent on if they can be
+        executed along the way, the rest stays stored. Qubits which are not
+        mapped (yet) are skipped.
+
+        Args:
+            qubit_ids (list<int>): Logical IDs of the qubits to synchronize.
+        """
+        ids = set(qubit_ids)
+        while any(qb.id in ids
+                  for cmd in getattr(self, '_stored_commands', ())
+                  for qureg in cmd.all_qubits for qb in qureg):
+            self._run()
+        mapping = self._current_mapping
+        if mapping is None:
+            mapping = dict()
+        BasicEngine.synchronize_qubits(self, [mapping[idx] for idx in qubit_ids
+                                              if idx in mapping])
+
     def receive(self, command_list):
         for cmd in command_list:
             self._send_cmd_with_mapped_ids(cmd)
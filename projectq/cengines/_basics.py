@@ -178,6 +178,23 @@ class BasicEngine(object):
         except:
             return False
 
+    def synchronize_qubits(self, qubit_ids):
+        """
+        Send on all buffered commands which act on the given qubits, together
+        with the commands they depend on (i.e., their causal cone), and then
+        ask the next engine to do the same.
+
+        This is used by the MainEngine to make a measurement result available
+        without flushing the entire pipeline. Engines which buffer commands
+        (e.g., optimizers and mappers) override this function, all other
+        engines simply forward the request.
+
+        Args:
+            qubit_ids (list<int>): IDs of the qubits to synchronize.
+        """
+        if not self.is_last_engine:
+            self.next_engine.synchronize_qubits(qubit_ids)
+
     def send(self, command_list):
         """
         Forward the list of commands to the next engine in the pipeline.
@@ -160,6 +160,23 @@ def test_basic_engine_is_meta_tag_supported():
     assert main_engine.is_meta_tag_supported(DirtyQubitTag)
 
 
+def test_basic_engine_synchronize_qubits():
+    synchronized = []
+
+    def synchronize_qubits(self, qubit_ids):
+        synchronized.append((self, qubit_ids))
+        _basics.BasicEngine.synchronize_qubits(self, qubit_ids)
+
+    backend = DummyEngine()
+    engine0 = DummyEngine()
+    for engine in [backend, engine0]:
+        engine.synchronize_qubits = types.MethodType(synchronize_qubits,
+                                                     engine)
+    main_engine = MainEngine(backend=backend, engine_list=[engine0])
+    main_engine.synchronize_qubits([3])
+    assert synchronized == [(engine0, [3]), (backend, [3])]
+
+
 def test_forwarder_engine():
     backend = DummyEngine(save_commands=True)
     engine0 = DummyEngine()
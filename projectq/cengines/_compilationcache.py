@@ -0,0 +1,801 @@
+#   Copyright 2018 ProjectQ-Framework (www.projectq.ch)
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Contains a compiler engine which caches the compiled command streams of
+(parameterized) circuits, in memory and on disk, and replays them instead of
+compiling the same circuit structure again.
+"""
+
+import collections
+import functools
+import hashlib
+import inspect
+import math
+import numbers
+import os
+import pickle
+import tempfile
+import types
+
+from projectq._version import __version__
+from projectq.cengines import BasicEngine
+from projectq.cengines._replacer._replacer import _is_compared_by_class
+from projectq.meta import LogicalQubitIDTag
+from projectq.ops import (AllocateQubitGate, BasicPhaseGate,
+                          BasicRotationGate, Command, DeallocateQubitGate,
+                          FlushGate)
+from projectq.types import WeakQubitRef
+
+#: Version of the format of the cache entries (part of every key)
+CACHE_FORMAT_VERSION = 1
+
+# Maximal number of compiled samples which are kept per cache entry in order
+# to determine how the compiled angles depend on the angles of the circuit:
+_MAX_SAMPLES = 4
+# The compiled angles are c * angle + b with c = k / _DENOMINATOR,
+# |k| <= _MAX_NUMERATOR:
+_DENOMINATOR = 8
+_MAX_NUMERATOR = 64
+_TOLERANCE = 1e-9
+# Values which are described by their repr (see _describe):
+_ATOMIC_TYPES = (numbers.Number, str, bytes, type(u""))
+
+
+class _UndescribableError(Exception):
+    """
+    Raised if a value cannot be described such that the cache would notice
+    a change of it.
+    """
+
+
+# Attributes in which compiler engines store a constructor argument whose
+# name differs from the name of the argument (possibly with a leading
+# underscore):
+_ATTRIBUTE_NAMES = {'decomposition_chooser': '_decomp_chooser',
+                    'map_fun': 'map'}
+
+
+def _describe_code(code):
+    """
+    Returns a string describing a code object by its byte code, the names it
+    uses, and its constants.
+    """
+    consts = [_describe_code(const) if isinstance(const, types.CodeType)
+              else _describe(const) for const in code.co_consts]
+    return (hashlib.sha256(code.co_code).hexdigest() + "(" +
+            ",".join(code.co_names) + ";" + ",".join(consts) + ")")
+
+
+def _get_attributes(value):
+    """
+    Returns a dict of the attributes of an object which are stored in its
+    __dict__ or its __slots__.
+
+    Raises:
+        _UndescribableError: If the object has neither.
+    """
+    attributes = dict(getattr(value, '__dict__', ()))
+    has_slots = False
+    for cls in type(value).__mro__:
+        slots = cls.__dict__.get('__slots__', ())
+        if isinstance(slots, str):
+            slots = (slots,)
+        for name in slots:
+            has_slots = True
+            if name not in ('__dict__', '__weakref__') and hasattr(value,
+                                                                     name):
+                attributes[name] = getattr(value, name)
+    if not hasattr(value, '__dict__') and not has_slots:
+        raise _UndescribableError("Cannot describe " + repr(type(value)))
+    return attributes
+
+
+def _describe(value, _seen=None):
+    """
+    Returns a string describing value which does not change between runs
+    (e.g., no memory addresses).
+
+    Numbers, strings, and containers of these are described by their value,
+    classes by their name, functions by their name, byte code, default
+    arguments, and the values they capture (closure), and all other objects
+    by their class and the attributes in their __dict__ or __slots__. An
+    object which is encountered again while it is being described is
+    described by "...".
+
+    Raises:
+        _UndescribableError: If value (or a part of it) has no such
+            description.
+    """
+    if value is None or isinstance(value, _ATOMIC_TYPES):
+        return repr(value)
+    if isinstance(value, type):
+        return "{}.{}".format(value.__module__, value.__name__)
+    if isinstance(value, types.ModuleType):
+        return "module " + value.__name__
+    if _seen is None:
+        _seen = set()
+    if id(value) in _seen:
+        return "..."
+    _seen.add(id(value))
+    try:
+        if isinstance(value, (list, tuple)):
+            return "[" + ",".join(_describe(item, _seen)
+                                  for item in value) + "]"
+        if isinstance(value, (set, frozenset)):
+            return "{" + ",".join(sorted(_describe(item, _seen)
+                                         for item in value)) + "}"
+        if isinstance(value, dict):
+            return "{" + ",".join(sorted(
+                _describe(key, _seen) + ":" + _describe(item, _seen)
+                for key, item in value.items())) + "}"
+        if isinstance(value, types.MethodType):
+            return (_describe(value.__func__, _seen) + " of " +
+                    _describe(value.__self__, _seen))
+        if isinstance(value, types.FunctionType):
+            cells = []
+            for cell in value.__closure__ or ():
+                try:
+                    cells.append(_describe(cell.cell_contents, _seen))
+                except ValueError:  # empty cell
+                    cells.append("<empty>")
+            return "{}.{}:{}:{}:[{}]".format(
+                value.__module__, value.__name__,
+                _describe_code(value.__code__),
+                _describe(value.__defaults__, _seen), ",".join(cells))
+        if isinstance(value, types.BuiltinFunctionType):
+            description = "{}.{}".format(value.__module__, value.__name__)
+            if value.__self__ is not None:
+                description += " of " + _describe(value.__self__, _seen)
+            return description
+        if isinstance(value, functools.partial):
+            return "partial({},{},{})".format(
+                _describe(value.func, _seen), _describe(value.args, _seen),
+                _describe(value.keywords, _seen))
+        return (_describe(type(value)) + "(" +
+                _describe(_get_attributes(value), _seen) + ")")
+    finally:
+        _seen.discard(id(value))
+
+
+def _describe_engine(engine):
+    """
+    Returns a string describing the class and configuration of a compiler
+    engine, i.e., the values of its attributes which are named like the
+    arguments of its constructor (possibly with a leading underscore, see
+    also _ATTRIBUTE_NAMES).
+
+    Raises:
+        _UndescribableError: If the engine does not store one of the
+            arguments of its constructor or if one of them cannot be
+            described.
+    """
+    parts = [_describe(type(engine))]
+    try:
+        parameters = list(inspect.signature(type(engine).__init__).parameters)
+    except AttributeError:  # Python 2
+        try:
+            parameters = inspect.getargspec(type(engine).__init__).args
+        except TypeError:  # pragma: no cover
+            parameters = []
+    except (TypeError, ValueError):  # pragma: no cover
+        parameters = []
+    attributes = vars(engine)
+    for name in parameters:
+        if name == 'self':
+            continue
+        for attribute in (name, '_' + name, _ATTRIBUTE_NAMES.get(name)):
+            if attribute in attributes:
+                parts.append(name + "=" + _describe(attributes[attribute]))
+                break
+        else:
+            raise _UndescribableError("Cannot find the argument " + name +
+                                      " of " + parts[0])
+    return " ".join(parts)
+
+
+def _get_gate_key(gate):
+    """
+    Returns a string describing a gate which is not a rotation or phase gate
+    (or None if the gate cannot be described).
+
+    Gates which are only compared by their class (BasicGate.__eq__) can only
+    be described if they have no parameters.
+    """
+    if _is_compared_by_class(gate):
+        return None
+    try:
+        return _describe(type(gate)) + ":" + str(gate)
+    except Exception:  # e.g., no __str__
+        return None
+
+
+def _get_period(gate):
+    """ Returns the period of the angle of a rotation or phase gate. """
+    if isinstance(gate, BasicRotationGate):
+        return 4 * math.pi
+    return 2 * math.pi
+
+
+def _is_close(angle0, angle1, period):
+    """ Returns True if the two angles are equal modulo period. """
+    difference = (angle0 - angle1) % period
+    return min(difference, period - difference) < _TOLERANCE
+
+
+def _solve(template, samples):
+    """
+    Determines how the compiled angles depend on the angles of the circuit.
+
+    Args:
+        template (list): Compiled commands (see CompilationCache._learn).
+        samples (list): One list per compiled sample containing a pair
+            (angle of the circuit, compiled angle) per compiled command which
+            depends on an angle of the circuit.
+
+    Returns:
+        List with a pair (c, b) per compiled command which depends on an angle
+        of the circuit and None otherwise, such that the compiled angle is
+        c * angle + b, or None if the samples do not determine this uniquely.
+    """
+    coefficients = []
+    index = 0
+    for gate, _, _, _, parameter in template:
+        if parameter is None:
+            coefficients.append(None)
+            continue
+        points = [sample[index] for sample in samples]
+        index += 1
+        period = _get_period(gate)
+        solutions = []
+        for numerator in range(-_MAX_NUMERATOR, _MAX_NUMERATOR + 1):
+            factor = float(numerator) / _DENOMINATOR
+            offset = (points[0][1] - factor * points[0][0]) % period
+            if all(_is_close(factor * angle + offset, compiled_angle, period)
+                   for angle, compiled_angle in points):
+                solutions.append((factor, offset))
+        if len(solutions) != 1:
+            return None
+        try:
+            if type(gate)(gate.angle) != gate:
+                return None
+        except Exception:  # the gate cannot be created from its angle
+            return None
+        coefficients.append(solutions[0])
+    return coefficients
+
+
+def _same_structure(template0, template1):
+    """
+    Returns True if the two compiled templates only differ in the angles of
+    the commands which depend on an angle of the circuit.
+    """
+    if len(template0) != len(template1):
+        return False
+    for entry0, entry1 in zip(template0, template1):
+        if entry0[1:] != entry1[1:] or type(entry0[0]) is not type(entry1[0]):
+            return False
+        if entry0[4] is None and entry0[0] != entry1[0]:
+            return False
+    return True
+
+
+class _ParameterTag(object):
+    """
+    Marks the commands which stem from the index-th rotation or phase gate
+    of a circuit.
+    """
+    def __init__(self, index):
+        self.index = index
+
+    def __eq__(self, other):
+        return isinstance(other, _ParameterTag) and self.index == other.index
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(("_ParameterTag", self.index))
+
+
+class _CompilationRecorder(BasicEngine):
+    """
+    Compiler engine in front of the back-end which records the compiled
+    commands for the CompilationCache.
+    """
+    def __init__(self):
+        BasicEngine.__init__(self)
+        # List to which the received commands are appended (or None):
+        self.recording = None
+        # Whether the received commands are sent on to the back-end:
+        self.forward = True
+        # Whether a FlushGate is recorded and sent on to the back-end:
+        self.forward_flush = True
+
+    def receive(self, command_list):
+        """
+        Records the commands and sends them on without the _ParameterTags.
+
+        Args:
+            command_list (list<Command>): List of commands to receive.
+        """
+        if not self.forward_flush:
+            command_list = [cmd for cmd in command_list
+                            if not isinstance(cmd.gate, FlushGate)]
+        if self.recording is not None:
+            self.recording.extend(command_list)
+        if not self.forward:
+            return
+        new_command_list = []
+        for cmd in command_list:
+            if any(isinstance(tag, _ParameterTag) for tag in cmd.tags):
+                cmd = cmd.copy()
+                cmd.tags = [tag for tag in cmd.tags
+                            if not isinstance(tag, _ParameterTag)]
+            new_command_list.append(cmd)
+        if len(new_command_list) > 0:
+            self.send(new_command_list)
+
+
+class CompilationCache(BasicEngine):
+    """
+    Caches the command streams compiled by the following compiler engines and
+    replays them for circuits with the same structure, substituting the
+    angles of the rotation and phase gates.
+
+    The CompilationCache must be the first compiler engine:
+
+    .. code-block:: python
+
+        eng = MainEngine(backend, [CompilationCache("~/.projectq_cache")] +
+                         projectq.setups.ibm.get_engine_list())
+
+    A circuit starts when no qubit is allocated and ends when all its qubits
+    have been deallocated. The commands are processed in chunks, which end
+    at a flush, a measurement result request (synchronize_qubits), or the end
+    of the circuit. Each chunk is looked up using a structural fingerprint of
+    the circuit so far (gate classes and all gate parameters other than
+    the angles of rotation and phase gates, the qubits in the order of their
+    first use, and the tags) and of the configuration of the following
+    engines (their classes and constructor parameters, including the
+    decomposition rules and the code and captured values of functions such
+    as filters and choosers) and the ProjectQ version, such that changing the
+    engine list or the rule set invalidates the cache. If the configuration
+    cannot be described (see _describe), nothing is cached. If the chunk is
+    found, the compiled commands are sent to the back-end directly.
+    Otherwise, it is compiled by the following engines and their output is
+    stored.
+
+    The compiled angles are assumed to be of the form c * angle + b, where
+    angle is the angle of the rotation or phase gate in the circuit which a
+    compiled command stems from (the AutoReplacer forwards the tags of a
+    command to its decomposition). c and b are determined once the same
+    structure has been compiled twice with different angles. Thus, rotations
+    which stem from different gates of the circuit are not merged by the
+    LocalOptimizer.
+
+    Note:
+        1) The following engines have to compile deterministically, i.e.,
+           their output has to only depend on the structure of the circuit.
+        2) If the compilation of a chunk is not found after the previous
+           chunks of the same circuit have been replayed, these chunks are
+           compiled again (without sending them to the back-end).
+        3) The entries are stored with pickle: only use trusted cache
+           directories.
+
+    Attributes:
+        cache_dir (str): Directory of the cache entries (or None).
+        max_entries (int): Maximal number of cache entries. The least
+            recently used ones are removed.
+        num_hits (int): Number of chunks which have been replayed.
+        num_misses (int): Number of chunks which have been compiled.
+    """
+    def __init__(self, cache_dir=None, max_entries=1000):
+        """
+        Initialize a CompilationCache.
+
+        Args:
+            cache_dir (str): Directory in which the compiled circuits are
+                stored. Default is None, which only caches them in memory.
+            max_entries (int): Maximal number of cache entries (each is the
+                compilation of a chunk of a circuit), default is 1000.
+        """
+        BasicEngine.__init__(self)
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        # Cache entries in least recently used order (None if the entry has
+        # not yet been loaded from disk):
+        self._entries = collections.OrderedDict()
+        if cache_dir is not None:
+            self.cache_dir = os.path.expanduser(cache_dir)
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            files = []
+            for name in os.listdir(self.cache_dir):
+                if name.endswith(".pkl"):
+                    path = os.path.join(self.cache_dir, name)
+                    files.append((os.path.getmtime(path), name[:-4]))
+            for _, key in sorted(files):
+                self._entries[key] = None
+        self._recorder = _CompilationRecorder()
+        self._fingerprint = None
+        self._is_set_up = False
+        self._chunk = []
+        self._allocated_ids = set()
+        self._start_circuit()
+        # Statistics:
+        self.num_hits = 0
+        self.num_misses = 0
+
+    def _start_circuit(self):
+        """ Resets the state of the current circuit. """
+        # Logical qubit id -> index of the first use in the circuit, and the
+        # logical qubit ids in this order:
+        self._canonical_ids = dict()
+        self._logical_ids = []
+        # Angles of the rotation and phase gates of the circuit:
+        self._angles = []
+        # Key of the circuit so far (None if the circuit is not cached):
+        self._chain = self._fingerprint
+        # Commands of the replayed chunks of the circuit, which have not been
+        # sent through the following engines:
+        self._replayed = []
+        if self._fingerprint is not None and self._mapper is not None:
+            self._initial_mapping = self._mapper.current_mapping
+
+    @property
+    def _mapper(self):
+        """ The mapper of the compiler (or None). """
+        return getattr(self.main_engine, 'mapper', None)
+
+    def _setup(self):
+        """
+        Inserts the recorder in front of the back-end and computes the
+        fingerprint of the configuration of the following engines (which is
+        None, i.e., nothing is cached, if one of them cannot be described).
+        """
+        engine = self
+        while not engine.next_engine.is_last_engine:
+            engine = engine.next_engine
+        self._recorder.main_engine = self.main_engine
+        self._recorder.next_engine = engine.next_engine
+        engine.next_engine = self._recorder
+        descriptions = [str(CACHE_FORMAT_VERSION), __version__]
+        engine = self.next_engine
+        try:
+            while engine is not self._recorder:
+                descriptions.append(_describe_engine(engine))
+                engine = engine.next_engine
+        except _UndescribableError:
+            # the cache would not notice a change of the configuration
+            self._fingerprint = None
+        else:
+            self._fingerprint = hashlib.sha256(
+                "\n".join(descriptions).encode()).hexdigest()
+        self._is_set_up = True
+        self._start_circuit()
+
+    def _get_canonical_id(self, logical_id):
+        """
+        Returns the index of the first use of a logical qubit id in the
+        circuit (negative ids, e.g., of a FlushGate, are kept).
+        """
+        if logical_id < 0:
+            return logical_id
+        if logical_id not in self._canonical_ids:
+            self._canonical_ids[logical_id] = len(self._logical_ids)
+            self._logical_ids.append(logical_id)
+        return self._canonical_ids[logical_id]
+
+    def _get_logical_id(self, canonical_id):
+        """
+        Returns the logical qubit id of the canonical id. New qubit ids are
+        used for qubits which are not part of the input (e.g., ancillas of
+        decompositions).
+        """
+        if canonical_id < 0:
+            return canonical_id
+        if canonical_id == len(self._logical_ids):
+            self._get_canonical_id(self.main_engine.get_new_qubit_id())
+        return self._logical_ids[canonical_id]
+
+    def _get_structure(self, command_list, boundary):
+        """
+        Returns the structural fingerprint of a chunk of the circuit and the
+        commands to compile, in which the rotation and phase gates carry a
+        _ParameterTag (or None if the chunk cannot be cached).
+        """
+        parts = []
+        tagged_command_list = []
+        for cmd in command_list:
+            if isinstance(cmd.gate, (BasicRotationGate, BasicPhaseGate)):
+                gate_key = _describe(type(cmd.gate))
+                cmd = cmd.copy()
+                cmd.tags.append(_ParameterTag(len(self._angles)))
+                self._angles.append(cmd.gate.angle)
+            else:
+                gate_key = _get_gate_key(cmd.gate)
+                if gate_key is None:
+                    return None, command_list
+            try:
+                tag_keys = [_describe(tag) for tag in cmd.tags
+                            if not isinstance(tag, _ParameterTag)]
+            except _UndescribableError:
+                return None, command_list
+            parts.append(repr((
+                gate_key,
+                [[self._get_canonical_id(qb.id) for qb in qureg]
+                 for qureg in cmd.qubits],
+                [self._get_canonical_id(qb.id) for qb in cmd.control_qubits],
+                tag_keys)))
+            tagged_command_list.append(cmd)
+        if boundary[0] == 'sync':
+            parts.append(repr(('sync', sorted(
+                self._get_canonical_id(idx) for idx in boundary[1]))))
+        else:
+            parts.append(repr(boundary))
+        return "\n".join(parts), tagged_command_list
+
+    def _compile(self, command_list, boundary, forward=True):
+        """
+        Sends a chunk through the following engines and returns the compiled
+        commands.
+        """
+        recorder = self._recorder
+        output = []
+        recorder.recording = output
+        recorder.forward = forward
+        try:
+            if len(command_list) > 0:
+                self.send(command_list)
+            if boundary[0] == 'sync':
+                self.next_engine.synchronize_qubits(boundary[1])
+            elif boundary[0] == 'free':
+                # the compilation of a circuit has to be complete at its end
+                recorder.forward_flush = False
+                qb = WeakQubitRef(engine=self, idx=-1)
+                self.send([Command(self, FlushGate(), ([qb],))])
+        finally:
+            recorder.recording = None
+            recorder.forward = True
+            recorder.forward_flush = True
+        return output
+
+    def _catch_up(self):
+        """
+        Sends the replayed chunks of the current circuit through the following
+        engines (but not to the back-end), such that the state of the engines
+        corresponds to the commands the back-end received.
+
+        Raises:
+            RuntimeError: If the engines compile the chunks differently.
+        """
+        if len(self._replayed) == 0:
+            return
+        if self._mapper is not None:
+            self._mapper.current_mapping = self._initial_mapping
+        for command_list, boundary, num_commands in self._replayed:
+            output = self._compile(command_list, boundary, forward=False)
+            if len(output) != num_commands:
+                raise RuntimeError("The compiler engines do not compile "
+                                   "deterministically. The CompilationCache "
+                                   "cannot be used with these engines.")
+        self._replayed = []
+
+    def _learn(self, key, entry, output):
+        """
+        Adds the compiled commands of a chunk as a sample to its cache entry.
+        """
+        mapper = self._mapper
+        template = []
+        sample = []
+        for cmd in output:
+            qubits = [[qb.id for qb in qureg] for qureg in cmd.qubits]
+            controls = [qb.id for qb in cmd.control_qubits]
+            if mapper is None:
+                qubits = [[self._get_canonical_id(idx) for idx in qureg]
+                          for qureg in qubits]
+                controls = [self._get_canonical_id(idx) for idx in controls]
+            parameter = None
+            tags = []
+            for tag in cmd.tags:
+                if isinstance(tag, _ParameterTag):
+                    parameter = tag.index
+                elif isinstance(tag, LogicalQubitIDTag):
+                    tags.append(LogicalQubitIDTag(
+                        self._get_canonical_id(tag.logical_qubit_id)))
+                else:
+                    tags.append(tag)
+            if isinstance(cmd.gate, (BasicRotationGate, BasicPhaseGate)):
+                if parameter is not None:
+                    sample.append((self._angles[parameter], cmd.gate.angle))
+            else:
+                parameter = None
+            template.append((cmd.gate, qubits, controls, tags, parameter))
+        mapping = None
+        if mapper is not None:
+            mapping = [(self._get_canonical_id(logical_id), mapped_id)
+                       for logical_id, mapped_id in sorted(
+                           (mapper.current_mapping or dict()).items(),
+                           key=lambda item: item[1])]
+        samples = [sample]
+        if (entry is not None and entry['mapping'] == mapping and
+                _same_structure(entry['template'], template)):
+            template = entry['template']
+            samples = (entry['samples'] + samples)[-_MAX_SAMPLES:]
+        self._store(key, {'template': template,
+                          'mapping': mapping,
+                          'samples': samples,
+                          'coefficients': _solve(template, samples)})
+
+    def _replay(self, entry, boundary):
+        """ Sends the compiled commands of a chunk to the back-end. """
+        mapper = self._mapper
+        command_list = []
+        for (gate, qubits, controls, tags, parameter), coefficients in zip(
+                entry['template'], entry['coefficients']):
+            if coefficients is not None:
+                factor, offset = coefficients
+                gate = type(gate)(factor * self._angles[parameter] + offset)
+            if mapper is None:
+                qubits = [[self._get_logical_id(idx) for idx in qureg]
+                          for qureg in qubits]
+                controls = [self._get_logical_id(idx) for idx in controls]
+            tags = [LogicalQubitIDTag(self._get_logical_id(
+                        tag.logical_qubit_id))
+                    if isinstance(tag, LogicalQubitIDTag) else tag
+                    for tag in tags]
+            command_list.append(Command(
+                self, gate,
+                tuple([WeakQubitRef(self, idx) for idx in qureg]
+                      for qureg in qubits),
+                [WeakQubitRef(self, idx) for idx in controls], tags))
+        if mapper is not None:
+            mapper.current_mapping = {
+                self._get_logical_id(canonical_id): mapped_id
+                for canonical_id, mapped_id in entry['mapping']}
+        if len(command_list) > 0:
+            self._recorder.send(command_list)
+        if boundary[0] == 'sync':
+            self._recorder.next_engine.synchronize_qubits(boundary[1])
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".pkl")
+
+    def _load(self, key):
+        """ Returns the cache entry of key (or None). """
+        if (key not in self._entries and self.cache_dir is not None and
+                os.path.exists(self._path(key))):
+            self._entries[key] = None  # stored by another process
+        if key not in self._entries:
+            return None
+        entry = self._entries[key]
+        if self.cache_dir is not None:
+            try:
+                if entry is None:
+                    with open(self._path(key), 'rb') as cache_file:
+                        entry = pickle.load(cache_file)
+                    self._entries[key] = entry
+                os.utime(self._path(key), None)
+            except Exception:  # invalid or removed file
+                self._remove(key)
+                return None
+        self._entries[key] = self._entries.pop(key)  # most recently used
+        return entry
+
+    def _store(self, key, entry):
+        """ Stores a cache entry and removes the least recently used ones. """
+        self._entries.pop(key, None)
+        self._entries[key] = entry  # most recently used
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+        if self.cache_dir is None:
+            return
+        try:
+            data = pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:  # e.g., a gate which cannot be pickled
+            return
+        handle, path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(handle, 'wb') as cache_file:
+            cache_file.write(data)
+        try:
+            os.rename(path, self._path(key))
+        except OSError:  # the file exists (Windows)
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            os.rename(path, self._path(key))
+
+    def _remove(self, key):
+        """ Removes a cache entry from memory and disk. """
+        self._entries.pop(key, None)
+        if self.cache_dir is not None:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def clear(self):
+        """ Removes all cache entries (also from disk). """
+        for key in list(self._entries):
+            self._remove(key)
+
+    def _process_chunk(self, boundary):
+        """
+        Replays or compiles the commands received since the end of the
+        previous chunk.
+
+        Args:
+            boundary (tuple): ('flush',), ('sync', qubit_ids), or ('free',)
+                if the chunk ends with a FlushGate, a synchronization of the
+                qubits, or the deallocation of the last qubit.
+        """
+        command_list, self._chunk = self._chunk, []
+        if not self._is_set_up:
+            self._setup()
+        structure = None
+        if self._chain is not None:
+            structure, command_list = self._get_structure(command_list,
+                                                          boundary)
+        if structure is None:
+            self._chain = None
+            self._catch_up()
+            self._compile(command_list, boundary)
+        else:
+            key = hashlib.sha256(
+                (self._chain + "\n" + structure).encode()).hexdigest()
+            self._chain = key
+            entry = self._load(key)
+            if entry is not None and entry['coefficients'] is not None:
+                self.num_hits += 1
+                self._replay(entry, boundary)
+                self._replayed.append((command_list, boundary,
+                                       len(entry['template'])))
+            else:
+                self.num_misses += 1
+                self._catch_up()
+                output = self._compile(command_list, boundary)
+                self._learn(key, entry, output)
+        if boundary[0] == 'free':
+            self._start_circuit()
+
+    def synchronize_qubits(self, qubit_ids):
+        """
+        Replays or compiles the received commands such that the back-end can
+        provide the measurement results of the given qubits.
+
+        Args:
+            qubit_ids (list<int>): Logical IDs of the qubits to synchronize.
+        """
+        self._process_chunk(('sync', list(qubit_ids)))
+
+    def receive(self, command_list):
+        """
+        Receives a command list and stores the commands until the end of the
+        current chunk.
+
+        Args:
+            command_list (list<Command>): List of commands to receive.
+        """
+        for cmd in command_list:
+            self._chunk.append(cmd)
+            if isinstance(cmd.gate, AllocateQubitGate):
+                self._allocated_ids.add(cmd.qubits[0][0].id)
+            elif isinstance(cmd.gate, DeallocateQubitGate):
+                self._allocated_ids.discard(cmd.qubits[0][0].id)
+                if len(self._allocated_ids) == 0:
+                    self._process_chunk(('free',))
+            elif isinstance(cmd.gate, FlushGate):
+                self._process_chunk(('flush',))
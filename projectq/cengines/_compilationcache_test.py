@@ -0,0 +1,229 @@
+#   Copyright 2018 ProjectQ-Framework (www.projectq.ch)
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Tests for projectq.cengines._compilationcache.py."""
+import itertools
+import math
+import os
+import random
+
+import numpy as np
+import pytest
+
+import projectq.setups.default
+import projectq.setups.linear
+import projectq.setups.restrictedgateset
+from projectq import MainEngine
+from projectq.backends import Simulator
+from projectq.cengines import (AutoReplacer, CommandModifier, DummyEngine,
+                               LocalOptimizer, TagRemover)
+from projectq.meta import LoopTag
+from projectq.ops import (All, C, CNOT, H, Measure, QFT, R, Rx, Ry, Rz, Swap,
+                          X)
+
+from projectq.cengines import _compilationcache as cc
+
+
+def _circuit(eng, angles):
+    qureg = eng.allocate_qureg(4)
+    H | qureg[0]
+    Rx(angles[0]) | qureg[1]
+    CNOT | (qureg[0], qureg[3])
+    C(Rz(angles[1])) | (qureg[0], qureg[1])
+    Ry(angles[2]) | qureg[2]
+    C(R(angles[0])) | (qureg[2], qureg[3])
+    QFT | qureg
+    Rz(angles[2]) | qureg[3]
+    eng.flush()
+    amplitudes = np.array([eng.backend.get_amplitude(bits, qureg)
+                           for bits in itertools.product([0, 1], repeat=4)])
+    All(Measure) | qureg
+    del qureg
+    return amplitudes
+
+
+def _linear_engines():
+    return projectq.setups.linear.get_engine_list(
+        num_qubits=5, one_qubit_gates=(Rx, Ry, Rz, H),
+        two_qubit_gates=(CNOT,))
+
+
+@pytest.mark.parametrize("get_engine_list",
+                         [projectq.setups.default.get_engine_list,
+                          _linear_engines])
+def test_cache_replays_correctly(tmpdir, get_engine_list):
+    cache = cc.CompilationCache(str(tmpdir))
+    eng = MainEngine(Simulator(), [cache] + get_engine_list())
+    reference_eng = MainEngine(Simulator(), get_engine_list())
+    rng = random.Random(0)
+    for _ in range(4):
+        angles = [rng.uniform(0, 7) for _ in range(3)]
+        amplitudes = _circuit(eng, angles)
+        reference_amplitudes = _circuit(reference_eng, angles)
+        # the simulators only agree up to a global phase
+        assert (abs(np.vdot(amplitudes, reference_amplitudes)) ==
+                pytest.approx(1.))
+    # the final chunk (without angles) is cached after the first circuit
+    assert cache.num_misses == 3
+    assert cache.num_hits == 5
+    # a new cache on the same directory replays all circuits
+    cache = cc.CompilationCache(str(tmpdir))
+    eng = MainEngine(Simulator(), [cache] + get_engine_list())
+    angles = [rng.uniform(0, 7) for _ in range(3)]
+    amplitudes = _circuit(eng, angles)
+    reference_amplitudes = _circuit(reference_eng, angles)
+    assert (abs(np.vdot(amplitudes, reference_amplitudes)) ==
+            pytest.approx(1.))
+    assert cache.num_misses == 0
+    assert cache.num_hits == 2
+
+
+def test_cache_synchronize_qubits():
+    cache = cc.CompilationCache()
+    eng = MainEngine(Simulator(), [cache, LocalOptimizer()])
+    for _ in range(3):
+        qureg = eng.allocate_qureg(2)
+        X | qureg[0]
+        CNOT | (qureg[0], qureg[1])
+        Measure | qureg[1]
+        # the chunk is replayed before the measurement result is read
+        assert int(qureg[1]) == 1
+        Measure | qureg[0]
+        assert int(qureg[0]) == 1
+        del qureg
+    assert (cache.num_hits, cache.num_misses) == (6, 3)
+
+
+def test_cache_invalidated_by_engines(tmpdir, monkeypatch):
+    cache = cc.CompilationCache(str(tmpdir))
+    eng = MainEngine(DummyEngine(), [cache, LocalOptimizer(m=5)])
+    for _ in range(2):
+        qureg = eng.allocate_qureg(2)
+        CNOT | (qureg[0], qureg[1])
+        del qureg
+    assert (cache.num_hits, cache.num_misses) == (1, 1)
+    cache = cc.CompilationCache(str(tmpdir))
+    eng = MainEngine(DummyEngine(), [cache, LocalOptimizer(m=6)])
+    qureg = eng.allocate_qureg(2)
+    CNOT | (qureg[0], qureg[1])
+    del qureg
+    assert (cache.num_hits, cache.num_misses) == (0, 1)
+    # a new ProjectQ version invalidates the cache
+    monkeypatch.setattr(cc, '__version__', "0.0.0")
+    cache = cc.CompilationCache(str(tmpdir))
+    eng = MainEngine(DummyEngine(), [cache, LocalOptimizer(m=6)])
+    qureg = eng.allocate_qureg(2)
+    CNOT | (qureg[0], qureg[1])
+    del qureg
+    assert (cache.num_hits, cache.num_misses) == (0, 1)
+    cache.clear()
+    assert os.listdir(str(tmpdir)) == []
+
+
+def test_cache_invalidated_by_closures(tmpdir):
+    # the filter of the restricted gate set captures the allowed gates
+    for two_qubit_gates, num_hits, num_swaps in [((Swap,), 0, 1),
+                                                 ((Swap,), 1, 1),
+                                                 ((CNOT,), 0, 0)]:
+        cache = cc.CompilationCache(str(tmpdir))
+        backend = DummyEngine(save_commands=True)
+        eng = MainEngine(backend, [cache] +
+                         projectq.setups.restrictedgateset.get_engine_list(
+                             two_qubit_gates=two_qubit_gates))
+        qureg = eng.allocate_qureg(2)
+        Swap | (qureg[0], qureg[1])
+        del qureg
+        assert cache.num_hits == num_hits
+        assert len([cmd for cmd in backend.received_commands
+                    if cmd.gate == Swap]) == num_swaps
+
+
+def test_cache_disabled_for_undescribable_engines():
+    marker = object()  # has neither a __dict__ nor __slots__
+    cache = cc.CompilationCache()
+    eng = MainEngine(DummyEngine(), [cache, CommandModifier(
+        lambda cmd: cmd if marker else None)])
+    qureg = eng.allocate_qureg(2)
+    CNOT | (qureg[0], qureg[1])
+    del qureg
+    assert (cache.num_hits, cache.num_misses) == (0, 0)
+
+
+def test_cache_least_recently_used(tmpdir):
+    cache = cc.CompilationCache(str(tmpdir), max_entries=2)
+    eng = MainEngine(DummyEngine(), [cache, TagRemover()])
+
+    def circuit(num_qubits):
+        qureg = eng.allocate_qureg(num_qubits)
+        All(H) | qureg
+        del qureg
+
+    circuit(1)
+    circuit(2)
+    circuit(1)
+    circuit(3)
+    assert len(os.listdir(str(tmpdir))) == 2
+    assert (cache.num_hits, cache.num_misses) == (1, 3)
+    circuit(1)
+    circuit(2)
+    assert (cache.num_hits, cache.num_misses) == (2, 4)
+    # invalid files are removed
+    for name in os.listdir(str(tmpdir)):
+        with open(os.path.join(str(tmpdir), name), 'w') as cache_file:
+            cache_file.write("invalid")
+    cache = cc.CompilationCache(str(tmpdir), max_entries=2)
+    eng = MainEngine(DummyEngine(), [cache, TagRemover()])
+    circuit(1)
+    assert (cache.num_hits, cache.num_misses) == (0, 1)
+    assert len(os.listdir(str(tmpdir))) == 2
+
+
+def test_solve():
+    gate = Rz(0.)
+    template = [(H, [[0]], [], [], None), (gate, [[0]], [], [], 0)]
+    # compiled angle -angle / 2 + 1
+    samples = [[(0.5, 0.75)], [(1.5, 0.25)]]
+    coefficients = cc._solve(template, samples)
+    assert coefficients[0] is None
+    factor, offset = coefficients[1]
+    assert factor == pytest.approx(-0.5)
+    assert offset == pytest.approx(1.)
+    # a single sample does not determine the coefficients
+    assert cc._solve(template, samples[:1]) is None
+    # an angle which is not of the form c * angle + b
+    assert cc._solve(template, samples + [[(2., math.sqrt(2))]]) is None
+
+
+def test_describe():
+    assert cc._describe([1, 2.5, "a", None]) == "[1,2.5,'a',None]"
+    assert cc._describe({2: 3, 1: 4}) == "{1:4,2:3}"
+    assert cc._describe(H) != cc._describe(type(H))
+    assert cc._describe(LoopTag(2)) != cc._describe(LoopTag(3))
+
+    def make_filter(gates):
+        return lambda cmd: cmd.gate in gates
+
+    assert (cc._describe(make_filter((Swap,))) !=
+            cc._describe(make_filter((CNOT,))))
+    assert (cc._describe(make_filter((Swap,))) ==
+            cc._describe(make_filter((Swap,))))
+    assert (cc._describe(lambda cmd: True) !=
+            cc._describe(lambda cmd: False))
+    with pytest.raises(cc._UndescribableError):
+        cc._describe([object()])
+    assert (cc._describe_engine(LocalOptimizer(m=5)) !=
+            cc._describe_engine(LocalOptimizer(m=6)))
+    replacer = projectq.setups.default.get_engine_list()[2]
+    assert isinstance(replacer, AutoReplacer)
+    assert "_decompose_" in cc._describe_engine(replacer)
@@ -0,0 +1,582 @@
+#   Copyright 2018 ProjectQ-Framework (www.projectq.ch)
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Mapper for a quantum circuit to an arbitrary connectivity graph of qubits.
+
+Input: Quantum circuit with 1 and 2 qubit gates on n qubits. Gates are assumed
+       to be applied in parallel if they act on disjoint qubit(s) and any pair
+       of qubits can perform a 2 qubit gate (all-to-all connectivity)
+Output: Quantum circuit in which 2 qubit gates only act on qubits which are
+        connected by an edge of the connectivity graph. The mapper inserts
+        Swap gates, which are chosen using a lookahead heuristic (SABRE, see
+        arXiv:1809.02573), in order to move qubits next to each other.
+"""
+
+from collections import deque
+from copy import deepcopy
+
+import networkx as nx
+
+from projectq.cengines import BasicMapperEngine, return_swap_depth
+from projectq.meta import LogicalQubitIDTag
+from projectq.ops import (Allocate, AllocateQubitGate, Deallocate,
+                          DeallocateQubitGate, Command, FlushGate, Swap)
+from projectq.types import WeakQubitRef
+
+
+class _Node(object):
+    """
+    Stored command of the GraphMapper.
+
+    Attributes:
+        cmd (Command): The stored command.
+        ids (list<int>): Logical ids of the qubits the command acts on.
+        done (bool): True once the command has been sent on.
+    """
+    __slots__ = ('cmd', 'ids', 'done')
+
+    def __init__(self, cmd, ids):
+        self.cmd = cmd
+        self.ids = ids
+        self.done = False
+
+
+class _SwapScores(object):
+    """
+    Score of the current mapping for a fixed set of gates (the gates at the
+    front of the circuit and the lookahead gates), together with the change
+    of the score for each Swap.
+
+    A Swap only changes the distances of the gates on the two swapped qubits.
+    Therefore, the score of all Swaps is accumulated gate by gate (for all
+    Swaps next to the qubits of the gate), and after applying a Swap only the
+    gates on the swapped qubits have to be updated.
+
+    Attributes:
+        front (list<_Node>): Gates at the front of the circuit.
+        score (float): Weighted sum of the distances of the gates.
+        delta (dict): Change of the score for each Swap (a, b) with a < b.
+    """
+    def __init__(self, distances, neighbors, front):
+        self._distances = distances
+        self._neighbors = neighbors
+        self._gates_of_qubit = dict()
+        self.front = front
+        self.score = 0.
+        self.delta = dict()
+
+    def add_gate(self, logical_id0, logical_id1, weight, mapping):
+        """
+        Add a gate with the given weight to the score.
+        """
+        gate = (logical_id0, logical_id1, weight)
+        for logical_id in (logical_id0, logical_id1):
+            if logical_id not in self._gates_of_qubit:
+                self._gates_of_qubit[logical_id] = []
+            self._gates_of_qubit[logical_id].append(gate)
+        self._update(gate, mapping, 1.)
+
+    def remove_gates(self, logical_ids, mapping):
+        """
+        Remove the gates on the given qubits from the score, e.g., before the
+        qubits are swapped.
+
+        Returns:
+            The removed gates (to be added again using add_gates).
+        """
+        gates = []
+        for logical_id in logical_ids:
+            for gate in self._gates_of_qubit.get(logical_id, ()):
+                if gate not in gates:
+                    gates.append(gate)
+                    self._update(gate, mapping, -1.)
+        return gates
+
+    def add_gates(self, gates, mapping):
+        """
+        Add gates which have been removed using remove_gates again.
+        """
+        for gate in gates:
+            self._update(gate, mapping, 1.)
+
+    def _update(self, gate, mapping, sign):
+        logical_id0, logical_id1, weight = gate
+        weight *= sign
+        mapped_id0 = mapping[logical_id0]
+        mapped_id1 = mapping[logical_id1]
+        distance = self._distances[mapped_id0][mapped_id1]
+        self.score += weight * distance
+        delta = self.delta
+        for mapped_id, other in ((mapped_id0, mapped_id1),
+                                 (mapped_id1, mapped_id0)):
+            other_distances = self._distances[other]
+            for neighbor in self._neighbors[mapped_id]:
+                if neighbor == other:
+                    continue  # Swap does not change the distance
+                swap = ((mapped_id, neighbor) if mapped_id < neighbor
+                        else (neighbor, mapped_id))
+                delta[swap] = (delta.get(swap, 0.) +
+                               weight * (other_distances[neighbor] - distance))
+
+
+class GraphMapper(BasicMapperEngine):
+    """
+    Maps a quantum circuit to qubits with an arbitrary connectivity graph.
+
+    The stored commands are routed like in SABRE: All commands at the front
+    of the circuit which can be executed with the current mapping are sent
+    on. If only 2-qubit gates on qubits which are not connected are left at
+    the front, the mapper applies the Swap (on an edge of the graph next to
+    one of these qubits) which minimizes the sum of the distances of the
+    qubits of these gates plus (weighted) the distances of the qubits of the
+    next lookahead 2-qubit gates. A decay factor penalizes swapping the same
+    qubits over and over again.
+
+    The distances between all pairs of qubits are computed once, and the
+    scores of the Swaps are updated incrementally (see _SwapScores).
+
+    Attributes:
+        current_mapping:  Stores the mapping: key is logical qubit id, value
+                          is mapped qubit id (a node of the graph)
+        graph (networkx.Graph): Connectivity graph, its nodes are the mapped
+                                qubit ids 0,...,self.num_qubits-1
+        num_qubits (int): Number of mapped qubits
+        storage (int): Number of gate it caches before mapping.
+        lookahead (int): Number of 2-qubit gates after the front of the
+                         circuit which are taken into account for the choice
+                         of a Swap.
+        lookahead_weight (float): Weight of the lookahead gates (compared to
+                                  the gates at the front of the circuit).
+        decay (float): Penalty for swapping a qubit which has been swapped
+                       recently.
+        num_mappings (int): Number of times the mapper changed the mapping,
+                            i.e., the number of routing rounds (each routing
+                            the stored commands) which required Swaps
+        depth_of_swaps (dict): Key are circuit depth of swaps, value is the
+                               number of such mappings which have been
+                               applied
+        num_of_swaps_per_mapping (dict): Key are the number of swaps per
+                                         mapping, value is the number of such
+                                         mappings which have been applied
+
+    Note:
+        1) Gates are cached and only mapped from time to time. A
+           FastForwarding gate doesn't empty the cache, only a FlushGate does.
+        2) Only 1 and two qubit gates allowed.
+        3) Does not optimize for dirty qubits.
+    """
+
+    def __init__(self, graph, storage=1000, lookahead=20,
+                 lookahead_weight=0.5, decay=0.001):
+        """
+        Initialize a GraphMapper compiler engine.
+
+        Args:
+            graph (networkx.Graph): Connected graph whose nodes are the mapped
+                                    qubit ids 0,...,n-1 and whose edges are
+                                    the pairs of qubits which can perform a
+                                    2 qubit gate.
+            storage(int): Number of gates to temporarily store, default is 1000
+            lookahead(int): Number of 2-qubit gates to look ahead, default
+                            is 20
+            lookahead_weight(float): Weight of the lookahead gates, default
+                                     is 0.5
+            decay(float): Increase of the decay factor of a qubit per Swap,
+                          default is 0.001
+
+        Raises:
+            ValueError: If the nodes of the graph are not 0,...,n-1 or if the
+                        graph is not connected.
+        """
+        BasicMapperEngine.__init__(self)
+        self.num_qubits = graph.number_of_nodes()
+        if set(graph.nodes()) != set(range(self.num_qubits)):
+            raise ValueError("The nodes of the graph have to be the mapped "
+                             "qubit ids 0,...,n-1.")
+        if self.num_qubits == 0 or not nx.is_connected(graph):
+            raise ValueError("The graph has to be connected.")
+        self.graph = graph
+        self.storage = storage
+        self.lookahead = lookahead
+        self.lookahead_weight = lookahead_weight
+        self.decay = decay
+        # Distances between all pairs of mapped qubits:
+        self._distances = [[0] * self.num_qubits
+                           for _ in range(self.num_qubits)]
+        for mapped_id, lengths in nx.all_pairs_shortest_path_length(graph):
+            for other_id, distance in lengths.items():
+                self._distances[mapped_id][other_id] = distance
+        self._neighbors = [sorted(graph.neighbors(mapped_id))
+                           for mapped_id in range(self.num_qubits)]
+        # Number of Swaps without executing a gate, after which the mapper
+        # moves the qubits of a gate along a shortest path:
+        diameter = max(max(row) for row in self._distances)
+        self._max_swaps_without_progress = 3 * max(diameter, 1)
+        # Storing commands
+        self._stored_commands = list()
+        # Inverse of the current mapping:
+        self._mapped_to_logical = dict()
+        # State of the current routing round (see _run):
+        self._queues = None
+        self._front = None
+        self._blocked = None
+        # Statistics:
+        self.num_mappings = 0
+        self.depth_of_swaps = dict()
+        self.num_of_swaps_per_mapping = dict()
+
+    @property
+    def current_mapping(self):
+        return deepcopy(self._current_mapping)
+
+    @current_mapping.setter
+    def current_mapping(self, current_mapping):
+        self._current_mapping = current_mapping
+        self._mapped_to_logical = dict()
+        if current_mapping is not None:
+            for logical_id, mapped_id in current_mapping.items():
+                self._mapped_to_logical[mapped_id] = logical_id
+
+    def is_available(self, cmd):
+        """
+        Only allows 1 or two qubit gates.
+        """
+        num_qubits = 0
+        for qureg in cmd.all_qubits:
+            num_qubits += len(qureg)
+        if num_qubits <= 2:
+            return True
+        else:
+            return False
+
+    def _find_free_qubit(self, logical_id):
+        """
+        Returns a free mapped qubit id for a newly allocated qubit (or None if
+        all mapped qubits are in use).
+
+        The qubit is placed as close as possible to its first interaction
+        partner which is already placed, otherwise on the free qubit with the
+        most neighbours.
+        """
+        free_ids = [mapped_id for mapped_id in range(self.num_qubits)
+                    if mapped_id not in self._mapped_to_logical]
+        if len(free_ids) == 0:
+            return None
+        queue = self._queues[logical_id]
+        for i in range(1, min(len(queue), self.lookahead)):
+            node = queue[i]
+            if len(node.ids) == 2:
+                partner = node.ids[0] + node.ids[1] - logical_id
+                if partner in self._current_mapping:
+                    distances = self._distances[
+                        self._current_mapping[partner]]
+                    return min(free_ids, key=lambda x: (distances[x], x))
+        return max(free_ids, key=lambda x: (len(self._neighbors[x]), -x))
+
+    def _send_executable_commands(self, candidates):
+        """
+        Sends the candidate nodes on if they are at the front of the circuit
+        and can be executed using the current mapping, followed by all nodes
+        which can be executed afterwards.
+
+        2-qubit gates at the front of the circuit whose qubits are not
+        connected are collected in self._front and Allocate gates for which
+        there is no free qubit in self._blocked.
+
+        Args:
+            candidates (list<_Node>): Nodes to check.
+
+        Returns:
+            Number of nodes which have been sent on.
+        """
+        queues = self._queues
+        mapping = self._current_mapping
+        num_sent = 0
+        # handle the nodes in the order of the circuit (as far as possible)
+        candidates = deque(candidates)
+        while candidates:
+            node = candidates.popleft()
+            if node.done or any(queues[idx][0] is not node
+                                for idx in node.ids):
+                continue
+            gate = node.cmd.gate
+            if isinstance(gate, AllocateQubitGate):
+                logical_id = node.ids[0]
+                mapped_id = self._find_free_qubit(logical_id)
+                if mapped_id is None:
+                    self._blocked.append(node)
+                    continue
+                mapping[logical_id] = mapped_id
+                self._mapped_to_logical[mapped_id] = logical_id
+                qb = WeakQubitRef(engine=self, idx=mapped_id)
+                self.send([Command(engine=self, gate=AllocateQubitGate(),
+                                   qubits=([qb],),
+                                   tags=[LogicalQubitIDTag(logical_id)])])
+            elif isinstance(gate, DeallocateQubitGate):
+                logical_id = node.ids[0]
+                if logical_id not in mapping:
+                    continue
+                mapped_id = mapping.pop(logical_id)
+                del self._mapped_to_logical[mapped_id]
+                qb = WeakQubitRef(engine=self, idx=mapped_id)
+                self.send([Command(engine=self, gate=DeallocateQubitGate(),
+                                   qubits=([qb],),
+                                   tags=[LogicalQubitIDTag(logical_id)])])
+                # the freed qubit can be used by a blocked allocation
+                candidates.extend(self._blocked)
+                self._blocked = []
+            else:
+                if any(idx not in mapping for idx in node.ids):
+                    continue
+                if len(node.ids) == 2:
+                    if self._distances[mapping[node.ids[0]]][
+                            mapping[node.ids[1]]] != 1:
+                        self._front.add(node)
+                        continue
+                    self._front.discard(node)
+                self._send_cmd_with_mapped_ids(node.cmd)
+            node.done = True
+            num_sent += 1
+            for idx in node.ids:
+                queue = queues[idx]
+                queue.popleft()
+                if len(queue) > 0:
+                    candidates.append(queue[0])
+        return num_sent
+
+    def _get_lookahead_nodes(self, front):
+        """
+        Returns the next (at most self.lookahead) 2-qubit gates which follow
+        the gates at the front on their qubits.
+        """
+        mapping = self._current_mapping
+        ids = sorted(idx for node in front for idx in node.ids)
+        lookahead_nodes = []
+        seen = set(front)
+        # the lookahead only considers a limited number of commands per qubit
+        for i in range(1, 4 * self.lookahead + 1):
+            found_more = False
+            for idx in ids:
+                queue = self._queues[idx]
+                if i >= len(queue):
+                    continue
+                found_more = True
+                node = queue[i]
+                if (len(node.ids) == 2 and node not in seen
+                        and node.ids[0] in mapping
+                        and node.ids[1] in mapping):
+                    seen.add(node)
+                    lookahead_nodes.append(node)
+                    if len(lookahead_nodes) == self.lookahead:
+                        return lookahead_nodes
+            if not found_more:
+                break
+        return lookahead_nodes
+
+    def _get_swap_scores(self):
+        """
+        Returns the scores of all Swaps (see _SwapScores) for the gates at the
+        front of the circuit and the lookahead gates.
+        """
+        front = sorted(self._front, key=lambda node: node.ids)
+        lookahead_nodes = self._get_lookahead_nodes(front)
+        scores = _SwapScores(self._distances, self._neighbors, front)
+        for node in front:
+            scores.add_gate(node.ids[0], node.ids[1], 1. / len(front),
+                            self._current_mapping)
+        for node in lookahead_nodes:
+            scores.add_gate(node.ids[0], node.ids[1],
+                            self.lookahead_weight / len(lookahead_nodes),
+                            self._current_mapping)
+        return scores
+
+    def _choose_swap(self, scores, decay):
+        """
+        Returns the Swap (as a tuple of two mapped qubit ids) next to a qubit
+        of a gate at the front with the lowest score.
+
+        Args:
+            scores (_SwapScores): Scores of the Swaps.
+            decay (list<float>): Decay factor of each mapped qubit.
+        """
+        mapping = self._current_mapping
+        best_swap = None
+        best_score = None
+        for node in scores.front:
+            for idx in node.ids:
+                mapped_id = mapping[idx]
+                for neighbor in self._neighbors[mapped_id]:
+                    swap = ((mapped_id, neighbor) if mapped_id < neighbor
+                            else (neighbor, mapped_id))
+                    swap_score = ((scores.score + scores.delta.get(swap, 0.)) *
+                                  max(decay[mapped_id], decay[neighbor]))
+                    if (best_score is None or swap_score < best_score or
+                            (swap_score == best_score and swap < best_swap)):
+                        best_score = swap_score
+                        best_swap = swap
+        return best_swap
+
+    def _get_shortest_path_swap(self):
+        """
+        Returns a Swap which moves the qubits of the gate at the front with
+        the shortest distance one step closer to each other.
+
+        Used to guarantee progress if the heuristic keeps swapping qubits
+        back and forth.
+        """
+        mapping = self._current_mapping
+        distances = self._distances
+        node = min(self._front, key=lambda node: (
+            distances[mapping[node.ids[0]]][mapping[node.ids[1]]], node.ids))
+        mapped_id0 = mapping[node.ids[0]]
+        mapped_id1 = mapping[node.ids[1]]
+        for neighbor in self._neighbors[mapped_id0]:
+            if (distances[neighbor][mapped_id1] ==
+                    distances[mapped_id0][mapped_id1] - 1):
+                return (min(mapped_id0, neighbor), max(mapped_id0, neighbor))
+
+    def _swap(self, mapped_id0, mapped_id1):
+        """
+        Sends a Swap gate and updates the current mapping.
+
+        If one of the two mapped qubits is not in use, it is allocated for
+        the Swap and the other one is deallocated afterwards.
+        """
+        mapping = self._current_mapping
+        logical_id0 = self._mapped_to_logical.pop(mapped_id0, None)
+        logical_id1 = self._mapped_to_logical.pop(mapped_id1, None)
+        qb0 = WeakQubitRef(engine=self, idx=mapped_id0)
+        qb1 = WeakQubitRef(engine=self, idx=mapped_id1)
+        if logical_id0 is None:
+            self.send([Command(engine=self, gate=Allocate, qubits=([qb0],))])
+        if logical_id1 is None:
+            self.send([Command(engine=self, gate=Allocate, qubits=([qb1],))])
+        self.send([Command(engine=self, gate=Swap, qubits=([qb0], [qb1]))])
+        if logical_id0 is None:
+            self.send([Command(engine=self, gate=Deallocate,
+                               qubits=([qb1],))])
+        else:
+            mapping[logical_id0] = mapped_id1
+            self._mapped_to_logical[mapped_id1] = logical_id0
+        if logical_id1 is None:
+            self.send([Command(engine=self, gate=Deallocate,
+                               qubits=([qb0],))])
+        else:
+            mapping[logical_id1] = mapped_id0
+            self._mapped_to_logical[mapped_id0] = logical_id1
+
+    def _run(self):
+        """
+        Routes the stored commands.
+
+        Sends all commands which can be executed and inserts Swaps whenever
+        only 2-qubit gates on qubits which are not connected are left at the
+        front of the circuit. Commands which cannot be executed (e.g., an
+        Allocate if all mapped qubits are in use) remain stored.
+        """
+        num_of_stored_commands_before = len(self._stored_commands)
+        if self._current_mapping is None:
+            self._current_mapping = dict()
+        # Pipeline of stored commands of each logical qubit:
+        nodes = []
+        self._queues = dict()
+        for cmd in self._stored_commands:
+            ids = [qubit.id for qureg in cmd.all_qubits for qubit in qureg]
+            if len(ids) > 2 or len(ids) == 0:
+                raise Exception("Invalid command (number of qubits): " +
+                                str(cmd))
+            node = _Node(cmd, ids)
+            nodes.append(node)
+            for idx in ids:
+                if idx not in self._queues:
+                    self._queues[idx] = deque()
+                self._queues[idx].append(node)
+        self._front = set()
+        self._blocked = []
+
+        swaps = []
+        decay = [1.] * self.num_qubits
+        num_swaps_without_progress = 0
+        scores = None
+        candidates = [queue[0] for queue in self._queues.values()]
+        while True:
+            if self._send_executable_commands(candidates) > 0:
+                num_swaps_without_progress = 0
+                decay = [1.] * self.num_qubits
+                scores = None  # the gates at the front have changed
+            if len(self._front) == 0:
+                break
+            if scores is None:
+                scores = self._get_swap_scores()
+            if num_swaps_without_progress >= self._max_swaps_without_progress:
+                mapped_id0, mapped_id1 = self._get_shortest_path_swap()
+            else:
+                mapped_id0, mapped_id1 = self._choose_swap(scores, decay)
+            swapped_ids = [self._mapped_to_logical.get(mapped_id0),
+                           self._mapped_to_logical.get(mapped_id1)]
+            gates = scores.remove_gates(swapped_ids, self._current_mapping)
+            self._swap(mapped_id0, mapped_id1)
+            scores.add_gates(gates, self._current_mapping)
+            swaps.append((mapped_id0, mapped_id1))
+            num_swaps_without_progress += 1
+            if num_swaps_without_progress % 5 == 0:
+                decay = [1.] * self.num_qubits
+            decay[mapped_id0] += self.decay
+            decay[mapped_id1] += self.decay
+            candidates = list(self._front)
+
+        self._stored_commands = [node.cmd for node in nodes if not node.done]
+        self._queues = None
+        self._front = None
+        self._blocked = None
+        # Register statistics:
+        if swaps:
+            self.num_mappings += 1
+            depth = return_swap_depth(swaps)
+            if depth not in self.depth_of_swaps:
+                self.depth_of_swaps[depth] = 1
+            else:
+                self.depth_of_swaps[depth] += 1
+            if len(swaps) not in self.num_of_swaps_per_mapping:
+                self.num_of_swaps_per_mapping[len(swaps)] = 1
+            else:
+                self.num_of_swaps_per_mapping[len(swaps)] += 1
+        # Check that mapper actually made progress
+        if (len(self._stored_commands) > 0 and
+                len(self._stored_commands) == num_of_stored_commands_before):
+            raise RuntimeError("Mapper is potentially in an infinite loop. "
+                               "It is likely that the algorithm requires "
+                               "too many qubits. Increase the number of "
+                               "qubits for this mapper.")
+
+    def receive(self, command_list):
+        """
+        Receives a command list and, for each command, stores it until
+        we do a mapping (FlushGate or Cache of stored commands is full).
+
+        Args:
+            command_list (list of Command objects): list of commands to
+                receive.
+        """
+        for cmd in command_list:
+            if isinstance(cmd.gate, FlushGate):
+                while(len(self._stored_commands)):
+                    self._run()
+                self.send([cmd])
+            else:
+                self._stored_commands.append(cmd)
+            # Storage is full: Create new map and send some gates away:
+            if len(self._stored_commands) >= self.storage:
+                self._run()
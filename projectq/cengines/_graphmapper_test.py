@@ -0,0 +1,210 @@
+#   Copyright 2018 ProjectQ-Framework (www.projectq.ch)
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Tests for projectq.cengines._graphmapper.py."""
+import random
+
+import networkx as nx
+import pytest
+
+from projectq import MainEngine
+from projectq.backends import Simulator
+from projectq.cengines import DummyEngine
+from projectq.meta import LogicalQubitIDTag
+from projectq.ops import (All, AllocateQubitGate, BasicGate, CNOT, Command,
+                          DeallocateQubitGate, FlushGate, Measure, QFT, Rx,
+                          Swap, X)
+from projectq.types import WeakQubitRef
+
+from projectq.cengines import _graphmapper as gm
+
+
+def _ring_with_chord():
+    graph = nx.cycle_graph(6)
+    graph.add_edge(0, 3)
+    return graph
+
+
+def test_init_invalid_graph():
+    with pytest.raises(ValueError):
+        gm.GraphMapper(nx.Graph())
+    with pytest.raises(ValueError):
+        gm.GraphMapper(nx.relabel_nodes(nx.path_graph(3), {0: 3}))
+    graph = nx.path_graph(2)
+    graph.add_node(2)
+    with pytest.raises(ValueError):
+        gm.GraphMapper(graph)
+
+
+def test_is_available():
+    mapper = gm.GraphMapper(nx.path_graph(3))
+    qb0 = WeakQubitRef(engine=None, idx=0)
+    qb1 = WeakQubitRef(engine=None, idx=1)
+    qb2 = WeakQubitRef(engine=None, idx=2)
+    cmd0 = Command(None, BasicGate(), qubits=([qb0],))
+    assert mapper.is_available(cmd0)
+    cmd1 = Command(None, BasicGate(), qubits=([qb0],), controls=[qb1])
+    assert mapper.is_available(cmd1)
+    cmd2 = Command(None, BasicGate(), qubits=([qb0], [qb1, qb2]))
+    assert not mapper.is_available(cmd2)
+    cmd3 = Command(None, BasicGate(), qubits=([qb0], [qb1]), controls=[qb2])
+    assert not mapper.is_available(cmd3)
+
+
+def _random_circuit(eng, num_qubits, num_gates, seed):
+    rng = random.Random(seed)
+    qureg = eng.allocate_qureg(num_qubits)
+    for _ in range(num_gates):
+        qb0, qb1 = rng.sample(range(num_qubits), 2)
+        Rx(rng.random()) | qureg[qb0]
+        CNOT | (qureg[qb0], qureg[qb1])
+    return qureg
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_routing_is_correct(seed):
+    graph = _ring_with_chord()
+    backend = DummyEngine(save_commands=True)
+    simulator = Simulator()
+    mapper = gm.GraphMapper(graph, storage=20)
+    eng = MainEngine(simulator, [mapper, backend])
+    qureg = _random_circuit(eng, 5, 60, seed)
+    eng.flush()
+    reference_simulator = Simulator()
+    reference_eng = MainEngine(reference_simulator, [])
+    reference_qureg = _random_circuit(reference_eng, 5, 60, seed)
+    reference_eng.flush()
+    for i in range(1 << 5):
+        bits = [(i >> k) & 1 for k in range(5)]
+        assert (simulator.get_amplitude(bits, qureg) ==
+                pytest.approx(reference_simulator.get_amplitude(
+                    bits, reference_qureg)))
+    # all 2 qubit gates act on connected qubits
+    for cmd in backend.received_commands:
+        ids = [qb.id for qureg in cmd.all_qubits for qb in qureg]
+        if len(ids) == 2:
+            assert graph.has_edge(*ids)
+    num_swaps = len([cmd for cmd in backend.received_commands
+                     if cmd.gate == Swap])
+    assert num_swaps > 0
+    assert (sum(num * count for num, count
+                in mapper.num_of_swaps_per_mapping.items()) == num_swaps)
+    assert sum(mapper.depth_of_swaps.values()) == mapper.num_mappings
+    assert mapper.num_mappings > 0
+    All(Measure) | qureg
+    All(Measure) | reference_qureg
+
+
+def test_swap_with_unused_qubit():
+    backend = DummyEngine(save_commands=True)
+    backend.is_last_engine = True
+    mapper = gm.GraphMapper(nx.path_graph(4))
+    mapper.next_engine = backend
+    qb0 = WeakQubitRef(engine=None, idx=0)
+    qb1 = WeakQubitRef(engine=None, idx=1)
+    qb2 = WeakQubitRef(engine=None, idx=2)
+    cmd0 = Command(None, AllocateQubitGate(), qubits=([qb0],))
+    cmd1 = Command(None, AllocateQubitGate(), qubits=([qb1],))
+    cmd2 = Command(None, AllocateQubitGate(), qubits=([qb2],))
+    cmd3 = Command(None, X, qubits=([qb0],), controls=[qb1])
+    cmd4 = Command(None, X, qubits=([qb1],), controls=[qb2])
+    cmd5 = Command(None, X, qubits=([qb0],), controls=[qb2])
+    mapper.receive([cmd0, cmd1, cmd2, cmd3, cmd4, cmd5])
+    mapper._run()
+    assert mapper._stored_commands == []
+    assert len(mapper.current_mapping) == 3
+    allocated = set()
+    for cmd in backend.received_commands:
+        ids = [qb.id for qureg in cmd.all_qubits for qb in qureg]
+        if isinstance(cmd.gate, AllocateQubitGate):
+            assert ids[0] not in allocated
+            allocated.add(ids[0])
+        elif isinstance(cmd.gate, DeallocateQubitGate):
+            allocated.remove(ids[0])
+        else:
+            assert set(ids) <= allocated
+    assert allocated == set(mapper.current_mapping.values())
+
+
+def test_deallocation_frees_qubit():
+    backend = DummyEngine(save_commands=True)
+    backend.is_last_engine = True
+    mapper = gm.GraphMapper(nx.path_graph(2))
+    mapper.next_engine = backend
+    qb0 = WeakQubitRef(engine=None, idx=0)
+    qb1 = WeakQubitRef(engine=None, idx=1)
+    qb2 = WeakQubitRef(engine=None, idx=2)
+    cmds = [Command(None, AllocateQubitGate(), qubits=([qb0],)),
+            Command(None, AllocateQubitGate(), qubits=([qb1],)),
+            Command(None, AllocateQubitGate(), qubits=([qb2],)),
+            Command(None, X, qubits=([qb2],), controls=[qb1]),
+            Command(None, DeallocateQubitGate(), qubits=([qb0],))]
+    mapper.receive(cmds)
+    mapper._run()
+    assert mapper._stored_commands == []
+    assert set(mapper.current_mapping) == {1, 2}
+    tags = [cmd.tags for cmd in backend.received_commands
+            if isinstance(cmd.gate, AllocateQubitGate)]
+    assert [tag[0].logical_qubit_id for tag in tags] == [0, 1, 2]
+    assert isinstance(tags[0][0], LogicalQubitIDTag)
+
+
+def test_run_infinite_loop_detection():
+    mapper = gm.GraphMapper(nx.path_graph(1))
+    backend = DummyEngine(save_commands=True)
+    backend.is_last_engine = True
+    mapper.next_engine = backend
+    qb0 = WeakQubitRef(engine=None, idx=0)
+    qb1 = WeakQubitRef(engine=None, idx=1)
+    cmd0 = Command(None, AllocateQubitGate(), qubits=([qb0],))
+    cmd1 = Command(None, AllocateQubitGate(), qubits=([qb1],))
+    cmd2 = Command(None, X, qubits=([qb0],), controls=[qb1])
+    qb3 = WeakQubitRef(engine=None, idx=-1)
+    cmd_flush = Command(None, FlushGate(), qubits=([qb3],))
+    with pytest.raises(RuntimeError):
+        mapper.receive([cmd0, cmd1, cmd2, cmd_flush])
+    qb2 = WeakQubitRef(engine=None, idx=2)
+    cmd3 = Command(None, QFT, qubits=([qb0, qb1, qb2],))
+    mapper._stored_commands = [cmd3]
+    with pytest.raises(Exception):
+        mapper._run()
+
+
+def test_measurement_and_synchronize_qubits():
+    simulator = Simulator()
+    mapper = gm.GraphMapper(_ring_with_chord(), storage=1000)
+    eng = MainEngine(simulator, [mapper])
+    qureg = eng.allocate_qureg(4)
+    X | qureg[0]
+    CNOT | (qureg[0], qureg[3])
+    CNOT | (qureg[3], qureg[1])
+    Measure | qureg[1]
+    X | qureg[2]
+    assert len(mapper._stored_commands) > 0
+    # does not require a flush
+    assert int(qureg[1]) == 1
+    eng.flush()
+    All(Measure) | qureg
+    assert [int(qb) for qb in qureg] == [1, 1, 1, 1]
+
+
+def test_set_current_mapping():
+    mapper = gm.GraphMapper(nx.path_graph(3))
+    mapper.current_mapping = {5: 2, 6: 0}
+    assert mapper._mapped_to_logical == {2: 5, 0: 6}
+    mapping = mapper.current_mapping
+    mapping[7] = 1
+    assert mapper.current_mapping == {5: 2, 6: 0}
+    mapper.current_mapping = None
+    assert mapper._mapped_to_logical == dict()
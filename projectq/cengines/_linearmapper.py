@@ -26,7 +26,10 @@ Output: Quantum circuit in which qubits are placed in 1-D chain in which only
 from collections import deque
 from copy import deepcopy
 
-from projectq.cengines import BasicMapperEngine
+import networkx as nx
+
+from projectq.cengines import BasicMapperEngine, return_swap_depth
+from projectq.cengines._graphmapper import GraphMapper, _SwapScores
 from projectq.meta import LogicalQubitIDTag
 from projectq.ops import (Allocate, AllocateQubitGate, Deallocate,
                           DeallocateQubitGate, Command, FlushGate,
@@ -34,27 +37,21 @@ from projectq.ops import (Allocate, AllocateQubitGate, Deallocate,
 from projectq.types import WeakQubitRef
 
 
-def return_swap_depth(swaps):
+class _IncrementalRouter(GraphMapper):
     """
-    Returns the circuit depth to execute these swaps.
-
-    Args:
-        swaps(list of tuples): Each tuple contains two integers representing
-                               the two IDs of the qubits involved in the
-                               Swap operation
-    Returns:
-        Circuit depth to execute these swaps.
+    GraphMapper on the linear chain which routes the stored commands of a
+    LinearMapper in the incremental mode.
+
+    Instead of scoring all Swaps, the first qubit of the gate at the front
+    with the shortest distance is swapped one position towards the second
+    one.
     """
-    depth_of_qubits = dict()
-    for qb0_id, qb1_id in swaps:
-        if qb0_id not in depth_of_qubits:
-            depth_of_qubits[qb0_id] = 0
-        if qb1_id not in depth_of_qubits:
-            depth_of_qubits[qb1_id] = 0
-        max_depth = max(depth_of_qubits[qb0_id], depth_of_qubits[qb1_id])
-        depth_of_qubits[qb0_id] = max_depth + 1
-        depth_of_qubits[qb1_id] = max_depth + 1
-    return max(list(depth_of_qubits.values()) + [0])
+    def _get_swap_scores(self):
+        # the Swaps are not scored
+        return _SwapScores(self._distances, self._neighbors, [])
+
+    def _choose_swap(self, scores, decay):
+        return self._get_shortest_path_swap()
 
 
 class LinearMapper(BasicMapperEngine):
@@ -70,6 +67,8 @@ class LinearMapper(BasicMapperEngine):
                           is mapped qubit id from 0,...,self.num_qubits
         cyclic (Bool): If chain is cyclic or not
         storage (int): Number of gate it caches before mapping.
+        incremental (bool): If the mapping is updated incrementally instead
+                            of creating a new mapping of all qubits.
         num_mappings (int): Number of times the mapper changed the mapping
         depth_of_swaps (dict): Key are circuit depth of swaps, value is the
                                number of such mappings which have been
@@ -83,9 +82,17 @@ class LinearMapper(BasicMapperEngine):
            FastForwarding gate doesn't empty the cache, only a FlushGate does.
         2) Only 1 and two qubit gates allowed.
         3) Does not optimize for dirty qubits.
+        4) In the incremental mode, the stored commands are routed by a
+           GraphMapper on the (cyclic) chain: Only the qubits of the blocked
+           2-qubit gate with the shortest distance are moved towards each
+           other, one Swap at a time, until no stored gate is left (or the
+           remaining gates cannot be executed). The routing indexes the
+           stored commands by qubit such that a large storage (e.g. 100000
+           gates) can be used.
     """
 
-    def __init__(self, num_qubits, cyclic=False, storage=1000):
+    def __init__(self, num_qubits, cyclic=False, storage=1000,
+                 incremental=False):
         """
         Initialize a LinearMapper compiler engine.
 
@@ -93,17 +100,25 @@ class LinearMapper(BasicMapperEngine):
             num_qubits(int): Number of physical qubits in the linear chain
             cyclic(bool): If 1D chain is a cycle. Default is False.
             storage(int): Number of gates to temporarily store, default is 1000
+            incremental(bool): If True, the qubits are moved with individual
+                Swaps only where a 2-qubit gate requires it instead of
+                creating a new mapping of all qubits. Default is False.
         """
         BasicMapperEngine.__init__(self)
         self.num_qubits = num_qubits
         self.cyclic = cyclic
         self.storage = storage
+        self.incremental = incremental
         # Storing commands
         self._stored_commands = list()
         # Logical qubit ids for which the Allocate gate has already been
         # processed and sent to the next engine but which are not yet
         # deallocated:
         self._currently_allocated_ids = set()
+        # GraphMapper which routes the commands in the incremental mode and
+        # the (num_qubits, cyclic) it has been created for:
+        self._router = None
+        self._router_key = None
         # Statistics:
         self.num_mappings = 0
         self.depth_of_swaps = dict()
@@ -553,7 +568,12 @@ class LinearMapper(BasicMapperEngine):
         swaps. Then it creates a new map, swaps all the qubits to the new map,
         executes all possible gates, and finally deallocates mapped qubit ids
         which don't store any information.
+
+        In the incremental mode, see _run_incremental instead.
         """
+        if self.incremental:
+            self._run_incremental()
+            return
         num_of_stored_commands_before = len(self._stored_commands)
         if not self.current_mapping:
             self.current_mapping = dict()
@@ -620,6 +640,35 @@ class LinearMapper(BasicMapperEngine):
                                "too many qubits. Increase the number of "
                                "qubits for this mapper.")
 
+    def _run_incremental(self):
+        """
+        Routes the stored commands using a GraphMapper on the chain (see
+        _IncrementalRouter), which sends them on to the next engine.
+        """
+        key = (self.num_qubits, self.cyclic)
+        if self._router_key != key:
+            if self.cyclic and self.num_qubits > 2:
+                graph = nx.cycle_graph(self.num_qubits)
+            else:
+                graph = nx.path_graph(self.num_qubits)
+            self._router = _IncrementalRouter(graph)
+            self._router_key = key
+        router = self._router
+        router.main_engine = self.main_engine
+        router.next_engine = self.next_engine
+        router.current_mapping = self._current_mapping
+        router._stored_commands = self._stored_commands
+        router.num_mappings = self.num_mappings
+        router.depth_of_swaps = self.depth_of_swaps
+        router.num_of_swaps_per_mapping = self.num_of_swaps_per_mapping
+        try:
+            router._run()
+        finally:
+            self._current_mapping = router._current_mapping
+            self._currently_allocated_ids = set(self._current_mapping)
+            self._stored_commands = router._stored_commands
+            self.num_mappings = router.num_mappings
+
     def receive(self, command_list):
         """
         Receives a command list and, for each command, stores it until
@@ -14,13 +14,17 @@
 
 """Tests for projectq.cengines._linearmapper.py."""
 from copy import deepcopy
+import random
 
 import pytest
 
+from projectq import MainEngine
+from projectq.backends import Simulator
 from projectq.cengines import DummyEngine
 from projectq.meta import LogicalQubitIDTag
-from projectq.ops import (Allocate, BasicGate, CNOT, Command, Deallocate,
-                          FlushGate, Measure, QFT, X)
+from projectq.ops import (All, Allocate, AllocateQubitGate, BasicGate, CNOT,
+                          Command, Deallocate, DeallocateQubitGate, FlushGate,
+                          Measure, QFT, Rx, Swap, X)
 from projectq.types import WeakQubitRef
 
 from projectq.cengines import _linearmapper as lm
@@ -619,6 +623,31 @@ def test_run_and_receive():
     assert mapper.num_mappings == 1
 
 
+def test_synchronize_qubits():
+    mapper = lm.LinearMapper(num_qubits=4, cyclic=False)
+    backend = DummyEngine(save_commands=True)
+    synchronized = []
+    backend.is_last_engine = True
+    backend.synchronize_qubits = synchronized.append
+    mapper.next_engine = backend
+    qb0 = WeakQubitRef(engine=None, idx=0)
+    qb1 = WeakQubitRef(engine=None, idx=1)
+    qb2 = WeakQubitRef(engine=None, idx=2)
+    cmd0 = Command(engine=None, gate=Allocate, qubits=([qb0],))
+    cmd1 = Command(engine=None, gate=Allocate, qubits=([qb1],))
+    cmd2 = Command(engine=None, gate=Allocate, qubits=([qb2],))
+    cmd3 = Command(None, X, qubits=([qb0],), controls=[qb1])
+    cmd4 = Command(None, X, qubits=([qb2],), controls=[qb0])
+    cmd5 = Command(None, X, qubits=([qb2],), controls=[qb1])
+    mapper.receive([cmd0, cmd1, cmd2, cmd3, cmd4])
+    mapper.synchronize_qubits([2])
+    assert mapper._stored_commands == []
+    mapper.receive([cmd5])
+    mapper.synchronize_qubits([3])
+    assert mapper._stored_commands == [cmd5]
+    assert synchronized == [[mapper.current_mapping[2]], []]
+
+
 def test_run_infinite_loop_detection():
     mapper = lm.LinearMapper(num_qubits=1, cyclic=False)
     backend = DummyEngine(save_commands=True)
@@ -713,3 +742,108 @@ def test_correct_stats():
     mapper.receive([cmd0, cmd1, cmd2, cmd3, cmd4, cmd5, cmd6, cmd7, cmd8,
                     cmd_flush])
     assert mapper.num_mappings == 2
+
+
+def _random_circuit(eng, num_qubits, num_gates, seed):
+    rng = random.Random(seed)
+    qureg = eng.allocate_qureg(num_qubits)
+    for _ in range(num_gates):
+        qb0, qb1 = rng.sample(range(num_qubits), 2)
+        Rx(rng.random()) | qureg[qb0]
+        CNOT | (qureg[qb0], qureg[qb1])
+    return qureg
+
+
+@pytest.mark.parametrize("cyclic", [False, True])
+def test_incremental_mapping_is_correct(cyclic):
+    backend = DummyEngine(save_commands=True)
+    simulator = Simulator()
+    mapper = lm.LinearMapper(num_qubits=6, cyclic=cyclic, storage=20,
+                             incremental=True)
+    eng = MainEngine(simulator, [mapper, backend])
+    qureg = _random_circuit(eng, 5, 60, 0)
+    eng.flush()
+    reference_simulator = Simulator()
+    reference_eng = MainEngine(reference_simulator, [])
+    reference_qureg = _random_circuit(reference_eng, 5, 60, 0)
+    reference_eng.flush()
+    for i in range(1 << 5):
+        bits = [(i >> k) & 1 for k in range(5)]
+        assert (simulator.get_amplitude(bits, qureg) ==
+                pytest.approx(reference_simulator.get_amplitude(
+                    bits, reference_qureg)))
+    allocated = set()
+    for cmd in backend.received_commands:
+        ids = [qb.id for qureg in cmd.all_qubits for qb in qureg]
+        if isinstance(cmd.gate, AllocateQubitGate):
+            assert ids[0] not in allocated
+            allocated.add(ids[0])
+        elif isinstance(cmd.gate, DeallocateQubitGate):
+            allocated.remove(ids[0])
+        elif not isinstance(cmd.gate, FlushGate):
+            assert set(ids) <= allocated
+            if len(ids) == 2:
+                distance = abs(ids[0] - ids[1])
+                assert distance == 1 or (cyclic and distance == 5)
+    num_swaps = len([cmd for cmd in backend.received_commands
+                     if cmd.gate == Swap])
+    assert num_swaps > 0
+    assert (sum(num * count for num, count
+                in mapper.num_of_swaps_per_mapping.items()) == num_swaps)
+    assert sum(mapper.depth_of_swaps.values()) == mapper.num_mappings
+    All(Measure) | qureg
+    All(Measure) | reference_qureg
+
+
+@pytest.mark.parametrize("cyclic, swaps", [(False, [(0, 1), (1, 2)]),
+                                           (True, [(0, 5)])])
+def test_incremental_mapping_step_towards(cyclic, swaps):
+    mapper = lm.LinearMapper(num_qubits=6, cyclic=cyclic, incremental=True)
+    backend = DummyEngine(save_commands=True)
+    backend.is_last_engine = True
+    mapper.next_engine = backend
+    mapper.current_mapping = {0: 0, 1: 1, 2: 2, 3: 3, 4: 4}
+    qb0 = WeakQubitRef(engine=None, idx=0)
+    qb3 = WeakQubitRef(engine=None, idx=3)
+    qb4 = WeakQubitRef(engine=None, idx=4)
+    partner = qb4 if cyclic else qb3
+    mapper.receive([Command(None, X, qubits=([partner],), controls=[qb0])])
+    mapper._run()
+    # qubit 0 is swapped one position at a time towards its partner
+    assert [tuple(qb.id for qureg in cmd.qubits for qb in qureg)
+            for cmd in backend.received_commands
+            if cmd.gate == Swap] == swaps
+    assert mapper.num_of_swaps_per_mapping == {len(swaps): 1}
+
+
+def test_incremental_mapping_reuses_deallocated_qubits():
+    mapper = lm.LinearMapper(num_qubits=2, cyclic=False, incremental=True)
+    backend = DummyEngine(save_commands=True)
+    backend.is_last_engine = True
+    mapper.next_engine = backend
+    qb0 = WeakQubitRef(engine=None, idx=0)
+    qb1 = WeakQubitRef(engine=None, idx=1)
+    qb2 = WeakQubitRef(engine=None, idx=2)
+    cmds = [Command(None, Allocate, qubits=([qb0],)),
+            Command(None, Allocate, qubits=([qb1],)),
+            Command(None, Allocate, qubits=([qb2],)),
+            Command(None, X, qubits=([qb2],), controls=[qb1]),
+            Command(None, Deallocate, qubits=([qb0],))]
+    mapper.receive(cmds)
+    mapper._run()
+    assert mapper._stored_commands == []
+    assert mapper.current_mapping == {1: 1, 2: 0}
+    assert mapper._currently_allocated_ids == set([1, 2])
+    tags = [cmd.tags for cmd in backend.received_commands
+            if isinstance(cmd.gate, AllocateQubitGate)]
+    assert [tag[0].logical_qubit_id for tag in tags] == [0, 1, 2]
+    qb_flush = WeakQubitRef(engine=None, idx=-1)
+    cmd_flush = Command(None, FlushGate(), qubits=([qb_flush],))
+    cmd_alloc = Command(None, Allocate,
+                        qubits=([WeakQubitRef(engine=None, idx=3)],))
+    with pytest.raises(RuntimeError):
+        mapper.receive([cmd_alloc, cmd_flush])
+    mapper._stored_commands = [Command(None, QFT,
+                                       qubits=([qb0, qb1, qb2],))]
+    with pytest.raises(Exception):
+        mapper._run()
@@ -23,9 +23,10 @@ import weakref
 
 import projectq
 from projectq.cengines import BasicEngine, BasicMapperEngine
-from projectq.ops import Command, FlushGate
+from ._profiler import CompilerProfiler
+from projectq.ops import Command, FastForwardingGate, FlushGate
 from projectq.types import WeakQubitRef
-from projectq.backends import Simulator
+from projectq.backends import AsyncBackend, Simulator
 
 
 class NotYetMeasuredError(Exception):
@@ -52,9 +53,12 @@ class MainEngine(BasicEngine):
         dirty_qubits (Set): Containing all dirty qubit ids
         backend (BasicEngine): Access the back-end.
         mapper (BasicMapperEngine): Access to the mapper if there is one.
+        profiler (CompilerProfiler): Statistics of the compiler engines if
+            the MainEngine was created with profile=True (None otherwise).
 
     """
-    def __init__(self, backend=None, engine_list=None, verbose=False):
+    def __init__(self, backend=None, engine_list=None, verbose=False,
+                 batch_size=1, profile=False):
         """
         Initialize the main compiler engine and all compiler engines.
 
@@ -69,6 +73,20 @@ class MainEngine(BasicEngine):
                 Default: projectq.setups.default.get_engine_list()
             verbose (bool): Either print full or compact error messages.
                             Default: False (i.e. compact error messages).
+            batch_size (int): Maximal number of commands which are collected
+                before they are sent down the pipeline as one list. Commands
+                are always sent on immediately once a FastForwardingGate
+                (e.g., a measurement, a deallocation, or a flush) arrives.
+                Default: 1 (i.e., each command is sent on immediately).
+            profile (bool): If True, all compiler engines and the back-end
+                are instrumented using a CompilerProfiler (see
+                MainEngine.profiler). Default: False.
+
+        Note:
+            With batch_size > 1, the back-end only sees the commands once a
+            batch is complete. As with compiler engines which cache commands
+            (e.g., LocalOptimizer), call eng.flush() before accessing the
+            state of the back-end directly (e.g., using Simulator.cheat()).
 
         Example:
             .. code-block:: python
@@ -103,6 +121,10 @@ class MainEngine(BasicEngine):
                            LocalOptimizer(3)]
                 eng = MainEngine(Simulator(), engines)
         """
+        if batch_size < 1:
+            raise ValueError("The batch size has to be at least 1.")
+        self._batch_size = batch_size
+        self._batch = []
         BasicEngine.__init__(self)
 
         if backend is None:
@@ -152,6 +174,14 @@ class MainEngine(BasicEngine):
                 " separate instances of a compiler engine if it is needed\n"
                 " twice.\n")
 
+        self.profiler = None
+        if profile:
+            self.profiler = CompilerProfiler()
+            for i, current_eng in enumerate(engine_list):
+                self.profiler.instrument(
+                    current_eng,
+                    "{}: {}".format(i, current_eng.__class__.__name__))
+
         self._qubit_idx = int(0)
         for i in range(len(engine_list) - 1):
             engine_list[i].next_engine = engine_list[i + 1]
@@ -159,6 +189,7 @@ class MainEngine(BasicEngine):
         engine_list[-1].main_engine = self
         engine_list[-1].is_last_engine = True
         self.next_engine = engine_list[0]
+        self._first_engine = engine_list[0]
         self.main_engine = self
         self.active_qubits = weakref.WeakSet()
         self._measurements = dict()
@@ -218,6 +249,11 @@ class MainEngine(BasicEngine):
         Return the classical value of a measured qubit, given that an engine
         registered this result previously (see setMeasurementResult).
 
+        If the result is not available yet, the commands in the causal cone
+        of the qubit are sent through the pipeline first (see
+        synchronize_qubits), i.e., there is no need to call flush() before
+        reading a measurement result.
+
         Args:
             qubit (BasicQubit): Qubit of which to get the measurement result.
 
@@ -232,6 +268,13 @@ class MainEngine(BasicEngine):
                 Measure | qubit
                 eng.get_measurement_result(qubit[0]) == int(qubit)
         """
+        if isinstance(self.backend, AsyncBackend):
+            # wait for the back-end to execute the measurement
+            self.backend.synchronize()
+        if qubit.id not in self._measurements:
+            # only force the commands which the measurement depends on through
+            # the pipeline, the buffers of all other qubits are kept
+            self.synchronize_qubits([qubit.id])
         if qubit.id in self._measurements:
             return self._measurements[qubit.id]
         else:
@@ -255,6 +298,41 @@ class MainEngine(BasicEngine):
         self._qubit_idx += 1
         return (self._qubit_idx - 1)
 
+    @property
+    def next_engine(self):
+        return self._next_engine
+
+    @next_engine.setter
+    def next_engine(self, engine):
+        """
+        Set the next engine, e.g., when meta functions (Control, Dagger, ...)
+        insert an engine after the MainEngine.
+
+        The commands collected so far are sent to the current next engine
+        first.
+        """
+        self._send_batch()
+        self._next_engine = engine
+
+    def _send_batch(self):
+        """
+        Send the commands collected so far to the next engine.
+        """
+        if len(self._batch) > 0:
+            command_list, self._batch = self._batch, []
+            self._next_engine.receive(command_list)
+
+    def synchronize_qubits(self, qubit_ids):
+        """
+        Send the causal cone of the given qubits through the pipeline (see
+        BasicEngine.synchronize_qubits), starting with the collected batch.
+
+        Args:
+            qubit_ids (list<int>): IDs of the qubits to synchronize.
+        """
+        self._send_batch()
+        self.next_engine.synchronize_qubits(qubit_ids)
+
     def receive(self, command_list):
         """
         Forward the list of commands to the first engine.
@@ -269,8 +347,23 @@ class MainEngine(BasicEngine):
         """
         Forward the list of commands to the next engine in the pipeline.
 
+        If batch_size > 1, the commands are collected and sent on once the
+        batch is full or a FastForwardingGate arrives. Commands are never
+        collected while an engine is inserted after the MainEngine (e.g.,
+        inside a with Control(...) block), as meta functions expect the
+        inserted engine to receive all commands immediately.
         It also shortens exception stack traces if self.verbose is False.
         """
+        if (self._batch_size > 1
+                and self._next_engine is self._first_engine):
+            self._batch.extend(command_list)
+            if (len(self._batch) < self._batch_size
+                    and not any(isinstance(cmd.gate, FastForwardingGate)
+                                for cmd in command_list)):
+                return
+            # swap the batch first, as qubits may be deallocated (and, thus,
+            # more commands sent) while the batch is being processed
+            command_list, self._batch = self._batch, []
         try:
             self.next_engine.receive(command_list)
         except:
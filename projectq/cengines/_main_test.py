@@ -19,10 +19,12 @@ import weakref
 import pytest
 
 import projectq.setups.default
-from projectq.cengines import DummyEngine, BasicMapperEngine, LocalOptimizer
+from projectq.cengines import (DummyEngine, BasicMapperEngine, LinearMapper,
+                               LocalOptimizer)
 from projectq.backends import Simulator
+from projectq.meta import Control
 from projectq.ops import (AllocateQubitGate, DeallocateQubitGate, FlushGate,
-                          H, X)
+                          H, X, Measure)
 
 from projectq.cengines import _main
 
@@ -146,6 +148,49 @@ def test_main_engine_flush():
     assert len(str(qubit)) != 0
 
 
+def test_main_engine_batch_size():
+    with pytest.raises(ValueError):
+        _main.MainEngine(backend=DummyEngine(), engine_list=[], batch_size=0)
+    backend = DummyEngine(save_commands=True)
+    eng = _main.MainEngine(backend=backend, engine_list=[DummyEngine()],
+                           batch_size=4)
+    qureg = eng.allocate_qureg(2)
+    H | qureg[0]
+    assert len(backend.received_commands) == 0
+    H | qureg[1]  # batch is full
+    assert len(backend.received_commands) == 4
+    H | qureg[0]
+    # commands are sent on before an engine is inserted and are not
+    # collected while it is inserted
+    with Control(eng, qureg[0]):
+        assert len(backend.received_commands) == 5
+        X | qureg[1]
+        assert len(backend.received_commands) == 6
+    assert backend.received_commands[5].control_qubits[0].id == qureg[0].id
+    H | qureg[1]
+    assert len(backend.received_commands) == 6
+    # fast-forwarding gates are sent on immediately
+    Measure | qureg[1]
+    assert len(backend.received_commands) == 8
+    eng.flush()
+    assert backend.received_commands[-1].gate == FlushGate()
+
+
+def test_main_engine_measurement_without_flush():
+    mapper = LinearMapper(num_qubits=3, cyclic=False)
+    eng = _main.MainEngine(backend=Simulator(), engine_list=[mapper],
+                           batch_size=100)
+    qureg = eng.allocate_qureg(3)
+    X | qureg[0]
+    with Control(eng, qureg[0]):
+        X | qureg[1]
+    H | qureg[2]
+    Measure | qureg[1]
+    assert len(mapper._stored_commands) > 0
+    assert int(qureg[1]) == 1
+    eng.flush()
+
+
 def test_main_engine_atexit_no_error():
     # Clear previous exceptions of other tests
     sys.last_type = None
@@ -16,9 +16,101 @@
 Contains a local optimizer engine.
 """
 
-from copy import deepcopy as _deepcopy
+import numpy as _np
+
 from projectq.cengines import LastEngineException, BasicEngine
-from projectq.ops import FlushGate, FastForwardingGate, NotMergeable
+from projectq.ops import (FlushGate, FastForwardingGate,
+                          ClassicalInstructionGate, NotMergeable)
+
+
+def _get_commutation_axes(cmd):
+    """
+    Return the commutation axis of a command for each of its qubits.
+
+    The command is diagonal in a product basis, where the basis of each qubit
+    is the eigenbasis of the Pauli operator given by its axis ('X', 'Y', or
+    'Z'). Two commands commute if they have the same axis on each of their
+    shared qubits. The table is:
+
+    * control qubits: 'Z'
+    * target qubits of a diagonal gate (e.g., Rz, Ph, S, T, Z): 'Z'
+    * target qubit of a 1-qubit gate a*I + b*X (e.g., X, Rx): 'X'
+    * target qubit of a 1-qubit gate a*I + b*Y (e.g., Y, Ry): 'Y'
+    * all other qubits (and classical instructions): None, i.e., the command
+      does not commute with any other command acting on this qubit.
+
+    Args:
+        cmd (Command): Command to classify.
+
+    Returns:
+        Dict mapping each qubit ID to its axis (or None).
+    """
+    target_ids = [qb.id for qureg in cmd.qubits for qb in qureg]
+    axes = {idx: None for idx in target_ids}
+    axes.update((qb.id, 'Z') for qb in cmd.control_qubits)
+    if isinstance(cmd.gate, ClassicalInstructionGate):
+        return {idx: None for idx in axes}
+    try:
+        matrix = _np.asarray(cmd.gate.matrix)
+    except AttributeError:
+        return axes
+    if matrix.shape != (1 << len(target_ids),) * 2:
+        return axes
+    axis = None
+    if _np.allclose(matrix, _np.diag(_np.diag(matrix))):
+        axis = 'Z'
+    elif len(target_ids) == 1 and _np.isclose(matrix[0, 0], matrix[1, 1]):
+        if _np.isclose(matrix[0, 1], matrix[1, 0]):
+            axis = 'X'
+        elif _np.isclose(matrix[0, 1], -matrix[1, 0]):
+            axis = 'Y'
+    for idx in target_ids:
+        axes[idx] = axis
+    return axes
+
+
+class _Node(object):
+    """
+    Node of the command DAG of the LocalOptimizer.
+
+    Attributes:
+        cmd (Command): Command of this node.
+        ids (list<int>): IDs of all qubits the command acts on.
+        prev (dict): Maps each qubit ID to the preceding node on that qubit
+            (or None).
+        next (dict): Maps each qubit ID to the succeeding node on that qubit
+            (or None).
+        removed (bool): True once the node has been sent on or optimized
+            away.
+    """
+    def __init__(self, cmd):
+        self.cmd = cmd
+        self.ids = [qb.id for qureg in cmd.all_qubits for qb in qureg]
+        self.prev = dict()
+        self.next = dict()
+        self.removed = False
+        self._axes = None
+
+    @property
+    def axes(self):
+        """
+        Commutation axes of the command (see _get_commutation_axes).
+        """
+        if self._axes is None:
+            self._axes = _get_commutation_axes(self.cmd)
+        return self._axes
+
+    def commutes_with(self, other):
+        """
+        Return True if the commands of both nodes commute (according to their
+        commutation axes).
+        """
+        for idx in other.ids:
+            if idx in self.axes:
+                axis = self.axes[idx]
+                if axis is None or axis != other.axes[idx]:
+                    return False
+        return True
 
 
 class LocalOptimizer(BasicEngine):
@@ -27,215 +119,233 @@ class LocalOptimizer(BasicEngine):
     rotations, cancelling gates with their inverse) in a local window of user-
     defined size.
 
-    It stores all commands in a dict of lists, where each qubit has its own
-    gate pipeline. After adding a gate, it tries to merge / cancel successive
-    gates using the get_merged and get_inverse functions of the gate (if
-    available). For examples, see BasicRotationGate. Once a list corresponding
-    to a qubit contains >=m gates, the pipeline is sent on to the next engine.
+    It stores all commands in a directed acyclic graph, where each command
+    knows its predecessor and successor on each of its qubits, i.e., each
+    qubit has its own doubly-linked gate pipeline. After adding a gate, it
+    tries to merge / cancel the gate with its predecessor using the
+    get_merged and get_inverse functions of the gate (if available). For
+    examples, see BasicRotationGate. Cancellations and merges only modify the
+    neighbors of the gates involved, which are then checked again. Once the
+    pipeline of a qubit contains >=m gates, the pipeline is sent on to the
+    next engine.
+
+    If commutation is enabled, a gate is also merged / cancelled with an
+    earlier gate if it commutes with all gates in between (e.g., an Rz gate on
+    the control qubit of a CNOT, or a CNOT with the same target), see
+    _get_commutation_axes.
+
+    Attributes:
+        statistics (list<dict>): Number of removed gates for each flush, as a
+            dict with the keys 'identities' (dropped identity gates),
+            'cancelled' (gates cancelled with their inverse), 'merged' (gates
+            merged into another gate), and 'commuted' (number of
+            cancellations / merges which required moving a gate past other
+            gates).
     """
-    def __init__(self, m=5):
+    def __init__(self, m=5, commutation=False):
         """
         Initialize a LocalOptimizer object.
 
         Args:
             m (int): Number of gates to cache per qubit, before sending on the
                 first gate.
+            commutation (bool): If True, gates are moved past commuting gates
+                in order to cancel / merge them.
         """
         BasicEngine.__init__(self)
-        self._l = dict()  # dict of lists containing operations for each qubit
+        self._heads = dict()  # first node of the pipeline of each qubit
+        self._tails = dict()  # last node of the pipeline of each qubit
+        self._sizes = dict()  # number of nodes in the pipeline of each qubit
         self._m = m  # wait for m gates before sending on
+        self._commutation = commutation
+        self._output = []  # commands to send on at the end of receive
+        self._stats = self._new_statistics()
+        self.statistics = []
 
-    # sends n gate operations of the qubit with index idx
-    def _send_qubit_pipeline(self, idx, n):
+    @staticmethod
+    def _new_statistics():
+        return {'identities': 0, 'cancelled': 0, 'merged': 0, 'commuted': 0}
+
+    def _append(self, node):
         """
-        Send n gate operations of the qubit with index idx to the next engine.
+        Append a node to the pipelines of all its qubits.
         """
-        il = self._l[idx]  # temporary label for readability
-        for i in range(min(n, len(il))):  # loop over first n operations
-            # send all gates before n-qubit gate for other qubits involved
-            # --> recursively call send_helper
-            other_involved_qubits = [qb
-                                     for qreg in il[i].all_qubits
-                                     for qb in qreg
-                                     if qb.id != idx]
-            for qb in other_involved_qubits:
-                Id = qb.id
-                try:
-                    gateloc = 0
-                    # find location of this gate within its list
-                    while self._l[Id][gateloc] != il[i]:
-                        gateloc += 1
-
-                    gateloc = self._optimize(Id, gateloc)
-
-                    # flush the gates before the n-qubit gate
-                    self._send_qubit_pipeline(Id, gateloc)
-                    # delete the n-qubit gate, we're taking care of it
-                    # and don't want the other qubit to do so
-                    self._l[Id] = self._l[Id][1:]
-                except IndexError:
-                    print("Invalid qubit pipeline encountered (in the"
-                          " process of shutting down?).")
-
-            # all qubits that need to be flushed have been flushed
-            # --> send on the n-qubit gate
-            self.send([il[i]])
-        # n operations have been sent on --> resize our gate list
-        self._l[idx] = self._l[idx][n:]
-
-    def _get_gate_indices(self, idx, i, IDs):
+        for idx in node.ids:
+            tail = self._tails.get(idx)
+            node.prev[idx] = tail
+            node.next[idx] = None
+            if tail is None:
+                self._heads[idx] = node
+                self._sizes[idx] = 1
+            else:
+                tail.next[idx] = node
+                self._sizes[idx] += 1
+            self._tails[idx] = node
+
+    def _remove(self, node):
         """
-        Return all indices of a command, each index corresponding to the
-        command's index in one of the qubits' command lists.
+        Remove a node from the pipelines of all its qubits.
 
-        Args:
-            idx (int): qubit index
-            i (int): command position in qubit idx's command list
-            IDs (list<int>): IDs of all qubits involved in the command
+        Returns:
+            List of the nodes which succeeded the removed node (and therefore
+            got a new predecessor).
+        """
+        successors = []
+        for idx in node.ids:
+            prev = node.prev[idx]
+            succ = node.next[idx]
+            if prev is None:
+                self._heads[idx] = succ
+            else:
+                prev.next[idx] = succ
+            if succ is None:
+                self._tails[idx] = prev
+            else:
+                succ.prev[idx] = prev
+                successors.append(succ)
+            self._sizes[idx] -= 1
+            if self._sizes[idx] == 0:
+                del self._heads[idx]
+                del self._tails[idx]
+                del self._sizes[idx]
+        node.removed = True
+        return successors
+
+    def _is_movable(self, prev, node):
+        """
+        Return True if node can be moved directly after prev, i.e., if all
+        nodes between prev and node on any of the qubits of node commute with
+        node.
         """
-        N = len(IDs)
-        # 1-qubit gate: only gate at index i in list #idx is involved
-        if N == 1:
-            return [i]
-
-        # When the same gate appears multiple time, we need to make sure not to
-        # match earlier instances of the gate applied to the same qubits. So we
-        # count how many there are, and skip over them when looking in the
-        # other lists.
-        cmd = self._l[idx][i]
-        num_identical_to_skip = sum(1
-                                    for prev_cmd in self._l[idx][:i]
-                                    if prev_cmd == cmd)
-        indices = []
-        for Id in IDs:
-            identical_indices = [i
-                                 for i, c in enumerate(self._l[Id])
-                                 if c == cmd]
-            indices.append(identical_indices[num_identical_to_skip])
-        return indices
-
-    def _optimize(self, idx, lim=None):
+        for idx in node.ids:
+            current = node.prev[idx]
+            while current is not prev:
+                if (current is None or not self._commutation or
+                        not current.commutes_with(node)):
+                    return False
+                current = current.prev[idx]
+        return True
+
+    def _get_candidates(self, node):
+        """
+        Yield the earlier nodes (from late to early) which act on the same
+        qubits as the given node and which node can be moved next to.
+        """
+        idx = node.ids[0]
+        ids = set(node.ids)
+        prev = node.prev[idx]
+        while prev is not None:
+            if (len(prev.ids) == len(node.ids) and set(prev.ids) == ids and
+                    self._is_movable(prev, node)):
+                yield prev
+            if not self._commutation or not prev.commutes_with(node):
+                return
+            prev = prev.prev[idx]
+
+    def _optimize(self, node):
         """
-        Try to remove identity gates using the is_identity function, then merge or even cancel successive gates using the get_merged and
+        Try to remove identity gates using the is_identity function, then
+        merge or even cancel successive gates using the get_merged and
         get_inverse functions of the gate (see, e.g., BasicRotationGate).
 
-        It does so for all qubit command lists.
+        Starts at the given node and continues with all nodes which got new
+        neighbors.
         """
-        # loop over all qubit indices
-        i = 0
-        new_gateloc = 0
-        limit = len(self._l[idx])
-        if lim is not None:
-            limit = lim
-            new_gateloc = limit
-
-        while i < limit - 1:
+        candidates = [node]
+        while candidates:
+            node = candidates.pop()
+            if node.removed:
+                continue
             # can be dropped if the gate is equivalent to an identity gate
-            if self._l[idx][i].is_identity():
-                # determine index of this gate on all qubits
-                qubitids = [qb.id for sublist in self._l[idx][i].all_qubits
-                            for qb in sublist]
-                gid = self._get_gate_indices(idx, i, qubitids)
-                for j in range(len(qubitids)):
-                    new_list = (self._l[qubitids[j]][0:gid[j]] +
-                                self._l[qubitids[j]][gid[j] +1:])
-                self._l[qubitids[j]] = new_list
-                i = 0
-                limit -= 1
+            if node.cmd.is_identity():
+                candidates += self._remove(node)
+                self._stats['identities'] += 1
+                continue
+
+            for prev in self._get_candidates(node):
+                adjacent = all(node.prev[idx] is prev for idx in node.ids)
+                # can be dropped if two in a row are self-inverses
+                if prev.cmd.get_inverse() == node.cmd:
+                    candidates += self._remove(node)
+                    candidates += self._remove(prev)
+                    self._stats['cancelled'] += 2
+                    self._stats['commuted'] += not adjacent
+                    break
+
+                # gates are not each other's inverses --> check if they're
+                # mergeable
+                try:
+                    prev.cmd = prev.cmd.get_merged(node.cmd)
+                    prev._axes = None
+                    candidates += self._remove(node)
+                    candidates.append(prev)
+                    self._stats['merged'] += 1
+                    self._stats['commuted'] += not adjacent
+                    break
+                except NotMergeable:
+                    pass  # can't merge these two commands.
+
+    def _send_node(self, node):
+        """
+        Send a node on to the next engine (at the end of receive), after
+        sending all nodes which precede it on any of its qubits.
+        """
+        stack = [node]
+        while stack:
+            node = stack[-1]
+            if node.removed:
+                stack.pop()
                 continue
+            # send the gates before this gate on the other qubits first
+            blocked = False
+            for idx in node.ids:
+                if node.prev[idx] is not None:
+                    stack.append(self._heads[idx])
+                    blocked = True
+                    break
+            if not blocked:
+                stack.pop()
+                self._remove(node)
+                self._output.append(node.cmd)
+
+    def _send_qubit_pipeline(self, idx, n):
+        """
+        Send n gate operations of the qubit with index idx to the next engine.
+        """
+        for _ in range(n):
+            self._send_node(self._heads[idx])
 
-            # can be dropped if two in a row are self-inverses
-            inv = self._l[idx][i].get_inverse()
-
-            if inv == self._l[idx][i + 1]:
-                # determine index of this gate on all qubits
-                qubitids = [qb.id for sublist in self._l[idx][i].all_qubits
-                            for qb in sublist]
-                gid = self._get_gate_indices(idx, i, qubitids)
-                # check that there are no other gates between this and its
-                # inverse on any of the other qubits involved
-                erase = True
-                for j in range(len(qubitids)):
-                    erase *= (inv == self._l[qubitids[j]][gid[j] + 1])
-
-                # drop these two gates if possible and goto next iteration
-                if erase:
-                    for j in range(len(qubitids)):
-                        new_list = (self._l[qubitids[j]][0:gid[j]] +
-                                    self._l[qubitids[j]][gid[j] + 2:])
-                        self._l[qubitids[j]] = new_list
-                    i = 0
-                    limit -= 2
-                    continue
-
-            # gates are not each other's inverses --> check if they're
-            # mergeable
-            try:
-                merged_command = self._l[idx][i].get_merged(
-                    self._l[idx][i + 1])
-                # determine index of this gate on all qubits
-                qubitids = [qb.id for sublist in self._l[idx][i].all_qubits
-                            for qb in sublist]
-                gid = self._get_gate_indices(idx, i, qubitids)
-
-                merge = True
-                for j in range(len(qubitids)):
-                    m = self._l[qubitids[j]][gid[j]].get_merged(
-                        self._l[qubitids[j]][gid[j] + 1])
-                    merge *= (m == merged_command)
-
-                if merge:
-                    for j in range(len(qubitids)):
-                        self._l[qubitids[j]][gid[j]] = merged_command
-                        new_list = (self._l[qubitids[j]][0:gid[j] + 1] +
-                                    self._l[qubitids[j]][gid[j] + 2:])
-                        self._l[qubitids[j]] = new_list
-                    i = 0
-                    limit -= 1
-                    continue
-            except NotMergeable:
-                pass  # can't merge these two commands.
-
-            i += 1  # next iteration: look at next gate
-        return limit
-
-    def _check_and_send(self):
+    def _check_and_send(self, ids):
         """
-        Check whether a qubit pipeline must be sent on and, if so,
-        optimize the pipeline and then send it on.
+        Check whether the pipelines of the given qubits must be sent on and,
+        if so, send them on.
         """
-        for i in self._l:
-            if (len(self._l[i]) >= self._m or len(self._l[i]) > 0 and
-                    isinstance(self._l[i][-1].gate, FastForwardingGate)):
-                self._optimize(i)
-                if (len(self._l[i]) >= self._m and not
-                        isinstance(self._l[i][-1].gate,
-                                   FastForwardingGate)):
-                    self._send_qubit_pipeline(i, len(self._l[i]) - self._m + 1)
-                elif (len(self._l[i]) > 0 and
-                      isinstance(self._l[i][-1].gate, FastForwardingGate)):
-                    self._send_qubit_pipeline(i, len(self._l[i]))
-        new_dict = dict()
-        for idx in self._l:
-            if len(self._l[idx]) > 0:
-                new_dict[idx] = self._l[idx]
-        self._l = new_dict
+        for idx in ids:
+            if idx not in self._sizes:
+                continue
+            size = self._sizes[idx]
+            if isinstance(self._tails[idx].cmd.gate, FastForwardingGate):
+                self._send_qubit_pipeline(idx, size)
+            elif size >= self._m:
+                self._send_qubit_pipeline(idx, size - self._m + 1)
 
     def _cache_cmd(self, cmd):
         """
-        Cache a command, i.e., inserts it into the command lists of all qubits
+        Cache a command, i.e., inserts it into the pipelines of all qubits
         involved.
         """
-        # are there qubit ids that haven't been added to the list?
-        idlist = [qubit.id for sublist in cmd.all_qubits for qubit in sublist]
-
-        # add gate command to each of the qubits involved
-        for ID in idlist:
-            if ID not in self._l:
-                self._l[ID] = []
-            self._l[ID] += [cmd]
+        node = _Node(cmd)
+        self._append(node)
+        self._optimize(node)
+        self._check_and_send(node.ids)
 
-        self._check_and_send()
+    def _send_output(self):
+        """
+        Send everything which left the pipelines on as one list.
+        """
+        if len(self._output) > 0:
+            command_list, self._output = self._output, []
+            self.send(command_list)
 
     def receive(self, command_list):
         """
@@ -243,16 +353,30 @@ class LocalOptimizer(BasicEngine):
         If a flush gate arrives, the entire buffer is sent on.
         """
         for cmd in command_list:
-            if cmd.gate == FlushGate():  # flush gate --> optimize and flush
-                for idx in self._l:
-                    self._optimize(idx)
-                    self._send_qubit_pipeline(idx, len(self._l[idx]))
-                new_dict = dict()
-                for idx in self._l:
-                    if len(self._l[idx]) > 0:
-                        new_dict[idx] = self._l[idx]
-                self._l = new_dict
-                assert self._l == dict()
-                self.send([cmd])
+            if cmd.gate == FlushGate():  # flush gate --> flush all pipelines
+                for idx in list(self._heads):
+                    if idx in self._sizes:
+                        self._send_qubit_pipeline(idx, self._sizes[idx])
+                assert len(self._heads) == 0
+                self.statistics.append(self._stats)
+                self._stats = self._new_statistics()
+                self._output.append(cmd)
             else:
                 self._cache_cmd(cmd)
+        self._send_output()
+
+    def synchronize_qubits(self, qubit_ids):
+        """
+        Send on the pipelines of the given qubits, including all gates which
+        precede them on other qubits (i.e., their causal cone), and forward
+        the request to the next engine. All other gates stay in the pipelines
+        and can still be optimized.
+
+        Args:
+            qubit_ids (list<int>): IDs of the qubits to synchronize.
+        """
+        for idx in qubit_ids:
+            if idx in self._sizes:
+                self._send_qubit_pipeline(idx, self._sizes[idx])
+        self._send_output()
+        BasicEngine.synchronize_qubits(self, qubit_ids)
@@ -19,7 +19,8 @@ import pytest
 import math
 from projectq import MainEngine
 from projectq.cengines import DummyEngine
-from projectq.ops import (CNOT, H, Rx, Ry, AllocateQubitGate, X,
+from projectq.ops import (CNOT, H, Rx, Ry, Rz, AllocateQubitGate, X, Y,
+                          Measure,
                           FastForwardingGate, ClassicalInstructionGate)
 
 from projectq.cengines import _optimize
@@ -56,6 +57,35 @@ def test_local_optimizer_caching():
     assert backend.received_commands[4].qubits[0][0].id == qb1[0].id
 
 
+def test_local_optimizer_synchronize_qubits():
+    local_optimizer = _optimize.LocalOptimizer(m=5)
+    backend = DummyEngine(save_commands=True)
+    eng = MainEngine(backend=backend, engine_list=[local_optimizer])
+    qb0 = eng.allocate_qubit()
+    qb1 = eng.allocate_qubit()
+    qb2 = eng.allocate_qubit()
+    H | qb0
+    CNOT | (qb0, qb1)
+    H | qb0
+    H | qb2
+    assert len(backend.received_commands) == 0
+    # only the causal cone of qb1 is sent on
+    eng.synchronize_qubits([qb1[0].id])
+    received = backend.received_commands
+    assert len(received) == 4
+    assert received[-1].gate == X
+    assert all(qb.id != qb2[0].id
+               for cmd in received for qureg in cmd.all_qubits
+               for qb in qureg)
+    assert local_optimizer._sizes == {qb0[0].id: 1, qb2[0].id: 2}
+    # the remaining gates can still be optimized
+    H | qb0
+    eng.synchronize_qubits([qb0[0].id])
+    assert len(backend.received_commands) == 4
+    eng.synchronize_qubits([qb1[0].id])
+    assert len(backend.received_commands) == 4
+
+
 def test_local_optimizer_flush_gate():
     local_optimizer = _optimize.LocalOptimizer(m=4)
     backend = DummyEngine(save_commands=True)
@@ -147,3 +177,103 @@ def test_local_optimizer_identity_gates():
     # Expect allocate, one Rx gate, and flush gate
     assert len(backend.received_commands) == 3
     assert backend.received_commands[1].gate == Rx(0.5)
+
+
+def test_local_optimizer_cancel_after_removal():
+    local_optimizer = _optimize.LocalOptimizer(m=10)
+    backend = DummyEngine(save_commands=True)
+    eng = MainEngine(backend=backend, engine_list=[local_optimizer])
+    qb0 = eng.allocate_qubit()
+    qb1 = eng.allocate_qubit()
+    # CNOTs become adjacent once the H gates in between have been cancelled
+    CNOT | (qb0, qb1)
+    H | qb1
+    H | qb1
+    CNOT | (qb0, qb1)
+    # the X gate prevents cancelling these two CNOTs
+    CNOT | (qb0, qb1)
+    X | qb1
+    CNOT | (qb0, qb1)
+    eng.flush()
+    received_gates = [cmd.gate for cmd in backend.received_commands
+                      if not isinstance(cmd.gate, (FastForwardingGate,
+                                                   ClassicalInstructionGate))]
+    assert received_gates == [X, X, X]
+    assert len(backend.received_commands[2].control_qubits) == 1
+
+
+def test_local_optimizer_large_window():
+    local_optimizer = _optimize.LocalOptimizer(m=1000)
+    backend = DummyEngine(save_commands=True)
+    eng = MainEngine(backend=backend, engine_list=[local_optimizer])
+    qureg = eng.allocate_qureg(3)
+    for _ in range(5000):
+        CNOT | (qureg[0], qureg[1])
+        H | qureg[2]
+        Rx(0.1) | qureg[0]
+        Rx(-0.1) | qureg[0]
+    for _ in range(3000):
+        CNOT | (qureg[1], qureg[2])
+    eng.flush()
+    received_gates = [cmd.gate for cmd in backend.received_commands
+                      if not isinstance(cmd.gate, (FastForwardingGate,
+                                                   ClassicalInstructionGate))]
+    assert received_gates == []
+
+
+def test_local_optimizer_commutation_axes():
+    backend = DummyEngine(save_commands=True)
+    eng = MainEngine(backend=backend, engine_list=[])
+    qb0 = eng.allocate_qubit()
+    qb1 = eng.allocate_qubit()
+    id0, id1 = qb0[0].id, qb1[0].id
+    del backend.received_commands[:]
+    for gate in (CNOT, Rz(0.3), Rx(0.3), Y, H, Measure):
+        if gate == CNOT:
+            gate | (qb0, qb1)
+        else:
+            gate | qb1
+    cmds = backend.received_commands
+    axes = [_optimize._get_commutation_axes(cmd) for cmd in cmds]
+    assert axes[0] == {id0: 'Z', id1: 'X'}
+    assert axes[1] == {id1: 'Z'}
+    assert axes[2] == {id1: 'X'}
+    assert axes[3] == {id1: 'Y'}
+    assert axes[4] == {id1: None}
+    assert axes[5] == {id1: None}
+
+
+@pytest.mark.parametrize("commutation", [False, True])
+def test_local_optimizer_commutation(commutation):
+    local_optimizer = _optimize.LocalOptimizer(m=10, commutation=commutation)
+    backend = DummyEngine(save_commands=True)
+    eng = MainEngine(backend=backend, engine_list=[local_optimizer])
+    qb0 = eng.allocate_qubit()
+    qb1 = eng.allocate_qubit()
+    qb2 = eng.allocate_qubit()
+    # Rz on the control and X on the target commute with the CNOT
+    CNOT | (qb0, qb1)
+    Rz(0.2) | qb0
+    X | qb1
+    CNOT | (qb0, qb1)
+    # Rz gates merge across CNOTs which share the control qubit
+    CNOT | (qb0, qb2)
+    Rz(0.3) | qb0
+    # H does not commute with CNOT
+    CNOT | (qb1, qb2)
+    H | qb2
+    CNOT | (qb1, qb2)
+    eng.flush()
+    received_gates = [cmd.gate for cmd in backend.received_commands
+                      if not isinstance(cmd.gate, (FastForwardingGate,
+                                                   ClassicalInstructionGate))]
+    stats = local_optimizer.statistics
+    assert len(stats) == 1
+    if commutation:
+        assert received_gates == [Rz(0.5), X, X, X, H, X]
+        assert stats[0] == {'identities': 0, 'cancelled': 2, 'merged': 1,
+                            'commuted': 2}
+    else:
+        assert len(received_gates) == 9
+        assert stats[0] == {'identities': 0, 'cancelled': 0, 'merged': 0,
+                            'commuted': 0}
@@ -0,0 +1,496 @@
+#   Copyright 2018 ProjectQ-Framework (www.projectq.ch)
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Contains a compiler engine which places the qubits of a circuit on a device
+with an arbitrary (directed) coupling map, such that no Swaps are required.
+"""
+import math
+import random
+from timeit import default_timer as _timer
+
+from projectq.cengines import BasicMapperEngine
+from projectq.ops import Allocate, Deallocate, FlushGate, NOT
+from projectq.meta import get_control_count
+
+#: Maximal number of cached placements (shared by all PlacementMappers)
+PLACEMENT_CACHE_SIZE = 128
+
+# Placements by coupling map and interaction graph (see
+# PlacementMapper._find_placement)
+_placements = dict()
+
+
+class _SearchTimeout(Exception):
+    pass
+
+
+class _PlacementProblem(object):
+    """
+    Placement of logical qubits on the physical qubits of a coupling map.
+
+    Logical qubits are numbered 0,...,num_logical-1 and the interactions are
+    given as a dict mapping (control, target) pairs to the number of 2-qubit
+    gates. A placement is feasible if all interacting qubits are placed on
+    connected physical qubits. Its cost is the number of 2-qubit gates which
+    act against the direction of the coupling map. The positions of the qubits
+    in fixed (dict mapping logical to physical qubits) are given.
+    """
+    def __init__(self, num_logical, weights, connections, deadline,
+                 fixed=None):
+        self.num_logical = num_logical
+        self.fixed = dict(fixed or dict())
+        self.weights = weights
+        self.connections = connections
+        self.deadline = deadline
+        self.physical_ids = sorted(set(p for pair in connections
+                                       for p in pair))
+        self.neighbors = {p: set() for p in self.physical_ids}
+        for p0, p1 in connections:
+            if p0 != p1:
+                self.neighbors[p0].add(p1)
+                self.neighbors[p1].add(p0)
+        self.partners = [set() for _ in range(num_logical)]
+        for idx0, idx1 in weights:
+            if idx0 != idx1:
+                self.partners[idx0].add(idx1)
+                self.partners[idx1].add(idx0)
+        self.total_weight = sum(weights.values())
+
+    def pair_cost(self, idx0, p0, idx1, p1):
+        """
+        Returns the cost of the gates between two logical qubits placed on
+        connected physical qubits.
+        """
+        cost = 0
+        if (p0, p1) not in self.connections:
+            cost += self.weights.get((idx0, idx1), 0)
+        if (p1, p0) not in self.connections:
+            cost += self.weights.get((idx1, idx0), 0)
+        return cost
+
+    def get_order(self):
+        """
+        Returns the order in which the logical qubits are placed: Always the
+        qubit with the most already placed partners (then the one with the
+        most partners).
+        """
+        order = []
+        num_placed_partners = [0] * self.num_logical
+        for idx in self.fixed:
+            for partner in self.partners[idx]:
+                num_placed_partners[partner] += 1
+        remaining = set(range(self.num_logical)) - set(self.fixed)
+        while remaining:
+            idx = max(remaining, key=lambda i: (num_placed_partners[i],
+                                                len(self.partners[i]), -i))
+            remaining.remove(idx)
+            order.append(idx)
+            for partner in self.partners[idx]:
+                num_placed_partners[partner] += 1
+        return order
+
+    def search(self):
+        """
+        Branch-and-bound search for the feasible placement with the lowest
+        cost (i.e., for the best embedding of the interaction graph into the
+        coupling graph).
+
+        The candidates for a qubit are the free common neighbors of the
+        positions of its placed partners, and branches which cannot improve
+        on the best placement found so far are cut.
+
+        Returns:
+            Tuple (placement, complete), where placement is the best placement
+            found (list of physical ids, or None) and complete is False if
+            the search was stopped at the deadline.
+        """
+        self._order = self.get_order()
+        self._positions = [None] * self.num_logical
+        for idx, p in self.fixed.items():
+            self._positions[idx] = p
+        self._used = set(self.fixed.values())
+        self._best = None
+        self._best_cost = None
+        self._num_steps = 0
+        cost = 0
+        for idx0 in self.fixed:
+            for idx1 in self.partners[idx0]:
+                if idx1 in self.fixed and idx0 < idx1:
+                    p0 = self.fixed[idx0]
+                    p1 = self.fixed[idx1]
+                    if p1 not in self.neighbors[p0]:
+                        return None, True
+                    cost += self.pair_cost(idx0, p0, idx1, p1)
+        try:
+            self._assign(0, cost)
+        except _SearchTimeout:
+            return self._best, False
+        return self._best, True
+
+    def _assign(self, k, cost):
+        if self._num_steps % 256 == 0 and _timer() > self.deadline:
+            raise _SearchTimeout()
+        self._num_steps += 1
+        if k == len(self._order):
+            self._best = list(self._positions)
+            self._best_cost = cost
+            return
+        idx = self._order[k]
+        degree = len(self.partners[idx])
+        placed = [partner for partner in self.partners[idx]
+                  if self._positions[partner] is not None]
+        if len(placed) > 0:
+            candidates = set(self.neighbors[self._positions[placed[0]]])
+            for partner in placed[1:]:
+                candidates &= self.neighbors[self._positions[partner]]
+            candidates = sorted(candidates - self._used)
+        else:
+            candidates = [p for p in self.physical_ids if p not in self._used]
+            if degree == 0:
+                # qubits without interactions can be placed anywhere
+                candidates = candidates[:1]
+        for p in candidates:
+            if len(self.neighbors[p]) < degree:
+                continue
+            new_cost = cost + sum(self.pair_cost(idx, p, partner,
+                                                 self._positions[partner])
+                                  for partner in placed)
+            if self._best_cost is not None and new_cost >= self._best_cost:
+                continue
+            self._positions[idx] = p
+            self._used.add(p)
+            self._assign(k + 1, new_cost)
+            self._positions[idx] = None
+            self._used.remove(p)
+            if self._best_cost == 0:
+                return
+
+    def anneal(self, min_iterations=10000, seed=0):
+        """
+        Simulated annealing of the placement, which is used if the search
+        did not find a feasible placement before the deadline.
+
+        Each step moves a qubit which is not fixed to a random physical qubit,
+        mostly next to one of its partners (swapping it with the qubit placed
+        there unless that one is fixed).
+        Interacting qubits which are not connected are penalized with more
+        than the total cost of all gates.
+
+        Args:
+            min_iterations (int): Number of steps to perform even if the
+                deadline has passed already.
+            seed (int): Seed of the random number generator.
+
+        Returns:
+            The best feasible placement found (or None).
+        """
+        rng = random.Random(seed)
+        penalty = self.total_weight + 1
+        positions = [None] * self.num_logical
+        occupant = dict()
+        for idx, p in self.fixed.items():
+            positions[idx] = p
+            occupant[p] = idx
+        free_ids = [p for p in self.physical_ids if p not in occupant]
+        movable = self.get_order()
+        for idx in movable:
+            positions[idx] = free_ids.pop(0)
+            occupant[positions[idx]] = idx
+
+        def pair_energy(idx0, p0, idx1, p1):
+            if p1 not in self.neighbors[p0]:
+                return penalty
+            return self.pair_cost(idx0, p0, idx1, p1)
+
+        def local_energy(idx, p, skip):
+            return sum(pair_energy(idx, p, partner, positions[partner])
+                       for partner in self.partners[idx] if partner != skip)
+
+        energy = sum(pair_energy(idx0, positions[idx0], idx1, positions[idx1])
+                     for idx0 in range(self.num_logical)
+                     for idx1 in self.partners[idx0] if idx0 < idx1)
+        best = list(positions)
+        best_energy = energy
+        start = _timer()
+        duration = max(self.deadline - start, 1e-3)
+        temperature = float(penalty)
+        iteration = 0
+        while best_energy > 0 and len(movable) > 0:
+            if iteration % 100 == 0:
+                elapsed = _timer() - start
+                if iteration >= min_iterations and elapsed > duration:
+                    break
+                # cool down from penalty to 0.05 over the available time
+                # (or the minimal number of iterations if there is none)
+                fraction = min(elapsed / duration,
+                               float(iteration) / min_iterations)
+                temperature = penalty * (0.05 / penalty) ** min(fraction, 1.)
+            iteration += 1
+            idx = rng.choice(movable)
+            p0 = positions[idx]
+            if len(self.partners[idx]) > 0 and rng.random() < 0.8:
+                # move the qubit next to one of its partners
+                partner = rng.choice(sorted(self.partners[idx]))
+                p1 = rng.choice(sorted(self.neighbors[positions[partner]]))
+            else:
+                p1 = rng.choice(self.physical_ids)
+            if p1 == p0:
+                continue
+            other = occupant.get(p1)
+            if other in self.fixed:
+                continue
+            before = local_energy(idx, p0, other)
+            after = local_energy(idx, p1, other)
+            if other is not None:
+                before += local_energy(other, p1, idx)
+                after += local_energy(other, p0, idx)
+                if other in self.partners[idx]:
+                    before += pair_energy(idx, p0, other, p1)
+                    after += pair_energy(idx, p1, other, p0)
+            delta = after - before
+            if delta > 0 and rng.random() >= math.exp(-delta / temperature):
+                continue
+            positions[idx] = p1
+            occupant[p1] = idx
+            if other is None:
+                del occupant[p0]
+            else:
+                positions[other] = p0
+                occupant[p0] = other
+            energy += delta
+            if energy < best_energy:
+                best_energy = energy
+                best = list(positions)
+        if best_energy >= penalty:
+            return None
+        return best
+
+
+class PlacementMapper(BasicMapperEngine):
+    """
+    Mapper for devices with an arbitrary (directed) coupling map, which
+    places the qubits such that the circuit can be executed without Swaps.
+
+    The mapper stores all commands until a FlushGate arrives. Then, it
+    places the logical qubits on the device such that all qubits which
+    interact via CNOT gates are connected, minimizing the number of CNOTs
+    against the direction of the coupling map (which have to be flipped
+    later on, see SwapAndCNOTFlipper):
+
+    1) A branch-and-bound search for an embedding of the interaction graph
+       into the coupling graph places the qubits one by one (the qubit with
+       most placed partners first) on common neighbors of their partners.
+    2) If the search does not find a placement within the time budget, the
+       placement is optimized using simulated annealing.
+
+    Qubits which are still allocated from a previous flush keep their
+    physical qubits. The placements are cached per coupling map and
+    interaction graph (with the new qubits numbered in the order of their
+    allocation and the others given by their physical qubits), such that
+    recompiling the same circuit, e.g., with different rotation angles (also
+    with a new PlacementMapper), reuses the placement.
+
+    Attributes:
+        connections (set): Set of (control, target) tuples of physical qubit
+            ids on which a CNOT can be executed.
+        time_budget (float): Time (in seconds) to spend on the placement.
+
+    Warning:
+        If the provided circuit cannot be mapped to the hardware layout
+        without performing Swaps, the mapping procedure
+        **raises an Exception**.
+    """
+    def __init__(self, connections, time_budget=1.):
+        """
+        Initialize a PlacementMapper compiler engine.
+
+        Args:
+            connections (set): Set of (control, target) tuples of physical
+                qubit ids on which a CNOT can be executed.
+            time_budget (float): Time (in seconds) to spend on the placement
+                of a circuit. Default is 1 second.
+        """
+        BasicMapperEngine.__init__(self)
+        self.current_mapping = dict()
+        self.connections = connections
+        self.time_budget = time_budget
+        self._reset()
+
+    def _reset(self):
+        """
+        Reset the mapping parameters so the next circuit can be mapped.
+        """
+        self._cmds = []
+        self._interactions = dict()
+        # ids of the qubits allocated since the last flush (in this order)
+        self._new_ids = []
+        self._deallocated_ids = []
+
+    def _determine_cost(self, mapping):
+        """
+        Determines the cost of the circuit with the given mapping.
+
+        Args:
+            mapping (dict): Dictionary with key, value pairs where keys are
+                logical qubit ids and the corresponding value is the physical
+                location on the chip.
+        Returns:
+            Cost measure taking into account CNOT directionality or None
+            if the circuit cannot be executed given the mapping.
+        """
+
+        cost = 0
+        for tpl in self._interactions:
+            ctrl_id = tpl[0]
+            target_id = tpl[1]
+            ctrl_pos = mapping[ctrl_id]
+            target_pos = mapping[target_id]
+            if not (ctrl_pos, target_pos) in self.connections:
+                if (target_pos, ctrl_pos) in self.connections:
+                    cost += self._interactions[tpl]
+                else:
+                    return None
+        return cost
+
+    def _find_placement(self, logical_ids, fixed=None):
+        """
+        Returns the physical ids on which to place the logical qubits.
+
+        Args:
+            logical_ids (list<int>): Logical qubit ids (in the order of their
+                allocation).
+            fixed (dict): Logical ids (not in logical_ids) and physical ids of
+                the qubits which have been placed before.
+
+        Raises:
+            RuntimeError: If the qubits cannot be placed without Swaps.
+        """
+        fixed = fixed or dict()
+        fixed_ids = sorted(fixed, key=lambda logical_id: fixed[logical_id])
+        index = {logical_id: i
+                 for i, logical_id in enumerate(logical_ids + fixed_ids)}
+        weights = {(index[ctrl_id], index[target_id]): count
+                   for (ctrl_id, target_id), count
+                   in self._interactions.items()}
+        fixed_positions = tuple(fixed[logical_id] for logical_id in fixed_ids)
+        fingerprint = (frozenset(self.connections), len(logical_ids),
+                       tuple(sorted(weights.items())), fixed_positions)
+        if fingerprint in _placements:
+            return _placements[fingerprint]
+
+        problem = _PlacementProblem(
+            len(index), weights, self.connections,
+            _timer() + self.time_budget,
+            {len(logical_ids) + i: p for i, p in enumerate(fixed_positions)})
+        if len(index) > len(problem.physical_ids):
+            raise RuntimeError("Too many qubits allocated. The device "
+                               "supports at most {} qubits."
+                               .format(len(problem.physical_ids)))
+        placement, complete = problem.search()
+        if placement is None and not complete:
+            placement = problem.anneal()
+        if placement is None:
+            raise RuntimeError("Circuit cannot be mapped without using "
+                               "Swaps. Mapping failed.")
+        placement = placement[:len(logical_ids)]
+        if len(_placements) >= PLACEMENT_CACHE_SIZE:
+            _placements.clear()
+        _placements[fingerprint] = placement
+        return placement
+
+    def _get_fixed_qubits(self):
+        """
+        Returns the logical and physical ids of the qubits which keep their
+        physical qubits (by default, all qubits placed before).
+        """
+        return self.current_mapping
+
+    def _run(self):
+        """
+        Runs all stored gates.
+
+        Raises:
+            RuntimeError: If the qubits cannot be placed without Swaps.
+        """
+        fixed = self._get_fixed_qubits()
+        mapping = self._current_mapping
+        logical_ids = [logical_id for logical_id
+                       in sorted(mapping, key=lambda idx: mapping[idx])
+                       if logical_id not in fixed] + self._new_ids
+        if len(logical_ids) > 0 or len(self._interactions) > 0:
+            placement = self._find_placement(logical_ids, fixed)
+            self._current_mapping.update(zip(logical_ids, placement))
+
+        for cmd in self._cmds:
+            self._send_cmd_with_mapped_ids(cmd)
+        # deallocated qubits free their physical qubits
+        for logical_id in self._deallocated_ids:
+            self._current_mapping.pop(logical_id, None)
+
+    def _store(self, cmd):
+        """
+        Store a command and handle CNOTs.
+
+        Args:
+            cmd (Command): A command to store
+        """
+        if not cmd.gate == FlushGate():
+            target = cmd.qubits[0][0].id
+        if _is_cnot(cmd):
+            # CNOT encountered
+            ctrl = cmd.control_qubits[0].id
+            if not (ctrl, target) in self._interactions:
+                self._interactions[(ctrl, target)] = 0
+            self._interactions[(ctrl, target)] += 1
+        elif cmd.gate == Allocate:
+            if (target not in self._current_mapping and
+                    target not in self._new_ids):
+                self._new_ids.append(target)
+        elif cmd.gate == Deallocate:
+            self._deallocated_ids.append(target)
+        self._cmds.append(cmd)
+
+    def receive(self, command_list):
+        """
+        Receives a command list and, for each command, stores it until
+        completion.
+
+        Args:
+            command_list (list of Command objects): list of commands to
+                receive.
+
+        Raises:
+            Exception: If mapping the CNOT gates to 1 qubit would require
+                Swaps. The current version only supports remapping of CNOT
+                gates without performing any Swaps due to the large costs
+                associated with Swapping given the CNOT constraints.
+        """
+        for cmd in command_list:
+            self._store(cmd)
+            if isinstance(cmd.gate, FlushGate):
+                self._run()
+                self._reset()
+
+
+def _is_cnot(cmd):
+    """
+    Check if the command corresponds to a CNOT (controlled NOT gate).
+
+    Args:
+        cmd (Command): Command to check whether it is a controlled NOT
+            gate.
+    """
+    return (isinstance(cmd.gate, NOT.__class__)
+            and get_control_count(cmd) == 1)
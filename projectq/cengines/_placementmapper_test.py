@@ -0,0 +1,236 @@
+#   Copyright 2018 ProjectQ-Framework (www.projectq.ch)
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Tests for projectq.cengines._placementmapper.py."""
+import itertools
+
+import pytest
+
+from projectq import MainEngine
+from projectq.cengines import DummyEngine
+from projectq.ops import All, CNOT, H, Measure, Rx
+
+from projectq.cengines import _placementmapper
+
+
+def _grid_connections(num_rows, num_columns):
+    connections = set()
+    for row in range(num_rows):
+        for column in range(num_columns):
+            qubit = row * num_columns + column
+            if column + 1 < num_columns:
+                connections.add((qubit, qubit + 1))
+            if row + 1 < num_rows:
+                connections.add((qubit + num_columns, qubit))
+    return connections
+
+
+def _check_placement(backend, connections):
+    for cmd in backend.received_commands:
+        if len(cmd.control_qubits) == 1:
+            pair = (cmd.control_qubits[0].id, cmd.qubits[0][0].id)
+            assert (pair in connections or
+                    tuple(reversed(pair)) in connections)
+
+
+def test_placement_mapper_optimal_cost():
+    connections = set([(0, 1), (1, 2), (2, 3), (3, 0), (0, 4)])
+    backend = DummyEngine(save_commands=True)
+    mapper = _placementmapper.PlacementMapper(connections)
+    eng = MainEngine(backend, [mapper])
+    qureg = eng.allocate_qureg(4)
+    CNOT | (qureg[0], qureg[1])
+    CNOT | (qureg[1], qureg[0])
+    CNOT | (qureg[1], qureg[0])
+    CNOT | (qureg[1], qureg[2])
+    CNOT | (qureg[3], qureg[2])
+    CNOT | (qureg[3], qureg[0])
+    eng.flush()
+    _check_placement(backend, connections)
+    # compare with all possible placements
+    logical_ids = [qb.id for qb in qureg]
+    mapper._interactions = {(0, 1): 1, (1, 0): 2, (1, 2): 1, (3, 2): 1,
+                            (3, 0): 1}
+    costs = []
+    for physical_ids in itertools.permutations(range(5), 4):
+        cost = mapper._determine_cost(dict(zip(logical_ids, physical_ids)))
+        if cost is not None:
+            costs.append(cost)
+    assert mapper._determine_cost(mapper.current_mapping) == min(costs)
+    All(Measure) | qureg
+
+
+def test_placement_mapper_invalid_circuit():
+    connections = set([(0, 1), (1, 2), (2, 3), (3, 4)])
+    eng = MainEngine(DummyEngine(), [
+        _placementmapper.PlacementMapper(connections)])
+    qureg = eng.allocate_qureg(4)
+    CNOT | (qureg[0], qureg[1])
+    CNOT | (qureg[0], qureg[2])
+    CNOT | (qureg[0], qureg[3])
+    with pytest.raises(RuntimeError):
+        eng.flush()
+
+
+def test_placement_mapper_too_many_qubits():
+    eng = MainEngine(DummyEngine(), [
+        _placementmapper.PlacementMapper(set([(0, 1)]))])
+    qureg = eng.allocate_qureg(3)
+    All(H) | qureg
+    with pytest.raises(RuntimeError):
+        eng.flush()
+
+
+def test_placement_mapper_large_device():
+    connections = _grid_connections(8, 8)
+    backend = DummyEngine(save_commands=True)
+    mapper = _placementmapper.PlacementMapper(connections)
+    eng = MainEngine(backend, [mapper])
+    # a 6x6 grid of interactions (in a scrambled order)
+    qureg = eng.allocate_qureg(36)
+    order = [(7 * i) % 36 for i in range(36)]
+    for i in order:
+        if i % 6 < 5:
+            CNOT | (qureg[i], qureg[i + 1])
+        if i < 30:
+            CNOT | (qureg[i], qureg[i + 6])
+    eng.flush()
+    _check_placement(backend, connections)
+    assert len(set(mapper.current_mapping.values())) == 36
+
+
+def test_placement_mapper_cache(monkeypatch):
+    monkeypatch.setattr(_placementmapper, "_placements", dict())
+    connections = _grid_connections(3, 3)
+
+    def interactions(offset):
+        return {(offset, offset + 1): 1, (offset + 1, offset + 2): 2,
+                (offset + 2, offset + 3): 1, (offset + 3, offset): 1,
+                (offset + 3, offset + 4): 1}
+
+    mapper = _placementmapper.PlacementMapper(connections)
+    mapper._interactions = interactions(10)
+    placement = mapper._find_placement(list(range(10, 15)))
+
+    def search(self):
+        raise AssertionError("placement is not cached")
+
+    monkeypatch.setattr(_placementmapper._PlacementProblem, "search", search)
+    # new qubit ids, same interaction graph, new mapper
+    mapper = _placementmapper.PlacementMapper(set(connections))
+    mapper._interactions = interactions(20)
+    assert mapper._find_placement(list(range(20, 25))) == placement
+    assert len(_placementmapper._placements) == 1
+    mapper._interactions = {(0, 1): 1}
+    with pytest.raises(AssertionError):
+        mapper._find_placement([0, 1])
+    # other coupling map
+    mapper = _placementmapper.PlacementMapper(_grid_connections(2, 3))
+    mapper._interactions = interactions(20)
+    with pytest.raises(AssertionError):
+        mapper._find_placement(list(range(20, 25)))
+    # the cache is cleared once it is full
+    monkeypatch.undo()
+    monkeypatch.setattr(_placementmapper, "_placements", dict())
+    monkeypatch.setattr(_placementmapper, "PLACEMENT_CACHE_SIZE", 1)
+    mapper._interactions = {(0, 1): 1}
+    mapper._find_placement([0, 1])
+    mapper._interactions = {(1, 0): 1}
+    mapper._find_placement([0, 1])
+    assert len(_placementmapper._placements) == 1
+
+
+def test_placement_mapper_repeated_circuits(monkeypatch):
+    monkeypatch.setattr(_placementmapper, "_placements", dict())
+    num_searches = [0]
+    search = _placementmapper._PlacementProblem.search
+
+    def counting_search(self):
+        num_searches[0] += 1
+        return search(self)
+
+    monkeypatch.setattr(_placementmapper._PlacementProblem, "search",
+                        counting_search)
+    connections = _grid_connections(3, 3)
+    backend = DummyEngine(save_commands=True)
+    eng = MainEngine(backend, [_placementmapper.PlacementMapper(connections)])
+
+    def run_circuit(eng, angle):
+        qureg = eng.allocate_qureg(4)
+        Rx(angle) | qureg[0]
+        for i in range(3):
+            CNOT | (qureg[i], qureg[i + 1])
+        CNOT | (qureg[3], qureg[0])
+        All(Measure) | qureg
+        del qureg
+        eng.flush()
+
+    for angle in (0.1, 0.2, 0.3):
+        run_circuit(eng, angle)
+        # deallocated qubits are removed from the mapping
+        assert eng.mapper.current_mapping == dict()
+    assert num_searches[0] == 1
+    _check_placement(backend, connections)
+    # a new engine list reuses the placement
+    eng = MainEngine(DummyEngine(),
+                     [_placementmapper.PlacementMapper(connections)])
+    run_circuit(eng, 0.4)
+    assert num_searches[0] == 1
+
+
+def test_placement_mapper_qubits_stay_in_place():
+    connections = _grid_connections(3, 3)
+    backend = DummyEngine(save_commands=True)
+    eng = MainEngine(backend, [_placementmapper.PlacementMapper(connections)])
+    qureg = eng.allocate_qureg(2)
+    CNOT | (qureg[0], qureg[1])
+    eng.flush()
+    mapping = eng.mapper.current_mapping
+    qureg += eng.allocate_qureg(2)
+    CNOT | (qureg[1], qureg[2])
+    CNOT | (qureg[2], qureg[3])
+    CNOT | (qureg[3], qureg[0])
+    eng.flush()
+    new_mapping = eng.mapper.current_mapping
+    assert all(new_mapping[idx] == mapping[idx] for idx in mapping)
+    assert len(set(new_mapping.values())) == 4
+    _check_placement(backend, connections)
+    # the new qubits are placed on the free physical qubits
+    qureg2 = eng.allocate_qureg(5)
+    eng.flush()
+    assert len(set(eng.mapper.current_mapping.values())) == 9
+    All(Measure) | qureg + qureg2
+    # placed qubits which interact have to be connected
+    problem = _placementmapper._PlacementProblem(
+        2, {(0, 1): 1}, connections, 0., fixed={0: 0, 1: 8})
+    assert problem.search() == (None, True)
+    assert problem.anneal(min_iterations=10) is None
+
+
+def test_placement_mapper_anneal():
+    connections = _grid_connections(4, 4)
+    backend = DummyEngine(save_commands=True)
+    # no time for the search: the placement is found by annealing
+    mapper = _placementmapper.PlacementMapper(connections, time_budget=0.)
+    eng = MainEngine(backend, [mapper])
+    qureg = eng.allocate_qureg(8)
+    for i in range(7):
+        CNOT | (qureg[i], qureg[i + 1])
+    eng.flush()
+    _check_placement(backend, connections)
+
+    problem = _placementmapper._PlacementProblem(
+        3, {(0, 1): 1, (1, 2): 1, (2, 0): 1}, connections, 0.)
+    assert problem.search() == (None, False)
+    assert problem.anneal(min_iterations=100) is None
@@ -0,0 +1,186 @@
+#   Copyright 2017 ProjectQ-Framework (www.projectq.ch)
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Contains the CompilerProfiler, which records where the compile time of a
+compiler engine pipeline is spent.
+
+Example:
+    .. code-block:: python
+
+        eng = MainEngine(engine_list=..., profile=True)
+        ...
+        eng.flush()
+        print(eng.profiler)
+        stats = eng.profiler.to_json()
+"""
+
+import json
+from timeit import default_timer as _timer
+
+
+class _EngineRecord(object):
+    """
+    Statistics of one profiled engine.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.commands_in = 0
+        self.commands_out = 0
+        self.time = 0.
+        self.cumulative_time = 0.
+        self.depth = 0
+        self.max_depth = 0
+        self.gate_class_counts = dict()
+
+    def as_dict(self):
+        return {'engine': self.name,
+                'calls': self.calls,
+                'commands_in': self.commands_in,
+                'commands_out': self.commands_out,
+                'time': self.time,
+                'cumulative_time': self.cumulative_time,
+                'max_depth': self.max_depth,
+                'gate_class_counts': dict(self.gate_class_counts)}
+
+
+class CompilerProfiler(object):
+    """
+    Records statistics of the compiler engines of a pipeline.
+
+    The receive and send functions of each instrumented engine are wrapped
+    (on the instance), which records for each engine:
+
+    * calls: Number of (top-level) calls to receive.
+    * commands_in / commands_out: Number of commands the engine received
+      from the previous engine / sent on to the next engine.
+    * time: Time (in seconds) spent in receive, excluding the time spent in
+      other profiled engines (e.g., the following ones).
+    * cumulative_time: Time (in seconds) spent in receive, including the
+      time spent in all following engines.
+    * max_depth: Maximal nesting depth of calls to receive, e.g., the depth
+      of the decomposition recursion of an AutoReplacer.
+    * gate_class_counts: Number of received commands per gate class (and
+      number of control qubits).
+
+    Engines which are not instrumented (such as the ones inserted by meta
+    functions, e.g., Control) are not recorded and their time is attributed
+    to the engine which calls them.
+
+    Note:
+        Usually, the profiler is created by the MainEngine using
+        MainEngine(..., profile=True), which instruments all engines in the
+        engine list and the back-end.
+    """
+    def __init__(self):
+        self._records = []
+        self._stack = []  # time spent in nested receive calls, per level
+
+    def instrument(self, engine, name=None):
+        """
+        Start recording the statistics of an engine.
+
+        Args:
+            engine (BasicEngine): Engine to instrument.
+            name (str): Name of the engine in the statistics. Default: The
+                class name of the engine.
+        """
+        if name is None:
+            name = engine.__class__.__name__
+        record = _EngineRecord(name)
+        self._records.append(record)
+        stack = self._stack
+        receive = engine.receive
+        send = engine.send
+
+        def profiled_receive(command_list):
+            if record.depth == 0:
+                record.calls += 1
+                record.commands_in += len(command_list)
+                counts = record.gate_class_counts
+                for cmd in command_list:
+                    key = (len(cmd.control_qubits) * "C" +
+                           cmd.gate.__class__.__name__)
+                    counts[key] = counts.get(key, 0) + 1
+            record.depth += 1
+            record.max_depth = max(record.max_depth, record.depth)
+            stack.append(0.)
+            start = _timer()
+            try:
+                receive(command_list)
+            finally:
+                elapsed = _timer() - start
+                record.time += elapsed - stack.pop()
+                record.depth -= 1
+                if record.depth == 0:
+                    record.cumulative_time += elapsed
+                if len(stack) > 0:
+                    stack[-1] += elapsed
+
+        def profiled_send(command_list):
+            record.commands_out += len(command_list)
+            send(command_list)
+
+        engine.receive = profiled_receive
+        engine.send = profiled_send
+
+    def get_statistics(self):
+        """
+        Return the recorded statistics.
+
+        Returns:
+            List of dictionaries (one per instrumented engine, in the order
+            of instrumentation) with the keys 'engine', 'calls',
+            'commands_in', 'commands_out', 'time', 'cumulative_time',
+            'max_depth', and 'gate_class_counts'.
+        """
+        return [record.as_dict() for record in self._records]
+
+    def to_json(self, **kwargs):
+        """
+        Return the recorded statistics as a JSON string.
+
+        Args:
+            kwargs: Keyword arguments passed on to json.dumps (e.g., indent).
+        """
+        return json.dumps(self.get_statistics(), **kwargs)
+
+    def __str__(self):
+        """
+        Return a summary of the recorded statistics.
+        """
+        if len(self._records) == 0:
+            return "(No engines profiled)"
+        total = sum(record.time for record in self._records)
+        lines = []
+        for record in self._records:
+            fan_out = (float(record.commands_out) / record.commands_in
+                       if record.commands_in > 0 else 0.)
+            lines.append(
+                record.name + " :\n" +
+                "    time : {:.6f}s ({:.1f}%), cumulative : {:.6f}s\n".format(
+                    record.time,
+                    100. * record.time / total if total > 0 else 0.,
+                    record.cumulative_time) +
+                "    commands in : {}, out : {} (x{:.2f}), calls : {}, "
+                "max. depth : {}".format(record.commands_in,
+                                         record.commands_out, fan_out,
+                                         record.calls, record.max_depth))
+            gate_class_list = [name + " : " + str(num) for name, num
+                               in record.gate_class_counts.items()]
+            if len(gate_class_list) > 0:
+                lines.append("    Gate class counts:\n        " +
+                             "\n        ".join(sorted(gate_class_list)))
+        return "\n".join(lines)
@@ -0,0 +1,89 @@
+#   Copyright 2017 ProjectQ-Framework (www.projectq.ch)
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Tests for projectq.cengines._profiler.py."""
+
+import json
+
+from projectq import MainEngine
+import projectq.setups.decompositions
+from projectq.cengines import (AutoReplacer, DecompositionRuleSet,
+                               DummyEngine, InstructionFilter, LocalOptimizer)
+from projectq.ops import CNOT, H, QFT, QFTGate
+
+from projectq.cengines import _profiler
+
+
+def test_profiler_disabled():
+    backend = DummyEngine()
+    eng = MainEngine(backend, [])
+    assert eng.profiler is None
+    assert 'receive' not in vars(backend)
+    assert 'send' not in vars(backend)
+
+
+def test_profiler_statistics():
+    rule_set = DecompositionRuleSet(modules=[projectq.setups.decompositions])
+
+    def no_qft(eng, cmd):
+        return not isinstance(cmd.gate, QFTGate)
+
+    backend = DummyEngine(save_commands=True)
+    eng = MainEngine(backend, [LocalOptimizer(), AutoReplacer(rule_set),
+                               InstructionFilter(no_qft)], profile=True)
+    qureg = eng.allocate_qureg(3)
+    H | qureg[0]
+    H | qureg[0]
+    CNOT | (qureg[0], qureg[1])
+    QFT | qureg
+    eng.flush()
+
+    stats = eng.profiler.get_statistics()
+    assert [s['engine'] for s in stats] == ["0: LocalOptimizer",
+                                            "1: AutoReplacer",
+                                            "2: InstructionFilter",
+                                            "3: DummyEngine"]
+    optimizer, replacer, _, dummy = stats
+    assert optimizer['commands_in'] == 3 + 5
+    assert optimizer['gate_class_counts'] == {'AllocateQubitGate': 3,
+                                              'HGate': 2, 'CXGate': 1,
+                                              'QFTGate': 1, 'FlushGate': 1}
+    # H gates cancel
+    assert optimizer['commands_out'] == 3 + 3
+    assert replacer['commands_in'] == 3 + 3
+    assert replacer['commands_out'] > replacer['commands_in']
+    assert replacer['max_depth'] > 1
+    assert dummy['commands_in'] == len(backend.received_commands)
+    assert dummy['commands_out'] == 0
+    for s in stats:
+        assert 0 <= s['time'] <= s['cumulative_time']
+    assert stats[0]['cumulative_time'] >= sum(s['time'] for s in stats[1:])
+
+    assert json.loads(eng.profiler.to_json()) == stats
+    summary = str(eng.profiler)
+    assert "1: AutoReplacer :" in summary
+    assert "QFTGate : 1" in summary
+
+
+def test_profiler_instrument():
+    profiler = _profiler.CompilerProfiler()
+    assert str(profiler) == "(No engines profiled)"
+    backend = DummyEngine()
+    profiler.instrument(backend)
+    eng = MainEngine(backend, [])
+    eng.flush()
+    stats = profiler.get_statistics()
+    assert stats[0]['engine'] == "DummyEngine"
+    assert stats[0]['calls'] == 1
+    assert "DummyEngine :" in str(profiler)
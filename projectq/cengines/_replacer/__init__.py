@@ -17,3 +17,4 @@ from ._decomposition_rule_set import DecompositionRuleSet
 from ._replacer import (AutoReplacer,
                         InstructionFilter,
                         NoGateDecompositionError)
+from ._cost_chooser import CostChooser
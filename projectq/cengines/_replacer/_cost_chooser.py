@@ -0,0 +1,208 @@
+#   Copyright 2017 ProjectQ-Framework (www.projectq.ch)
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+"""
+Contains a decomposition chooser for the AutoReplacer which picks the
+decomposition with the lowest estimated cost (e.g., number of CNOT gates).
+"""
+
+import weakref
+
+from projectq.cengines import BasicEngine
+from projectq.ops import ClassicalInstructionGate, Command, T, Tdag, XGate
+
+from ._replacer import (AutoReplacer, InstructionFilter,
+                        NoGateDecompositionError)
+
+
+def _count_cnots(counter):
+    return sum(num for (gate_class, ctrl_cnt), num
+               in counter.gate_class_counts.items()
+               if gate_class is XGate and ctrl_cnt == 1)
+
+
+def _count_t_gates(counter):
+    return sum(num for (gate, ctrl_cnt), num in counter.gate_counts.items()
+               if ctrl_cnt == 0 and (gate == T or gate == Tdag))
+
+
+def _count_gates(counter):
+    return sum(num for (gate, ctrl_cnt), num in counter.gate_counts.items()
+               if not isinstance(gate, ClassicalInstructionGate))
+
+
+def _get_depth(counter):
+    return counter.depth_of_dag
+
+
+class _DryRunEngine(BasicEngine):
+    """
+    Front of the engine chain of a dry run, which provides what the engines
+    need from a MainEngine (qubit ids, active and dirty qubits) without
+    registering an exit handler for each dry run.
+    """
+    def __init__(self, engine_list):
+        BasicEngine.__init__(self)
+        self.main_engine = self
+        self.active_qubits = weakref.WeakSet()
+        self.dirty_qubits = set()
+        self._qubit_idx = 0
+        engines = [self] + engine_list
+        for engine, next_engine in zip(engines[:-1], engines[1:]):
+            engine.next_engine = next_engine
+            next_engine.main_engine = self
+        engines[-1].is_last_engine = True
+
+    def get_new_qubit_id(self):
+        self._qubit_idx += 1
+        return self._qubit_idx - 1
+
+    def set_measurement_result(self, qubit, value):
+        pass
+
+    def receive(self, command_list):
+        self.send(command_list)
+
+
+class CostChooser(object):
+    """
+    Decomposition chooser (see AutoReplacer) which chooses the decomposition
+    with the lowest cost.
+
+    The cost of a decomposition is estimated by a dry run: The command is
+    decomposed (recursively, choosing the cheapest decompositions on each
+    level) into gates which are accepted by the filter function, and the
+    resulting gates are counted using a ResourceCounter. The choice is cached
+    for each combination of gate, number of control qubits, and register
+    sizes (see AutoReplacer).
+
+    Example:
+        .. code-block:: python
+
+            chooser = CostChooser(cost='t')
+            eng = MainEngine(engine_list=[AutoReplacer(rule_set, chooser)])
+
+            engine_list = restrictedgateset.get_engine_list(
+                one_qubit_gates=(Rz, H, T, Tdag), compiler_chooser=chooser)
+    """
+    def __init__(self, filterfun=None, rule_set=None, cost='cnot'):
+        """
+        Initialize a CostChooser.
+
+        Args:
+            filterfun (function): Filter function (see InstructionFilter)
+                which returns True for the target gates of the dry run
+                (default: all gates acting on at most two qubits).
+            rule_set (DecompositionRuleSet): Decomposition rules used for
+                the dry run (default: all rules of
+                projectq.setups.decompositions).
+            cost (str|function): Cost to minimize, either 'cnot' (number of
+                CNOT gates, default), 't' (number of T and Tdag gates),
+                'depth' (circuit depth), 'gates' (number of gates), or a
+                function which takes the ResourceCounter of the dry run and
+                returns the cost.
+
+        Raises:
+            ValueError: If the cost is unknown.
+        """
+        costs = {'cnot': _count_cnots, 't': _count_t_gates,
+                 'depth': _get_depth, 'gates': _count_gates}
+        if not callable(cost):
+            if cost not in costs:
+                raise ValueError("Unknown cost '{}', expected one of {}."
+                                 .format(cost, ", ".join(sorted(costs))))
+            cost = costs[cost]
+        if filterfun is None:
+            def filterfun(eng, cmd):
+                return (isinstance(cmd.gate, ClassicalInstructionGate) or
+                        len([qb for qureg in cmd.all_qubits
+                             for qb in qureg]) <= 2)
+        if rule_set is None:
+            import projectq.setups.decompositions
+            from projectq.cengines import DecompositionRuleSet
+            rule_set = DecompositionRuleSet(
+                modules=[projectq.setups.decompositions])
+        self._filterfun = filterfun
+        self._rule_set = rule_set
+        self._cost = cost
+        self._choices = dict()  # cached indices of the best decompositions
+        self._in_progress = set()  # keys of the currently estimated commands
+
+    def estimate_cost(self, cmd, decomposition):
+        """
+        Return the estimated cost of decomposing cmd using the given
+        decomposition (or infinity if no decomposition into the target gates
+        is found in the dry run).
+
+        Args:
+            cmd (Command): Command to decompose.
+            decomposition: Decomposition (see
+                DecompositionRuleSet.decompositions) to apply to cmd.
+        """
+        from projectq.backends import ResourceCounter
+
+        counter = ResourceCounter()
+        top_level = [None]  # the command to decompose
+
+        def filterfun(eng, command):
+            if command is top_level[0]:
+                return False
+            return self._filterfun(eng, command)
+
+        def chooser(command, decomposition_list):
+            if command is top_level[0]:
+                return decomposition
+            return self(command, decomposition_list)
+
+        eng = _DryRunEngine([AutoReplacer(self._rule_set, chooser),
+                             InstructionFilter(filterfun), counter])
+        controls = eng.allocate_qureg(len(cmd.control_qubits))
+        qubits = tuple(eng.allocate_qureg(len(qureg)) for qureg in cmd.qubits)
+        top_level[0] = Command(eng, cmd.gate, qubits, controls)
+        try:
+            eng.send(top_level)
+        except NoGateDecompositionError:
+            return float('inf')
+        finally:
+            del controls, qubits
+        return self._cost(counter)
+
+    def __call__(self, cmd, decomposition_list):
+        """
+        Return the decomposition with the lowest estimated cost.
+
+        Args:
+            cmd (Command): Command to decompose.
+            decomposition_list (list): Decompositions which recognize cmd.
+        """
+        if len(decomposition_list) == 1:
+            return decomposition_list[0]
+        key = AutoReplacer._get_cache_key(cmd)
+        if key is not None:
+            key = key + (len(decomposition_list),)
+            if key in self._choices:
+                return decomposition_list[self._choices[key]]
+            if key in self._in_progress:  # avoid infinite recursions
+                return decomposition_list[0]
+            self._in_progress.add(key)
+        try:
+            costs = [self.estimate_cost(cmd, decomposition)
+                     for decomposition in decomposition_list]
+        finally:
+            self._in_progress.discard(key)
+        best = costs.index(min(costs))
+        if key is not None:
+            self._choices[key] = best
+        return decomposition_list[best]
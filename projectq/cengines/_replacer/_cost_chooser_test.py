@@ -0,0 +1,149 @@
+#   Copyright 2017 ProjectQ-Framework (www.projectq.ch)
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Tests for projectq.cengines._replacer._cost_chooser.py."""
+
+import pytest
+
+from projectq import MainEngine
+from projectq.cengines import (AutoReplacer, DecompositionRule,
+                               DecompositionRuleSet, DummyEngine,
+                               InstructionFilter)
+from projectq.meta import Control
+from projectq.ops import (BasicGate, ClassicalInstructionGate, CNOT, Command,
+                          H, T, Tdag, Toffoli, X)
+from projectq.setups import restrictedgateset
+from projectq.cengines._replacer import _cost_chooser
+
+
+class TwoQubitGateClass(BasicGate):
+    def __str__(self):
+        return "TwoQubitGate"
+
+
+TwoQubitGate = TwoQubitGateClass()
+
+
+def _decompose_cnots(cmd):
+    qb0, qb1 = cmd.qubits
+    CNOT | (qb0, qb1)
+    CNOT | (qb1, qb0)
+    CNOT | (qb0, qb1)
+
+
+def _decompose_t_gates(cmd):
+    qb0, qb1 = cmd.qubits
+    T | qb0
+    H | qb1
+    CNOT | (qb0, qb1)
+    Tdag | qb1
+
+
+def _decompose_toffoli(cmd):
+    qb0, qb1 = cmd.qubits
+    ancilla = cmd.engine.allocate_qubit()
+    Toffoli | (qb0, qb1, ancilla)
+    del ancilla
+
+
+rule_set = DecompositionRuleSet(rules=[
+    DecompositionRule(TwoQubitGateClass, decompose, lambda cmd: True)
+    for decompose in (_decompose_toffoli, _decompose_cnots,
+                      _decompose_t_gates)])
+
+
+def _gate_filter(eng, cmd):
+    return not isinstance(cmd.gate, TwoQubitGateClass)
+
+
+@pytest.mark.parametrize("cost, expected", [
+    ('cnot', [T, H, X, Tdag]),
+    ('t', [X, X, X]),
+    ('gates', [X, X, X]),
+    ('depth', [X, X, X]),
+    (lambda counter: -counter.gate_counts.get((H, 0), 0), [T, H, X, Tdag])])
+def test_cost_chooser(cost, expected):
+    chooser = _cost_chooser.CostChooser(rule_set=rule_set, cost=cost)
+    backend = DummyEngine(save_commands=True)
+    eng = MainEngine(backend=backend,
+                     engine_list=[AutoReplacer(rule_set, chooser),
+                                  InstructionFilter(_gate_filter)])
+    qb0 = eng.allocate_qubit()
+    qb1 = eng.allocate_qubit()
+    for _ in range(2):
+        TwoQubitGate | (qb0, qb1)
+    eng.flush()
+    gates = [cmd.gate for cmd in backend.received_commands
+             if not isinstance(cmd.gate, ClassicalInstructionGate)]
+    assert gates == 2 * expected
+    # the Toffoli decomposition fails in the dry run (no rule in rule_set)
+    assert len(chooser._choices) == 1
+
+
+def test_cost_chooser_invalid_cost():
+    with pytest.raises(ValueError):
+        _cost_chooser.CostChooser(cost='swap')
+
+
+def test_cost_chooser_restricted_gate_set():
+    chooser = _cost_chooser.CostChooser()
+    engine_list = restrictedgateset.get_engine_list(
+        one_qubit_gates="any", two_qubit_gates=(CNOT,),
+        compiler_chooser=chooser)
+    backend = DummyEngine(save_commands=True)
+    eng = MainEngine(backend=backend, engine_list=engine_list)
+    qureg = eng.allocate_qureg(4)
+    with Control(eng, qureg[:3]):
+        X | qureg[3]
+    eng.flush()
+    assert all(len(cmd.control_qubits) <= 1
+               for cmd in backend.received_commands)
+
+
+def test_cost_chooser_dry_run(monkeypatch):
+    # the dry runs do not create MainEngines (with exit handlers)
+    def main_engine(*args, **kwargs):
+        raise AssertionError("MainEngine created")
+
+    monkeypatch.setattr("projectq.cengines.MainEngine", main_engine)
+    chooser = _cost_chooser.CostChooser(rule_set=rule_set)
+    backend = DummyEngine(save_commands=True)
+    eng = _cost_chooser._DryRunEngine([AutoReplacer(rule_set, chooser),
+                                       InstructionFilter(_gate_filter),
+                                       backend])
+    qb0 = eng.allocate_qubit()
+    qb1 = eng.allocate_qubit()
+    cmd = Command(eng, TwoQubitGate, (qb0, qb1))
+    decompositions = rule_set.decompositions[TwoQubitGateClass.__name__]
+    costs = [chooser.estimate_cost(cmd, decomposition)
+             for decomposition in decompositions]
+    assert costs == [float('inf'), 3, 1]
+
+
+def test_cost_chooser_propagates_errors():
+    def decompose_invalid(cmd):
+        raise TypeError("invalid decomposition rule")
+
+    invalid_rule_set = DecompositionRuleSet(rules=[
+        DecompositionRule(TwoQubitGateClass, decompose, lambda cmd: True)
+        for decompose in (_decompose_cnots, decompose_invalid)])
+    chooser = _cost_chooser.CostChooser(rule_set=invalid_rule_set)
+    eng = MainEngine(backend=DummyEngine(),
+                     engine_list=[AutoReplacer(invalid_rule_set, chooser),
+                                  InstructionFilter(_gate_filter)])
+    qb0 = eng.allocate_qubit()
+    qb1 = eng.allocate_qubit()
+    with pytest.raises(TypeError):
+        TwoQubitGate | (qb0, qb1)
+        eng.flush()
@@ -24,7 +24,11 @@ replace/keep.
 from projectq.cengines import (BasicEngine,
                                ForwarderEngine,
                                CommandModifier)
-from projectq.ops import (FlushGate,
+from projectq.ops import (BasicGate,
+                          ClassicalInstructionGate,
+                          Command,
+                          FastForwardingGate,
+                          FlushGate,
                           get_inverse)
 
 
@@ -32,6 +36,21 @@ class NoGateDecompositionError(Exception):
     pass
 
 
+def _is_compared_by_class(gate):
+    """
+    Returns True if the gate has parameters but is only compared by its class
+    (BasicGate.__eq__), i.e., if gates with different parameters are equal.
+
+    The functions are compared instead of the methods since, on Python 2,
+    each access of BasicGate.__eq__ creates a new unbound method.
+    """
+    eq = type(gate).__eq__
+    basic_eq = BasicGate.__eq__
+    return (getattr(eq, '__func__', eq) is getattr(basic_eq, '__func__',
+                                                    basic_eq) and
+            bool(set(vars(gate)) - {'interchangeable_qubit_indices'}))
+
+
 class InstructionFilter(BasicEngine):
     """
     The InstructionFilter is a compiler engine which changes the behavior of
@@ -78,10 +97,21 @@ class AutoReplacer(BasicEngine):
     order to determine which commands need to be replaced/decomposed/compiled
     further. The loaded setup is used to find decomposition rules appropriate
     for each command (e.g., setups.default).
+
+    The decomposition rules which recognize a command are cached for each
+    combination of gate, number of control qubits, and register sizes.
+    Optionally, the AutoReplacer also caches the fully decomposed command
+    sequence of such a combination (as a template, where the qubits are
+    replaced by their position in the decomposed command), which is then
+    replayed for subsequent commands instead of decomposing them again.
     """
+    #: maximal number of entries of each cache (caches are cleared once full)
+    max_cache_size = 10000
+
     def __init__(self, decompositionRuleSet,
                  decomposition_chooser=lambda cmd,
-                 decomposition_list: decomposition_list[0]):
+                 decomposition_list: decomposition_list[0],
+                 cache_templates=False):
         """
         Initialize an AutoReplacer.
 
@@ -90,6 +120,13 @@ class AutoReplacer(BasicEngine):
                 Command to decompose and a list of potential Decomposition
                 objects, determines (and then returns) the 'best'
                 decomposition.
+            cache_templates (bool): If True, the fully decomposed command
+                sequences are cached and replayed. This requires the
+                decompositions (and the decomposition chooser) to only depend
+                on the gate, the number of control qubits, and the register
+                sizes, and the availability of commands to not change over
+                time. Decompositions which allocate qubits, measure, or
+                flush are never cached.
 
         The default decomposition chooser simply returns the first list
         element, i.e., calling
@@ -109,6 +146,128 @@ class AutoReplacer(BasicEngine):
         BasicEngine.__init__(self)
         self._decomp_chooser = decomposition_chooser
         self.decompositionRuleSet = decompositionRuleSet
+        self._cache_templates = cache_templates
+        self._decompositions = dict()  # cached lists of decompositions
+        self._templates = dict()  # cached decomposed command sequences
+        self._recordings = []  # templates which are currently being recorded
+        self._output = []  # commands to send on at the end of receive
+
+    @staticmethod
+    def _get_cache_key(cmd):
+        """
+        Return the key under which the decompositions of cmd are cached, or
+        None if the command cannot be cached.
+
+        Gates which are only compared by their class (BasicGate.__eq__) can
+        only be cached if they have no parameters.
+        """
+        gate = cmd.gate
+        if _is_compared_by_class(gate):
+            return None
+        key = (type(gate), gate, len(cmd.control_qubits),
+               tuple(len(qureg) for qureg in cmd.qubits))
+        try:
+            hash(key)
+        except (TypeError, NotImplementedError):  # e.g., no __str__
+            return None
+        return key
+
+    def _find_decompositions(self, cmd):
+        """
+        Return the list of decompositions which recognize the command cmd.
+
+        Args:
+            cmd (Command): Command to decompose.
+        """
+        decomp_list = []
+        potential_decomps = []
+
+        # First check for a decomposition rules of the gate class, then
+        # the gate class of the inverse gate. If nothing is found, do the
+        # same for the first parent class, etc.
+        gate_mro = type(cmd.gate).mro()[:-1]
+        # If gate does not have an inverse it's parent classes are
+        # DaggeredGate, BasicGate, object. Hence don't check the last two
+        inverse_mro = type(get_inverse(cmd.gate)).mro()[:-2]
+        rules = self.decompositionRuleSet.decompositions
+        for level in range(max(len(gate_mro), len(inverse_mro))):
+            # Check for forward rules
+            if level < len(gate_mro):
+                class_name = gate_mro[level].__name__
+                try:
+                    potential_decomps = [d for d in rules[class_name]]
+                except KeyError:
+                    pass
+                # throw out the ones which don't recognize the command
+                for d in potential_decomps:
+                    if d.check(cmd):
+                        decomp_list.append(d)
+                if len(decomp_list) != 0:
+                    break
+            # Check for rules implementing the inverse gate
+            # and run them in reverse
+            if level < len(inverse_mro):
+                inv_class_name = inverse_mro[level].__name__
+                try:
+                    potential_decomps += [
+                        d.get_inverse_decomposition()
+                        for d in rules[inv_class_name]
+                    ]
+                except KeyError:
+                    pass
+                # throw out the ones which don't recognize the command
+                for d in potential_decomps:
+                    if d.check(cmd):
+                        decomp_list.append(d)
+                if len(decomp_list) != 0:
+                    break
+        return decomp_list
+
+    def _send_decomposed(self, cmd):
+        """
+        Send an (available) command on and add it to all templates which are
+        being recorded.
+
+        Commands are collected and sent on as one list at the end of
+        receive (or immediately in case of a FastForwardingGate).
+        """
+        for recording in self._recordings:
+            if recording['valid']:
+                try:
+                    positions = recording['positions']
+                    recording['commands'].append((
+                        cmd.gate,
+                        tuple(tuple(positions[qb.id] for qb in qureg)
+                              for qureg in cmd.qubits),
+                        tuple(positions[qb.id] for qb in cmd.control_qubits),
+                        cmd.tags[recording['num_tags']:]))
+                    if isinstance(cmd.gate, ClassicalInstructionGate):
+                        recording['valid'] = False
+                except KeyError:  # acts on a qubit allocated in between
+                    recording['valid'] = False
+        self._output.append(cmd)
+        if isinstance(cmd.gate, FastForwardingGate):
+            self._send_output()
+
+    def _send_output(self):
+        """
+        Send all collected commands on (as one list).
+        """
+        if len(self._output) > 0:
+            command_list, self._output = self._output, []
+            self.send(command_list)
+
+    def _replay(self, cmd, template):
+        """
+        Send the cached decomposition template on, applied to the qubits of
+        cmd.
+        """
+        qubits = [qb for qureg in cmd.all_qubits for qb in qureg]
+        for gate, qubit_positions, control_positions, tags in template:
+            self._send_decomposed(Command(
+                self.main_engine, gate,
+                tuple([qubits[i] for i in qureg] for qureg in qubit_positions),
+                [qubits[i] for i in control_positions], cmd.tags + tags))
 
     def _process_command(self, cmd):
         """
@@ -123,51 +282,21 @@ class AutoReplacer(BasicEngine):
             Exception if no replacement is available in the loaded setup.
         """
         if self.is_available(cmd):
-            self.send([cmd])
+            self._send_decomposed(cmd)
         else:
+            key = self._get_cache_key(cmd)
+            if key is not None and key in self._templates:
+                self._replay(cmd, self._templates[key])
+                return
             # check for decomposition rules
-            decomp_list = []
-            potential_decomps = []
-
-            # First check for a decomposition rules of the gate class, then
-            # the gate class of the inverse gate. If nothing is found, do the
-            # same for the first parent class, etc.
-            gate_mro = type(cmd.gate).mro()[:-1]
-            # If gate does not have an inverse it's parent classes are
-            # DaggeredGate, BasicGate, object. Hence don't check the last two
-            inverse_mro = type(get_inverse(cmd.gate)).mro()[:-2]
-            rules = self.decompositionRuleSet.decompositions
-            for level in range(max(len(gate_mro), len(inverse_mro))):
-                # Check for forward rules
-                if level < len(gate_mro):
-                    class_name = gate_mro[level].__name__
-                    try:
-                        potential_decomps = [d for d in rules[class_name]]
-                    except KeyError:
-                        pass
-                    # throw out the ones which don't recognize the command
-                    for d in potential_decomps:
-                        if d.check(cmd):
-                            decomp_list.append(d)
-                    if len(decomp_list) != 0:
-                        break
-                # Check for rules implementing the inverse gate
-                # and run them in reverse
-                if level < len(inverse_mro):
-                    inv_class_name = inverse_mro[level].__name__
-                    try:
-                        potential_decomps += [
-                            d.get_inverse_decomposition()
-                            for d in rules[inv_class_name]
-                        ]
-                    except KeyError:
-                        pass
-                    # throw out the ones which don't recognize the command
-                    for d in potential_decomps:
-                        if d.check(cmd):
-                            decomp_list.append(d)
-                    if len(decomp_list) != 0:
-                        break
+            if key is not None and key in self._decompositions:
+                decomp_list = self._decompositions[key]
+            else:
+                decomp_list = self._find_decompositions(cmd)
+                if key is not None:
+                    if len(self._decompositions) >= self.max_cache_size:
+                        self._decompositions.clear()
+                    self._decompositions[key] = decomp_list
 
             if len(decomp_list) == 0:
                 raise NoGateDecompositionError("\nNo replacement found for " +
@@ -194,10 +323,28 @@ class AutoReplacer(BasicEngine):
             # which behaves just like MainEngine
             # (--> meta functions still work)
             forwarder_eng = ForwarderEngine(cmod_eng)
+
+            recording = None
+            if self._cache_templates and key is not None:
+                recording = {'positions': {qb.id: i for i, qb in enumerate(
+                                 qb for qureg in cmd.all_qubits
+                                 for qb in qureg)},
+                             'num_tags': len(old_tags),
+                             'commands': [],
+                             'valid': True}
+                self._recordings.append(recording)
+
             cmd.engine = forwarder_eng  # send gates directly to forwarder
             # (and not to main engine, which would screw up the ordering).
-
-            chosen_decomp.decompose(cmd)  # run the decomposition
+            try:
+                chosen_decomp.decompose(cmd)  # run the decomposition
+            finally:
+                if recording is not None:
+                    self._recordings.remove(recording)
+            if recording is not None and recording['valid']:
+                if len(self._templates) >= self.max_cache_size:
+                    self._templates.clear()
+                self._templates[key] = recording['commands']
 
     def receive(self, command_list):
         """
@@ -212,4 +359,10 @@ class AutoReplacer(BasicEngine):
             if not isinstance(cmd.gate, FlushGate):
                 self._process_command(cmd)
             else:
-                self.send([cmd])
+                # decompositions which flush cannot be replayed
+                for recording in self._recordings:
+                    recording['valid'] = False
+                self._output.append(cmd)
+        # decompositions call receive recursively, which sends the commands
+        # collected so far in the correct order
+        self._send_output()
@@ -22,6 +22,7 @@ from projectq.cengines import (DummyEngine,
                                DecompositionRule)
 from projectq.ops import (BasicGate, ClassicalInstructionGate, Command, H,
                           NotInvertible, Rx, Ry, S, X)
+from projectq.meta import Control
 from projectq.cengines._replacer import _replacer
 
 
@@ -222,3 +223,129 @@ def test_auto_replacer_searches_parent_class_for_rule():
     eng.flush()
     received_gate = backend.received_commands[1].gate
     assert received_gate == X or received_gate == H
+
+
+class CacheableGateClass(BasicGate):
+    """ Test gate class which can be cached """
+    def __str__(self):
+        return "CacheableGate"
+
+
+CacheableGate = CacheableGateClass()
+
+
+def decompose_cacheable(cmd):
+    ctrl = cmd.control_qubits
+    with Control(cmd.engine, ctrl):
+        H | cmd.qubits
+    Rx(0.5) | cmd.qubits
+
+
+@pytest.fixture()
+def fixture_cacheable_gate_filter():
+    # Filter which doesn't allow CacheableGate
+    def test_gate_filter_func(self, cmd):
+        return cmd.gate != CacheableGate
+    return _replacer.InstructionFilter(test_gate_filter_func)
+
+
+def test_auto_replacer_caches_decompositions(fixture_cacheable_gate_filter):
+    calls = {'recognize': 0, 'decompose': 0}
+
+    def recognize(cmd):
+        calls['recognize'] += 1
+        return True
+
+    def decompose(cmd):
+        calls['decompose'] += 1
+        decompose_cacheable(cmd)
+
+    rules = DecompositionRuleSet(rules=[
+        DecompositionRule(CacheableGateClass, decompose, recognize)])
+    replacer = _replacer.AutoReplacer(rules)
+    eng = MainEngine(backend=DummyEngine(),
+                     engine_list=[replacer, fixture_cacheable_gate_filter])
+    qb0 = eng.allocate_qubit()
+    qb1 = eng.allocate_qubit()
+    for _ in range(3):
+        with Control(eng, qb0):
+            CacheableGate | qb1
+    CacheableGate | qb1
+    # one rule lookup per number of control qubits
+    assert calls == {'recognize': 2, 'decompose': 4}
+
+    # parametrized gates which are compared by class only are not cached
+    class ParametrizedGate(BasicGate):
+        def __init__(self, angle):
+            BasicGate.__init__(self)
+            self.angle = angle
+
+        def __str__(self):
+            return "ParametrizedGate"
+
+    assert replacer._get_cache_key(Command(eng, SomeGate, (qb0,))) is None
+    assert replacer._get_cache_key(
+        Command(eng, ParametrizedGate(0.1), (qb0,))) is None
+    assert replacer._get_cache_key(Command(eng, Rx(0.1), (qb0,))) is not None
+
+
+def test_is_compared_by_class():
+    class ParametrizedGate(BasicGate):
+        def __init__(self, angle):
+            BasicGate.__init__(self)
+            self.angle = angle
+
+    class UnboundMethod(object):
+        # like BasicGate.__eq__ on Python 2 (a new object per access)
+        __func__ = staticmethod(BasicGate.__eq__)
+
+    class Python2Gate(ParametrizedGate):
+        __eq__ = UnboundMethod()
+
+    assert _replacer._is_compared_by_class(ParametrizedGate(0.1))
+    assert _replacer._is_compared_by_class(Python2Gate(0.1))
+    assert not _replacer._is_compared_by_class(H)
+    assert not _replacer._is_compared_by_class(Rx(0.1))
+
+
+def test_auto_replacer_cache_templates(fixture_cacheable_gate_filter):
+    calls = []
+
+    def decompose(cmd):
+        calls.append(cmd)
+        decompose_cacheable(cmd)
+
+    def decompose_with_ancilla(cmd):
+        calls.append(cmd)
+        ancilla = cmd.engine.allocate_qubit()
+        X | ancilla
+        del ancilla
+
+    received = []
+    for decomposition in (decompose, decompose_with_ancilla):
+        rules = DecompositionRuleSet(rules=[
+            DecompositionRule(CacheableGateClass, decomposition,
+                              lambda cmd: True)])
+        backend = DummyEngine(save_commands=True)
+        eng = MainEngine(backend=backend,
+                         engine_list=[_replacer.AutoReplacer(
+                             rules, cache_templates=True),
+                             fixture_cacheable_gate_filter])
+        qureg = eng.allocate_qureg(4)
+        del calls[:]
+        with Control(eng, qureg[0]):
+            CacheableGate | qureg[1]
+        cmd = Command(eng, CacheableGate, ([qureg[3]],), [qureg[2]],
+                      ["AddedTag"])
+        eng.send([cmd])
+        eng.flush()
+        received.append([c for c in backend.received_commands
+                         if not isinstance(c.gate, ClassicalInstructionGate)])
+        assert len(calls) == (1 if decomposition is decompose else 2)
+
+    replayed = received[0][2:]
+    assert [c.gate for c in replayed] == [H, Rx(0.5)]
+    assert [c.qubits[0][0].id for c in replayed] == [3, 3]
+    assert [qb.id for qb in replayed[0].control_qubits] == [2]
+    assert all(c.tags == ["AddedTag"] for c in replayed)
+    assert len(received[1]) == 2
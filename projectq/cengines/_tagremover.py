@@ -55,4 +55,4 @@ class TagRemover(BasicEngine):
         for cmd in command_list:
             for tag in self._tags:
                 cmd.tags = [t for t in cmd.tags if not isinstance(t, tag)]
-            self.send([cmd])
+        self.send(command_list)
@@ -28,6 +28,7 @@ import math
 import random
 
 import networkx as nx
+import numpy as np
 
 from projectq.cengines import (BasicMapperEngine, LinearMapper,
                                return_swap_depth)
@@ -36,6 +37,60 @@ from projectq.ops import (AllocateQubitGate, Command, DeallocateQubitGate,
                           FlushGate, Swap)
 from projectq.types import WeakQubitRef
 
+#: Maximum number of mapping changes for which the swaps are cached
+SWAPS_CACHE_SIZE = 128
+
+# Properties of the elements which are sorted (see GridMapper.return_swaps)
+_FINAL_ROW = 0
+_FINAL_COLUMN = 1
+_ROW_AFTER_STEP_1 = 2
+
+
+def _odd_even_transposition_sort(positions, mapped_ids, key):
+    """
+    Sorts the elements inside each line of a grid by their key using an
+    odd-even transposition sort on all lines at once.
+
+    Args:
+        positions (numpy.ndarray): Array of shape (num_properties,
+            line_length, num_lines) which contains the properties of the
+            element at each position. It is sorted in place along axis 1.
+        mapped_ids (numpy.ndarray): Array of shape (line_length, num_lines)
+            with the mapped id of each position.
+        key (int): Index of the property to sort by.
+
+    Returns:
+        List of swap operations (pairs of mapped ids), ordered by line.
+    """
+    length = positions.shape[1]
+    swapped_pairs = []
+    finished_sorting = False
+    while not finished_sorting:
+        finished_sorting = True
+        for start in (1, 0):
+            # compare the elements at start, start + 2, ... with their
+            # successors
+            first = positions[:, start:length - 1:2]
+            second = positions[:, start + 1:length:2]
+            swap = first[key] > second[key]
+            if swap.any():
+                finished_sorting = False
+                tmp = first[:, swap]
+                first[:, swap] = second[:, swap]
+                second[:, swap] = tmp
+                pairs, lines = np.nonzero(swap)
+                swapped_pairs.append((lines, start + 2 * pairs))
+    if not swapped_pairs:
+        return []
+    lines = np.concatenate([item[0] for item in swapped_pairs])
+    indices = np.concatenate([item[1] for item in swapped_pairs])
+    # the sort is stable, i.e., swaps of the same line stay in order:
+    order = np.argsort(lines, kind='stable')
+    lines = lines[order]
+    indices = indices[order]
+    return list(zip(mapped_ids[indices, lines].tolist(),
+                    mapped_ids[indices + 1, lines].tolist()))
+
 
 class GridMapper(BasicMapperEngine):
     """
@@ -136,6 +191,10 @@ class GridMapper(BasicMapperEngine):
         # the bound methods of the random module which might be used in other
         # places.
         self._rng = random.Random(11)
+        # Caches for return_swaps and _run (key: destinations of a mapping
+        # change, see _return_destinations):
+        self._matchings = dict()
+        self._swaps = dict()
         # Storing commands
         self._stored_commands = list()
         # Logical qubit ids for which the Allocate gate has already been
@@ -227,143 +286,79 @@ class GridMapper(BasicMapperEngine):
             new_mapping_2d[logical_id] = self._map_1d_to_2d[mapped_id]
         return new_mapping_2d
 
-    def _compare_and_swap(self, element0, element1, key):
-        """
-        If swapped (inplace), then return swap operation
-        so that key(element0) < key(element1)
+    def _sort_within_columns(self, positions, key):
         """
-        if key(element0) > key(element1):
-            mapped_id0 = (element0.current_column +
-                          element0.current_row * self.num_columns)
-            mapped_id1 = (element1.current_column +
-                          element1.current_row * self.num_columns)
-            swap_operation = (mapped_id0, mapped_id1)
-            # swap elements but update also current position:
-            tmp_0 = element0.final_row
-            tmp_1 = element0.final_column
-            tmp_2 = element0.row_after_step_1
-            element0.final_row = element1.final_row
-            element0.final_column = element1.final_column
-            element0.row_after_step_1 = element1.row_after_step_1
-            element1.final_row = tmp_0
-            element1.final_column = tmp_1
-            element1.row_after_step_1 = tmp_2
-            return swap_operation
-        else:
-            return None
-
-    def _sort_within_rows(self, final_positions, key):
-        swap_operations = []
-        for row in range(self.num_rows):
-            finished_sorting = False
-            while not finished_sorting:
-                finished_sorting = True
-                for column in range(1, self.num_columns-1, 2):
-                    element0 = final_positions[row][column]
-                    element1 = final_positions[row][column+1]
-                    swap = self._compare_and_swap(element0, element1, key=key)
-                    if swap is not None:
-                        finished_sorting = False
-                        swap_operations.append(swap)
-                for column in range(0, self.num_columns-1, 2):
-                    element0 = final_positions[row][column]
-                    element1 = final_positions[row][column+1]
-                    swap = self._compare_and_swap(element0, element1, key=key)
-                    if swap is not None:
-                        finished_sorting = False
-                        swap_operations.append(swap)
-        return swap_operations
+        Sorts the elements inside each column by their key using an odd-even
+        transposition sort.
 
-    def _sort_within_columns(self, final_positions, key):
-        swap_operations = []
-        for column in range(self.num_columns):
-            finished_sorting = False
-            while not finished_sorting:
-                finished_sorting = True
-                for row in range(1, self.num_rows-1, 2):
-                    element0 = final_positions[row][column]
-                    element1 = final_positions[row+1][column]
-                    swap = self._compare_and_swap(element0, element1, key=key)
-                    if swap is not None:
-                        finished_sorting = False
-                        swap_operations.append(swap)
-                for row in range(0, self.num_rows-1, 2):
-                    element0 = final_positions[row][column]
-                    element1 = final_positions[row+1][column]
-                    swap = self._compare_and_swap(element0, element1, key=key)
-                    if swap is not None:
-                        finished_sorting = False
-                        swap_operations.append(swap)
-        return swap_operations
+        Args:
+            positions (numpy.ndarray): Array of shape (3, num_rows,
+                num_columns) which contains the final row, final column and
+                row after step 1 of the element which is currently at each
+                position. It is updated in place.
+            key (int): Index of the property in positions to sort by.
 
-    def return_swaps(self, old_mapping, new_mapping, permutation=None):
+        Returns:
+            List of swap operations (pairs of mapped ids).
         """
-        Returns the swap operation to change mapping
+        mapped_ids = np.arange(self.num_qubits).reshape(self.num_rows,
+                                                        self.num_columns)
+        return _odd_even_transposition_sort(positions, mapped_ids, key)
+
+    def _sort_within_rows(self, positions, key):
+        """
+        Sorts the elements inside each row by their key using an odd-even
+        transposition sort.
 
         Args:
-            old_mapping: dict: keys are logical ids and values are mapped
-                         qubit ids
-            new_mapping: dict: keys are logical ids and values are mapped
-                         qubit ids
-            permutation: list of int from 0, 1, ..., self.num_rows-1. It is
-                         used to permute the found perfect matchings. Default
-                         is None which keeps the original order.
+            positions (numpy.ndarray): See _sort_within_columns. It is updated
+                in place.
+            key (int): Index of the property in positions to sort by.
+
         Returns:
-            List of tuples. Each tuple is a swap operation which needs to be
-            applied. Tuple contains the two mapped qubit ids for the Swap.
+            List of swap operations (pairs of mapped ids).
         """
-        if permutation is None:
-            permutation = list(range(self.num_rows))
-        swap_operations = []
-
-        class Position(object):
-            """ Custom Container."""
-            def __init__(self, current_row, current_column, final_row,
-                         final_column, row_after_step_1=None):
-                self.current_row = current_row
-                self.current_column = current_column
-                self.final_row = final_row
-                self.final_column = final_column
-                self.row_after_step_1 = row_after_step_1
-
-        # final_positions contains info containers
-        # final_position[i][j] contains info container with
-        # current_row == i and current_column == j
-        final_positions = [[None for i in range(self.num_columns)]
-                           for j in range(self.num_rows)]
-        # move qubits which are in both mappings
-        used_mapped_ids = set()
-        for logical_id in old_mapping:
+        mapped_ids = np.arange(self.num_qubits).reshape(self.num_rows,
+                                                        self.num_columns)
+        return _odd_even_transposition_sort(positions.transpose(0, 2, 1),
+                                            mapped_ids.T, key)
+
+    def _return_destinations(self, old_mapping, new_mapping):
+        """
+        Returns the mapped id to which the element at each mapped id is moved.
+
+        Qubits which are in both mappings move to their new position, the
+        other positions are filled with the remaining mapped ids in increasing
+        order.
+
+        Returns:
+            numpy.ndarray of length self.num_qubits
+        """
+        destinations = np.full(self.num_qubits, -1, dtype=np.int64)
+        for logical_id, mapped_id in old_mapping.items():
             if logical_id in new_mapping:
-                used_mapped_ids.add(new_mapping[logical_id])
-                old_column = old_mapping[logical_id] % self.num_columns
-                old_row = old_mapping[logical_id] // self.num_columns
-                new_column = new_mapping[logical_id] % self.num_columns
-                new_row = new_mapping[logical_id] // self.num_columns
-                info_container = Position(current_row=old_row,
-                                          current_column=old_column,
-                                          final_row=new_row,
-                                          final_column=new_column)
-                final_positions[old_row][old_column] = info_container
-        # exchange all remaining None with the not yet used mapped ids
-        all_ids = set(range(self.num_qubits))
-        not_used_mapped_ids = list(all_ids.difference(used_mapped_ids))
-        not_used_mapped_ids = sorted(not_used_mapped_ids, reverse=True)
-        for row in range(self.num_rows):
-            for column in range(self.num_columns):
-                if final_positions[row][column] is None:
-                    mapped_id = not_used_mapped_ids.pop()
-                    new_column = mapped_id % self.num_columns
-                    new_row = mapped_id // self.num_columns
-                    info_container = Position(current_row=row,
-                                              current_column=column,
-                                              final_row=new_row,
-                                              final_column=new_column)
-                    final_positions[row][column] = info_container
-        assert len(not_used_mapped_ids) == 0
-        # 1. Assign column_after_step_1 for each element
-        # Matching contains the num_columns matchings
-        matchings = [None for i in range(self.num_rows)]
+                destinations[mapped_id] = new_mapping[logical_id]
+        free = destinations == -1
+        not_used_mapped_ids = np.ones(self.num_qubits, dtype=bool)
+        not_used_mapped_ids[destinations[~free]] = False
+        destinations[free] = np.flatnonzero(not_used_mapped_ids)
+        return destinations
+
+    def _return_matchings(self, destinations):
+        """
+        Returns num_rows perfect matchings of the bipartite graph whose edges
+        connect the current column and the final column of each element.
+
+        The matchings only depend on the destinations (and not on the
+        permutation of the matchings) and are therefore cached.
+
+        Returns:
+            numpy.ndarray of shape (num_rows, num_columns): Entry (i, j) is
+            the final column matched to column j in the i-th matching.
+        """
+        fingerprint = destinations.tobytes()
+        if fingerprint in self._matchings:
+            return self._matchings[fingerprint]
         # Build bipartite graph. Nodes are the current columns numbered
         # (0, 1, ...) and the destination columns numbered with an offset of
         # self.num_columns (0 + offset, 1+offset, ...)
@@ -375,58 +370,91 @@ class GridMapper(BasicMapperEngine):
         # Add an edge to the graph from (i, j+offset) for every element
         # currently in column i which should go to column j for the new
         # mapping
-        for row in range(self.num_rows):
-            for column in range(self.num_columns):
-                destination_column = final_positions[row][column].final_column
-                if not graph.has_edge(column, destination_column + offset):
-                    graph.add_edge(column, destination_column + offset)
-                    # Keep manual track of multiple edges between nodes
-                    graph[column][destination_column + offset]['num'] = 1
-                else:
-                    graph[column][destination_column + offset]['num'] += 1
+        final_columns = (destinations % self.num_columns).tolist()
+        for mapped_id in range(self.num_qubits):
+            column = mapped_id % self.num_columns
+            destination_column = final_columns[mapped_id]
+            if not graph.has_edge(column, destination_column + offset):
+                graph.add_edge(column, destination_column + offset)
+                # Keep manual track of multiple edges between nodes
+                graph[column][destination_column + offset]['num'] = 1
+            else:
+                graph[column][destination_column + offset]['num'] += 1
         # Find perfect matching, remove those edges from the graph
         # and do it again:
+        matchings = np.empty((self.num_rows, self.num_columns),
+                             dtype=np.int64)
         for i in range(self.num_rows):
             top_nodes = range(self.num_columns)
             matching = nx.bipartite.maximum_matching(graph, top_nodes)
-            matchings[i] = matching
             # Remove all edges of the current perfect matching
             for node in range(self.num_columns):
+                matchings[i, node] = matching[node] - offset
                 if graph[node][matching[node]]['num'] == 1:
                     graph.remove_edge(node, matching[node])
                 else:
                     graph[node][matching[node]]['num'] -= 1
-        # permute the matchings:
-        tmp = deepcopy(matchings)
-        for i in range(self.num_rows):
-            matchings[i] = tmp[permutation[i]]
-        # Assign row_after_step_1
-        for column in range(self.num_columns):
-            for row_after_step_1 in range(self.num_rows):
-                dest_column = matchings[row_after_step_1][column] - offset
-                best_element = None
-                for row in range(self.num_rows):
-                    element = final_positions[row][column]
-                    if element.row_after_step_1 is not None:
-                        continue
-                    elif element.final_column == dest_column:
-                        if best_element is None:
-                            best_element = element
-                        elif best_element.final_row > element.final_row:
-                            best_element = element
-                best_element.row_after_step_1 = row_after_step_1
+        if len(self._matchings) >= SWAPS_CACHE_SIZE:
+            self._matchings.clear()
+        self._matchings[fingerprint] = matchings
+        return matchings
+
+    def return_swaps(self, old_mapping, new_mapping, permutation=None):
+        """
+        Returns the swap operation to change mapping
+
+        Args:
+            old_mapping: dict: keys are logical ids and values are mapped
+                         qubit ids
+            new_mapping: dict: keys are logical ids and values are mapped
+                         qubit ids
+            permutation: list of int from 0, 1, ..., self.num_rows-1. It is
+                         used to permute the found perfect matchings. Default
+                         is None which keeps the original order.
+        Returns:
+            List of tuples. Each tuple is a swap operation which needs to be
+            applied. Tuple contains the two mapped qubit ids for the Swap.
+        """
+        if permutation is None:
+            permutation = list(range(self.num_rows))
+        num_rows = self.num_rows
+        num_columns = self.num_columns
+        destinations = self._return_destinations(old_mapping, new_mapping)
+        # positions[:, i, j] contains the final row, final column and row
+        # after step 1 of the element which is currently in row i and
+        # column j
+        positions = np.empty((3, num_rows, num_columns), dtype=np.int64)
+        positions[_FINAL_ROW] = (destinations // num_columns).reshape(
+            num_rows, num_columns)
+        positions[_FINAL_COLUMN] = (destinations % num_columns).reshape(
+            num_rows, num_columns)
+        # 1. Assign row_after_step_1 for each element: the i-th matching
+        # moves an element of each column to row i
+        matchings = self._return_matchings(destinations)[list(permutation)]
+        # If a column is matched several times to the same final column, the
+        # elements are taken in the order of their final rows. Order the
+        # elements inside each column by (final column, final row):
+        order = np.argsort(positions[_FINAL_COLUMN] * num_rows +
+                           positions[_FINAL_ROW], axis=0)
+        columns = np.arange(num_columns)
+        counts = np.zeros((num_columns, num_columns), dtype=np.int64)
+        np.add.at(counts, (np.tile(columns, num_rows),
+                           positions[_FINAL_COLUMN].ravel()), 1)
+        starts = np.cumsum(counts, axis=1) - counts
+        # Number of earlier matchings of the same columns:
+        earlier = np.tril(np.ones((num_rows, num_rows), dtype=bool), -1)
+        occurrences = ((matchings[:, None, :] == matchings[None, :, :]) &
+                       earlier[:, :, None]).sum(axis=1)
+        rows = order[starts[columns, matchings] + occurrences, columns]
+        positions[_ROW_AFTER_STEP_1, rows, columns] = np.arange(
+            num_rows)[:, None]
         # 2. Sort inside all the rows
-        swaps = self._sort_within_columns(final_positions=final_positions,
-                                          key=lambda x: x.row_after_step_1)
-        swap_operations += swaps
+        swap_operations = self._sort_within_columns(positions,
+                                                    _ROW_AFTER_STEP_1)
         # 3. Sort inside all the columns
-        swaps = self._sort_within_rows(final_positions=final_positions,
-                                       key=lambda x: x.final_column)
-        swap_operations += swaps
+        swap_operations += self._sort_within_rows(positions, _FINAL_COLUMN)
         # 4. Sort inside all the rows
-        swaps = self._sort_within_columns(final_positions=final_positions,
-                                          key=lambda x: x.final_row)
-        swap_operations += swaps
+        swap_operations += self._sort_within_columns(positions, _FINAL_ROW)
         return swap_operations
 
     def _send_possible_commands(self):
@@ -514,29 +542,15 @@ class GridMapper(BasicMapperEngine):
                     new_stored_commands.append(cmd)
         self._stored_commands = new_stored_commands
 
-    def _run(self):
+    def _return_best_swaps(self, new_row_major_mapping):
         """
-        Creates a new mapping and executes possible gates.
-
-        It first allocates all 0, ..., self.num_qubits-1 mapped qubit ids, if
-        they are not already used because we might need them all for the
-        swaps. Then it creates a new map, swaps all the qubits to the new map,
-        executes all possible gates, and finally deallocates mapped qubit ids
-        which don't store any information.
+        Returns the swaps to arrive at the new mapping for the permutation of
+        the matchings which minimizes self.optimization_function.
         """
-        num_of_stored_commands_before = len(self._stored_commands)
-        if not self.current_mapping:
-            self.current_mapping = dict()
-        else:
-            self._send_possible_commands()
-            if len(self._stored_commands) == 0:
-                return
-        new_row_major_mapping = self._return_new_mapping()
-        # Find permutation of matchings with lowest cost
         swaps = None
         lowest_cost = None
         matchings_numbers = list(range(self.num_rows))
-        if self.num_optimization_steps <= math.factorial(self.num_rows):
+        if math.factorial(self.num_rows) <= self.num_optimization_steps:
             permutations = itertools.permutations(matchings_numbers,
                                                   self.num_rows)
         else:
@@ -555,6 +569,36 @@ class GridMapper(BasicMapperEngine):
             elif lowest_cost > self.optimization_function(trial_swaps):
                 swaps = trial_swaps
                 lowest_cost = self.optimization_function(trial_swaps)
+        return swaps
+
+    def _run(self):
+        """
+        Creates a new mapping and executes possible gates.
+
+        It first allocates all 0, ..., self.num_qubits-1 mapped qubit ids, if
+        they are not already used because we might need them all for the
+        swaps. Then it creates a new map, swaps all the qubits to the new map,
+        executes all possible gates, and finally deallocates mapped qubit ids
+        which don't store any information.
+        """
+        num_of_stored_commands_before = len(self._stored_commands)
+        if not self.current_mapping:
+            self.current_mapping = dict()
+        else:
+            self._send_possible_commands()
+            if len(self._stored_commands) == 0:
+                return
+        new_row_major_mapping = self._return_new_mapping()
+        fingerprint = self._return_destinations(
+            self._current_row_major_mapping,
+            new_row_major_mapping).tobytes()
+        if fingerprint in self._swaps:
+            swaps = self._swaps[fingerprint]
+        else:
+            swaps = self._return_best_swaps(new_row_major_mapping)
+            if len(self._swaps) >= SWAPS_CACHE_SIZE:
+                self._swaps.clear()
+            self._swaps[fingerprint] = swaps
         if swaps:  # first mapping requires no swaps
             # Allocate all mapped qubit ids (which are not already allocated,
             # i.e., contained in self._currently_allocated_ids)
@@ -18,6 +18,7 @@ from copy import deepcopy
 import itertools
 import random
 
+import numpy as np
 import pytest
 
 import projectq
@@ -158,6 +159,72 @@ def test_return_swaps_random(num_rows, num_columns, seed, none_old, none_new):
             assert test_chain[i] == new_chain[i]
 
 
+def test_odd_even_transposition_sort():
+    positions = np.array([[[3, 0], [1, 2], [0, 1], [2, 3]]])
+    mapped_ids = np.arange(8).reshape(4, 2)
+    swaps = two_d._odd_even_transposition_sort(positions, mapped_ids, 0)
+    assert positions[0].T.tolist() == [[0, 1, 2, 3], [0, 1, 2, 3]]
+    # swaps are ordered by line
+    assert swaps == [(2, 4), (0, 2), (2, 4), (4, 6), (3, 5)]
+    assert two_d._odd_even_transposition_sort(positions, mapped_ids, 0) == []
+
+
+def test_return_swaps_cached(monkeypatch):
+    mapper = two_d.GridMapper(num_rows=3, num_columns=3)
+    old_mapping = {0: 0, 1: 1, 2: 4, 3: 8}
+    new_mapping = {0: 8, 1: 0, 2: 4, 3: 5}
+    swaps = mapper.return_swaps(old_mapping, new_mapping)
+
+    def maximum_matching(*args, **kwargs):
+        raise AssertionError("matchings are not cached")
+
+    monkeypatch.setattr(two_d.nx.bipartite, "maximum_matching",
+                        maximum_matching)
+    # same destinations for different logical ids
+    shifted_old_mapping = {key + 10: value
+                           for key, value in old_mapping.items()}
+    shifted_new_mapping = {key + 10: value
+                           for key, value in new_mapping.items()}
+    assert (mapper.return_swaps(shifted_old_mapping, shifted_new_mapping) ==
+            swaps)
+    assert (mapper.return_swaps(old_mapping, new_mapping, [2, 1, 0]) !=
+            swaps)
+    assert len(mapper._matchings) == 1
+    monkeypatch.setattr(two_d, "SWAPS_CACHE_SIZE", 1)
+    with pytest.raises(AssertionError):
+        mapper.return_swaps(old_mapping, {0: 0})
+
+
+@pytest.mark.parametrize("num_rows, num_calls", [(3, 6), (5, 10)])
+def test_run_number_of_permutations(num_rows, num_calls):
+    mapper = two_d.GridMapper(num_rows=num_rows, num_columns=2,
+                              num_optimization_steps=10)
+    backend = DummyEngine(save_commands=True)
+    backend.is_last_engine = True
+    mapper.next_engine = backend
+    calls = []
+
+    def return_swaps(old_mapping, new_mapping, permutation=None):
+        calls.append(permutation)
+        return two_d.GridMapper.return_swaps(mapper, old_mapping,
+                                             new_mapping, permutation)
+
+    mapper.return_swaps = return_swaps
+    qubits = [WeakQubitRef(engine=None, idx=i) for i in range(4)]
+    cmds = [Command(None, Allocate, qubits=([qb],)) for qb in qubits]
+    cmds += [Command(None, X, qubits=([qubits[0]],), controls=[qubits[1]]),
+             Command(None, X, qubits=([qubits[0]],), controls=[qubits[2]]),
+             Command(None, X, qubits=([qubits[0]],), controls=[qubits[3]]),
+             Command(None, X, qubits=([qubits[1]],), controls=[qubits[2]])]
+    qb_flush = WeakQubitRef(engine=None, idx=-1)
+    mapper.receive(cmds + [Command(None, FlushGate(),
+                                   qubits=([qb_flush],))])
+    assert mapper._stored_commands == []
+    # the permutations are tried for every new mapping
+    assert len(mapper._swaps) > 1
+    assert len(calls) == num_calls * len(mapper._swaps)
+
+
 @pytest.mark.parametrize("different_backend_ids", [False, True])
 def test_send_possible_commands(different_backend_ids):
     if different_backend_ids:
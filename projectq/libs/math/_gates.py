@@ -46,6 +46,13 @@ class AddConstant(BasicMathGate):
         """
         return SubConstant(self.a)
 
+    def get_math_operations(self, qubits):
+        """
+        Return the native description of this gate (see
+        BasicMathGate.get_math_operations).
+        """
+        return [('add_constant', 0, self.a)]
+
     def __str__(self):
         return "AddConstant({})".format(self.a)
 
@@ -114,6 +121,13 @@ class AddConstantModN(BasicMathGate):
         self.a = a
         self.N = N
 
+    def get_math_operations(self, qubits):
+        """
+        Return the native description of this gate (see
+        BasicMathGate.get_math_operations).
+        """
+        return [('add_constant_mod', 0, self.a, self.N)]
+
     def __str__(self):
         return "AddConstantModN({}, {})".format(self.a, self.N)
 
@@ -204,6 +218,13 @@ class MultiplyByConstantModN(BasicMathGate):
         self.a = a
         self.N = N
 
+    def get_math_operations(self, qubits):
+        """
+        Return the native description of this gate (see
+        BasicMathGate.get_math_operations).
+        """
+        return [('multiply_constant_mod', 0, self.a, self.N)]
+
     def __str__(self):
         return "MultiplyByConstantModN({}, {})".format(self.a, self.N)
 
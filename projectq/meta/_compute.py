@@ -44,6 +44,7 @@ class ComputeTag(object):
     """
     Compute meta tag.
     """
+    __slots__ = ()
 
     def __eq__(self, other):
         return isinstance(other, ComputeTag)
@@ -56,6 +57,7 @@ class UncomputeTag(object):
     """
     Uncompute meta tag.
     """
+    __slots__ = ()
 
     def __eq__(self, other):
         return isinstance(other, UncomputeTag)
@@ -151,7 +153,7 @@ class ComputeEngine(BasicEngine):
                 # Create new local qubit which lives within uncompute section
 
                 # Allocate needs to have old tags + uncompute tag
-                def add_uncompute(command, old_tags=deepcopy(cmd.tags)):
+                def add_uncompute(command, old_tags=list(cmd.tags)):
                     command.tags = old_tags + [UncomputeTag()]
                     return command
                 tagger_eng = projectq.cengines.CommandModifier(add_uncompute)
@@ -226,7 +228,7 @@ class ComputeEngine(BasicEngine):
 
     def receive(self, command_list):
         """
-        If in compute-mode: Receive commands and store deepcopy of each cmd.
+        If in compute-mode: Receive commands and store a copy of each cmd.
                             Add ComputeTag to received cmd and send it on.
         Otherwise: send all received commands directly to next_engine.
 
@@ -239,7 +241,7 @@ class ComputeEngine(BasicEngine):
                     self._allocated_qubit_ids.add(cmd.qubits[0][0].id)
                 elif cmd.gate == Deallocate:
                     self._deallocated_qubit_ids.add(cmd.qubits[0][0].id)
-                self._l.append(deepcopy(cmd))
+                self._l.append(cmd.copy())
                 tags = cmd.tags
                 tags.append(ComputeTag())
             self.send(command_list)
@@ -274,7 +276,7 @@ class UncomputeEngine(BasicEngine):
                 self._deallocated_qubit_ids.add(cmd.qubits[0][0].id)
             tags = cmd.tags
             tags.append(UncomputeTag())
-            self.send([cmd])
+        self.send(command_list)
 
 
 class Compute(object):
@@ -62,11 +62,11 @@ class ControlEngine(BasicEngine):
         if (not self._has_compute_uncompute_tag(cmd) and not
                 isinstance(cmd.gate, ClassicalInstructionGate)):
             cmd.add_control_qubits(self._qubits)
-        self.send([cmd])
 
     def receive(self, command_list):
         for cmd in command_list:
             self._handle_command(cmd)
+        self.send(command_list)
 
 
 class Control(object):
@@ -24,6 +24,8 @@ class LogicalQubitIDTag(object):
     Attributes:
         logical_qubit_id (int): Logical qubit id
     """
+    __slots__ = ('logical_qubit_id', )
+
     def __init__(self, logical_qubit_id):
         self.logical_qubit_id = logical_qubit_id
 
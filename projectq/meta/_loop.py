@@ -23,8 +23,6 @@ Example:
         Rz(M_PI/3.) | qb
 """
 
-from copy import deepcopy
-
 from projectq.cengines import BasicEngine
 from projectq.ops import Allocate, Deallocate
 from ._util import insert_engine, drop_engine_after
@@ -38,6 +36,8 @@ class LoopTag(object):
     """
     Loop meta tag
     """
+    __slots__ = ('num', 'id')
+
     def __init__(self, num):
         self.num = num
         self.id = LoopTag.loop_tag_id
@@ -106,21 +106,21 @@ class LoopEngine(BasicEngine):
             if len(self._allocated_qubit_ids) == 0:
                 # No local qubits, just send the circuit num times
                 for i in range(self._tag.num):
-                    self.send(deepcopy(self._cmd_list))
+                    self.send([cmd.copy() for cmd in self._cmd_list])
             else:
                 # Ancilla qubits have been allocated in loop body
                 # For each iteration, allocate and deallocate a new qubit and
                 # replace the qubit id in all commands using it.
                 for i in range(self._tag.num):
                     if i == 0:  # Don't change local qubit ids
-                        self.send(deepcopy(self._cmd_list))
+                        self.send([cmd.copy() for cmd in self._cmd_list])
                     else:
                         # Change local qubit ids before sending them
                         for refs_loc_qubit in self._refs_to_local_qb.values():
                             new_qb_id = self.main_engine.get_new_qubit_id()
                             for qubit_ref in refs_loc_qubit:
                                 qubit_ref.id = new_qb_id
-                        self.send(deepcopy(self._cmd_list))
+                        self.send([cmd.copy() for cmd in self._cmd_list])
         else:
             # Next engines support loop tag so no unrolling needed only
             # check that all qubits have been deallocated which have been
@@ -158,7 +158,7 @@ class LoopEngine(BasicEngine):
                 elif cmd.gate == Deallocate:
                     self._deallocated_qubit_ids.add(cmd.qubits[0][0].id)
                 cmd.tags.append(self._tag)
-                self.send([cmd])
+            self.send(command_list)
         else:
             # LoopTag is not supported, save the full loop body
             self._cmd_list += command_list
@@ -284,13 +284,17 @@ class MatrixGate(BasicGate):
         """
         if not hasattr(other, 'matrix'):
             return False
-        if (not isinstance(self.matrix, np.matrix)
-                or not isinstance(other.matrix, np.matrix)):
+        matrix, other_matrix = self.matrix, other.matrix
+        if (not isinstance(matrix, np.matrix)
+                or not isinstance(other_matrix, np.matrix)):
             raise TypeError("One of the gates doesn't have the correct "
                             "type (numpy.matrix) for the matrix "
                             "attribute.")
-        if (self.matrix.shape == other.matrix.shape and np.allclose(
-                self.matrix, other.matrix, rtol=RTOL, atol=ATOL,
+        # gate matrices are cached, i.e., often the very same object
+        if matrix is other_matrix:
+            return True
+        if (matrix.shape == other_matrix.shape and np.allclose(
+                matrix, other_matrix, rtol=RTOL, atol=ATOL,
                 equal_nan=False)):
             return True
         return False
@@ -589,7 +593,7 @@ class BasicMathGate(BasicGate):
         def multiply(a,b,c)
             return (a,b,c+a*b)
     """
-    def __init__(self, math_fun):
+    def __init__(self, math_fun, vectorized=False):
         """
         Initialize a BasicMathGate by providing the mathematical function that
         it implements.
@@ -599,6 +603,11 @@ class BasicMathGate(BasicGate):
                 input, as the gate takes registers. For each of these values,
                 it then returns the output (i.e., it returns a list/tuple of
                 output values).
+            vectorized (bool): If True, math_fun also accepts numpy arrays of
+                int64 values (one array per register) and returns the outputs
+                as arrays, such that simulators can evaluate it for many basis
+                states in a single call (see
+                BasicMathGate.get_vectorized_math_function).
 
         Example:
             .. code-block:: python
@@ -634,6 +643,7 @@ class BasicMathGate(BasicGate):
             return list(math_fun(*x))
 
         self._math_function = math_function
+        self._vectorized = vectorized
 
     def __str__(self):
         return "MATH"
@@ -652,3 +662,66 @@ class BasicMathGate(BasicGate):
             gate. (See BasicMathGate.__init__ for an example).
         """
         return self._math_function
+
+    def get_vectorized_math_function(self, qubits):
+        """
+        Return a vectorized version of the math function of this gate, or
+        None if there is none.
+
+        The vectorized function takes a list of numpy arrays of int64 values
+        (one array per register, each entry corresponding to one basis state)
+        and returns the list of output arrays. By default, the math function
+        is returned if the gate was constructed with vectorized=True.
+
+        Args:
+            qubits (tuple<Qureg>): Qubits to which the math gate is being
+                applied.
+
+        Returns:
+            math_fun (function): Vectorized function describing the action of
+            this gate, or None.
+        """
+        if self._vectorized:
+            return self._math_function
+        return None
+
+    def get_math_operations(self, qubits):
+        """
+        Return a declarative description of the action of this gate, or None
+        if there is none (default).
+
+        The description is a list of operations which are applied in order to
+        the register values x[0], x[1], ... (of arbitrary precision, the
+        results are truncated to the register sizes at the end). Simulators
+        can evaluate such descriptions natively, without calling back into
+        Python for each basis state. Available operations are
+
+        * ('add', t, a): x[t] += x[a]
+        * ('sub', t, a): x[t] -= x[a]
+        * ('add_mod', t, a, N): x[t] = (x[t] + x[a]) % N
+        * ('multiply_add', t, a, b): x[t] += x[a] * x[b]
+        * ('less_than', t, a, b): x[t] ^= (x[a] < x[b])
+        * ('add_constant', t, c): x[t] += c
+        * ('add_constant_mod', t, c, N): x[t] = (x[t] + c) % N
+        * ('multiply_constant_mod', t, c, N): x[t] = (x[t] * c) % N
+
+        where t, a, and b are register indices and the modulo is
+        non-negative (as in Python).
+
+        Example:
+            The out-of-place multiplication (a,b,c) -> (a,b,c+a*b) from above
+            is described by
+
+            .. code-block:: python
+
+                def get_math_operations(self, qubits):
+                    return [('multiply_add', 2, 0, 1)]
+
+        Args:
+            qubits (tuple<Qureg>): Qubits to which the math gate is being
+                applied.
+
+        Returns:
+            operations (list<tuple>): Description of this gate, or None.
+        """
+        return None
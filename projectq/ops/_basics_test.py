@@ -304,6 +304,15 @@ def test_basic_math_gate():
     # Test a=2, b=3, and c=5 should give a=2, b=3, c=11
     math_fun = gate.get_math_function(("qreg1", "qreg2", "qreg3"))
     assert math_fun([2, 3, 5]) == [2, 3, 11]
+    assert gate.get_vectorized_math_function(("qreg1", "qreg2")) is None
+    assert gate.get_math_operations(("qreg1", "qreg2", "qreg3")) is None
+
+
+def test_basic_math_gate_vectorized():
+    gate = _basics.BasicMathGate(lambda a, b: (a, a + b), vectorized=True)
+    math_fun = gate.get_vectorized_math_function(("qreg1", "qreg2"))
+    assert math_fun is gate.get_math_function(("qreg1", "qreg2"))
+    assert math_fun([2, 3]) == [2, 5]
 
 
 def test_matrix_gate():
@@ -82,6 +82,8 @@ class Command(object):
           and hence adds its LoopTag to the end.
         all_qubits: A tuple of control_qubits + qubits
     """
+    __slots__ = ('gate', 'tags', '_qubits', '_control_qubits', '_engine')
+
     def __init__(self, engine, gate, qubits, controls=(), tags=()):
         """
         Initialize a Command object.
@@ -129,6 +131,32 @@ class Command(object):
         return Command(self.engine, deepcopy(self.gate), self.qubits,
                        list(self.control_qubits), deepcopy(self.tags))
 
+    def copy(self):
+        """
+        Get a cheap copy of this command.
+
+        The copy owns new WeakQubitRef objects and a new tags list, such that
+        qubit ids, engines and tags can be modified without affecting this
+        command. The gate and the tag objects themselves are shared, as they
+        are treated as immutable throughout the compiler. Since the qubits
+        are already in canonical order, they are not sorted again.
+
+        Returns:
+            A new Command object equal to this one.
+        """
+        cmd = self.__class__.__new__(self.__class__)
+        cmd.gate = self.gate
+        cmd.tags = list(self.tags)
+        cmd._qubits = tuple(
+            [WeakQubitRef(qubit.engine, qubit.id) for qubit in qureg]
+            for qureg in self._qubits)
+        cmd._control_qubits = [
+            WeakQubitRef(qubit.engine, qubit.id)
+            for qubit in self._control_qubits
+        ]
+        cmd._engine = self._engine
+        return cmd
+
     def get_inverse(self):
         """
         Get the command object corresponding to the inverse of this command.
@@ -221,10 +249,9 @@ class Command(object):
         Args:
             control_qubits (Qureg): quantum register
         """
-        self._control_qubits = ([
-            WeakQubitRef(qubit.engine, qubit.id) for qubit in qubits
-        ])
-        self._control_qubits = sorted(self._control_qubits, key=lambda x: x.id)
+        self._control_qubits = sorted(
+            [WeakQubitRef(qubit.engine, qubit.id) for qubit in qubits],
+            key=lambda x: x.id)
 
     def add_control_qubits(self, qubits):
         """
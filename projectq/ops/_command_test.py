@@ -90,6 +90,38 @@ def test_command_deepcopy(main_engine):
     assert copied_cmd.gate == gate
 
 
+def test_command_copy(main_engine):
+    qureg0 = Qureg([Qubit(main_engine, 0)])
+    qureg1 = Qureg([Qubit(main_engine, 1)])
+    gate = BasicGate()
+    cmd = _command.Command(main_engine, gate, (qureg0,))
+    cmd.add_control_qubits(qureg1)
+    cmd.tags.append("MyTestTag")
+    copied_cmd = cmd.copy()
+    assert copied_cmd == cmd
+    assert copied_cmd.gate is gate
+    assert copied_cmd.engine is main_engine
+    # Tags list and qubit references are not shared
+    copied_cmd.tags.append("OtherTag")
+    assert cmd.tags == ["MyTestTag"]
+    copied_cmd.qubits[0][0].id = 10
+    copied_cmd.control_qubits[0].id = 11
+    assert cmd.qubits[0][0].id == 0
+    assert cmd.control_qubits[0].id == 1
+    copied_cmd.engine = "NewEngine"
+    assert cmd.engine is main_engine
+    assert cmd.qubits[0][0].engine is main_engine
+
+
+def test_command_slots(main_engine):
+    qubit = Qubit(main_engine, 0)
+    cmd = _command.Command(main_engine, BasicGate(), ([qubit], ))
+    assert not hasattr(cmd, '__dict__')
+    assert not hasattr(cmd.qubits[0][0], '__dict__')
+    with pytest.raises(AttributeError):
+        cmd.some_attribute = 1
+
+
 def test_command_get_inverse(main_engine):
     qubit = main_engine.allocate_qubit()
     ctrl_qubit = main_engine.allocate_qubit()
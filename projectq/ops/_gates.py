@@ -43,6 +43,7 @@ and meta gates, i.e.,
 
 import math
 import cmath
+import functools
 import warnings
 
 import numpy as np
@@ -59,14 +60,59 @@ from ._basics import (BasicGate,
 from ._command import apply_command
 
 
+#: Maximal number of matrices cached per parametric gate class (the cache is
+#: cleared once full)
+MATRIX_CACHE_SIZE = 1024
+
+
+def _read_only_matrix(matrix):
+    """
+    Return matrix as a read-only, C-contiguous complex numpy.matrix.
+
+    Gate matrices are shared by all instances of a gate (class) and, thus,
+    must not be modified in-place.
+    """
+    matrix = np.matrix(matrix, dtype=complex)
+    matrix.setflags(write=False)
+    return matrix
+
+
+def _memoize_matrix(matrix_function):
+    """
+    Memoize the matrix of a parametric gate per angle.
+
+    Args:
+        matrix_function (function): Function computing the matrix of a
+            BasicRotationGate or BasicPhaseGate from its angle.
+
+    Returns:
+        Function returning the (read-only) cached matrix for self.angle.
+    """
+    cache = dict()
+
+    @functools.wraps(matrix_function)
+    def matrix(self):
+        try:
+            return cache[self.angle]
+        except KeyError:
+            if len(cache) >= MATRIX_CACHE_SIZE:
+                cache.clear()
+            result = _read_only_matrix(matrix_function(self))
+            cache[self.angle] = result
+            return result
+    return matrix
+
+
 class HGate(SelfInverseGate):
     """ Hadamard gate class """
     def __str__(self):
         return "H"
 
+    _matrix = _read_only_matrix([[1, 1], [1, -1]] / np.sqrt(2.))
+
     @property
     def matrix(self):
-        return 1. / cmath.sqrt(2.) * np.matrix([[1, 1], [1, -1]])
+        return self._matrix
 
 #: Shortcut (instance of) :class:`projectq.ops.HGate`
 H = HGate()
@@ -77,9 +123,11 @@ class XGate(SelfInverseGate):
     def __str__(self):
         return "X"
 
+    _matrix = _read_only_matrix([[0, 1], [1, 0]])
+
     @property
     def matrix(self):
-        return np.matrix([[0, 1], [1, 0]])
+        return self._matrix
 
 #: Shortcut (instance of) :class:`projectq.ops.XGate`
 X = NOT = XGate()
@@ -90,9 +138,11 @@ class YGate(SelfInverseGate):
     def __str__(self):
         return "Y"
 
+    _matrix = _read_only_matrix([[0, -1j], [1j, 0]])
+
     @property
     def matrix(self):
-        return np.matrix([[0, -1j], [1j, 0]])
+        return self._matrix
 
 #: Shortcut (instance of) :class:`projectq.ops.YGate`
 Y = YGate()
@@ -103,9 +153,11 @@ class ZGate(SelfInverseGate):
     def __str__(self):
         return "Z"
 
+    _matrix = _read_only_matrix([[1, 0], [0, -1]])
+
     @property
     def matrix(self):
-        return np.matrix([[1, 0], [0, -1]])
+        return self._matrix
 
 #: Shortcut (instance of) :class:`projectq.ops.ZGate`
 Z = ZGate()
@@ -113,9 +165,11 @@ Z = ZGate()
 
 class SGate(BasicGate):
     """ S gate class """
+    _matrix = _read_only_matrix([[1, 0], [0, 1j]])
+
     @property
     def matrix(self):
-        return np.matrix([[1, 0], [0, 1j]])
+        return self._matrix
 
     def __str__(self):
         return "S"
@@ -128,9 +182,11 @@ Sdag = Sdagger = get_inverse(S)
 
 class TGate(BasicGate):
     """ T gate class """
+    _matrix = _read_only_matrix([[1, 0], [0, cmath.exp(1j * cmath.pi / 4)]])
+
     @property
     def matrix(self):
-        return np.matrix([[1, 0], [0, cmath.exp(1j * cmath.pi / 4)]])
+        return self._matrix
 
     def __str__(self):
         return "T"
@@ -143,9 +199,11 @@ Tdag = Tdagger = get_inverse(T)
 
 class SqrtXGate(BasicGate):
     """ Square-root X gate class """
+    _matrix = _read_only_matrix([[0.5+0.5j, 0.5-0.5j], [0.5-0.5j, 0.5+0.5j]])
+
     @property
     def matrix(self):
-        return 0.5 * np.matrix([[1+1j, 1-1j], [1-1j, 1+1j]])
+        return self._matrix
 
     def tex_str(self):
         return r'$\sqrt{X}$'
@@ -166,12 +224,14 @@ class SwapGate(SelfInverseGate):
     def __str__(self):
         return "Swap"
 
+    _matrix = _read_only_matrix([[1, 0, 0, 0],
+                                 [0, 0, 1, 0],
+                                 [0, 1, 0, 0],
+                                 [0, 0, 0, 1]])
+
     @property
     def matrix(self):
-        return np.matrix([[1, 0, 0, 0],
-                          [0, 0, 1, 0],
-                          [0, 1, 0, 0],
-                          [0, 0, 0, 1]])
+        return self._matrix
 
 #: Shortcut (instance of) :class:`projectq.ops.SwapGate`
 Swap = SwapGate()
@@ -186,12 +246,14 @@ class SqrtSwapGate(BasicGate):
     def __str__(self):
         return "SqrtSwap"
 
+    _matrix = _read_only_matrix([[1, 0, 0, 0],
+                                 [0, 0.5+0.5j, 0.5-0.5j, 0],
+                                 [0, 0.5-0.5j, 0.5+0.5j, 0],
+                                 [0, 0, 0, 1]])
+
     @property
     def matrix(self):
-        return np.matrix([[1, 0, 0, 0],
-                          [0, 0.5+0.5j, 0.5-0.5j, 0],
-                          [0, 0.5-0.5j, 0.5+0.5j, 0],
-                          [0, 0, 0, 1]])
+        return self._matrix
 
 #: Shortcut (instance of) :class:`projectq.ops.SqrtSwapGate`
 SqrtSwap = SqrtSwapGate()
@@ -212,6 +274,7 @@ Entangle = EntangleGate()
 class Ph(BasicPhaseGate):
     """ Phase gate (global phase) """
     @property
+    @_memoize_matrix
     def matrix(self):
         return np.matrix([[cmath.exp(1j * self.angle), 0],
                           [0, cmath.exp(1j * self.angle)]])
@@ -220,6 +283,7 @@ class Ph(BasicPhaseGate):
 class Rx(BasicRotationGate):
     """ RotationX gate class """
     @property
+    @_memoize_matrix
     def matrix(self):
         return np.matrix([[math.cos(0.5 * self.angle),
                            -1j * math.sin(0.5 * self.angle)],
@@ -230,6 +294,7 @@ class Rx(BasicRotationGate):
 class Ry(BasicRotationGate):
     """ RotationY gate class """
     @property
+    @_memoize_matrix
     def matrix(self):
         return np.matrix([[math.cos(0.5 * self.angle),
                            -math.sin(0.5 * self.angle)],
@@ -240,6 +305,7 @@ class Ry(BasicRotationGate):
 class Rz(BasicRotationGate):
     """ RotationZ gate class """
     @property
+    @_memoize_matrix
     def matrix(self):
         return np.matrix([[cmath.exp(-.5 * 1j * self.angle), 0],
                           [0, cmath.exp(.5 * 1j * self.angle)]])
@@ -248,6 +314,7 @@ class Rz(BasicRotationGate):
 class Rxx(BasicRotationGate):
     """ RotationXX gate class """
     @property
+    @_memoize_matrix
     def matrix(self):
         return np.matrix([[cmath.cos(.5 * self.angle), 0, 0, -1j*cmath.sin(.5 * self.angle)],
                           [0, cmath.cos( .5 * self.angle), -1j*cmath.sin(.5 * self.angle), 0],
@@ -258,6 +325,7 @@ class Rxx(BasicRotationGate):
 class Ryy(BasicRotationGate):
     """ RotationYY gate class """
     @property
+    @_memoize_matrix
     def matrix(self):
         return np.matrix([[cmath.cos(.5 * self.angle), 0, 0, 1j*cmath.sin(.5 * self.angle)],
                           [0, cmath.cos( .5 * self.angle), -1j*cmath.sin(.5 * self.angle), 0],
@@ -268,6 +336,7 @@ class Ryy(BasicRotationGate):
 class Rzz(BasicRotationGate):
     """ RotationZZ gate class """
     @property
+    @_memoize_matrix
     def matrix(self):
         return np.matrix([[cmath.exp(-.5 * 1j * self.angle), 0, 0, 0],
                           [0, cmath.exp( .5 * 1j * self.angle), 0, 0],
@@ -278,6 +347,7 @@ class Rzz(BasicRotationGate):
 class R(BasicPhaseGate):
     """ Phase-shift gate (equivalent to Rz up to a global phase) """
     @property
+    @_memoize_matrix
     def matrix(self):
         return np.matrix([[1, 0], [0, cmath.exp(1j * self.angle)]])
 
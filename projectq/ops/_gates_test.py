@@ -122,6 +122,31 @@ def test_engangle_gate():
     assert isinstance(_gates.Entangle, _gates.EntangleGate)
 
 
+def test_constant_gate_matrices_are_cached():
+    for gate in [_gates.H, _gates.X, _gates.Y, _gates.Z, _gates.S, _gates.T,
+                 _gates.SqrtX, _gates.Swap, _gates.SqrtSwap]:
+        matrix = gate.matrix
+        assert matrix is gate.__class__().matrix
+        assert matrix.dtype == complex
+        assert matrix.flags['C_CONTIGUOUS']
+        with pytest.raises(ValueError):
+            matrix[0, 0] = 2
+
+
+def test_rotation_gate_matrices_are_cached(monkeypatch):
+    monkeypatch.setattr(_gates, "MATRIX_CACHE_SIZE", 2)
+    matrix = _gates.Rz(0.5).matrix
+    assert matrix is _gates.Rz(0.5).matrix
+    assert matrix is _gates.Rz(0.5 + 4 * math.pi).matrix
+    assert not matrix.flags['WRITEABLE']
+    assert not np.allclose(_gates.Rz(0.7).matrix, matrix)
+    # cache is cleared once full
+    assert np.allclose(_gates.Rz(0.9).matrix,
+                       np.diag([cmath.exp(-.45j), cmath.exp(.45j)]))
+    assert _gates.Rz(0.5).matrix is not matrix
+    assert np.allclose(_gates.Rz(0.5).matrix, matrix)
+
+
 @pytest.mark.parametrize("angle", [0, 0.2, 2.1, 4.1, 2 * math.pi,
                                    4 * math.pi])
 def test_rx(angle):